@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - SQLite read profile benchmark
+Times every analytics endpoint under SQLITE_PROFILE=default and SQLITE_PROFILE=read
+
+Each profile runs in its own process (settings are read at import) against
+the same database through the Flask test client, with response caches off.
+
+    python benchmarks/sqlite_profile_benchmark.py --iterations 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    '/api/analytics/overview',
+    '/api/analytics/trends',
+    '/api/analytics/products',
+    '/api/analytics/substitutions',
+    '/api/analytics/baskets',
+    '/api/analytics/consumers',
+    '/api/analytics/cohorts',
+    '/api/geo/clusters'
+]
+
+PROFILES = ['default', 'read']
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_profile(iterations, warmup):
+    """Time the endpoints in this process; prints JSON timings in milliseconds"""
+    sys.path.insert(0, ROOT)
+    from src.main_with_database import app
+
+    client = app.test_client()
+    results = {}
+    for endpoint in ENDPOINTS:
+        for _ in range(warmup):
+            client.get(endpoint)
+        timings = []
+        status = None
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = client.get(endpoint)
+            timings.append((time.perf_counter() - started) * 1000)
+            status = response.status_code
+        results[endpoint] = {
+            "status": status,
+            "mean": statistics.mean(timings),
+            "p50": percentile(timings, 0.5),
+            "p95": percentile(timings, 0.95)
+        }
+    print(json.dumps(results))
+
+def benchmark(profile, iterations, warmup):
+    env = dict(os.environ, SQLITE_PROFILE=profile, SHARED_CACHE_ENABLED='false',
+               CACHE_WARMING_ENABLED='false', PRELOAD_SNAPSHOT='false', REQUEST_TIME_BUDGET_MS='600000')
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-profile', '--iterations', str(iterations), '--warmup', str(warmup)],
+        env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    # The app prints query errors to stdout; the timings are the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SQLite read profile on each analytics endpoint')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--run-profile', dest='run_profile', action='store_true', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_profile:
+        run_profile(args.iterations, args.warmup)
+        return
+
+    print(f"⏱️  {args.iterations} requests per endpoint after {args.warmup} warm-up requests")
+    results = {profile: benchmark(profile, args.iterations, args.warmup) for profile in PROFILES}
+
+    print(f"\n{'endpoint':32} {'default p50':>12} {'read p50':>10} {'default p95':>12} {'read p95':>10} {'speedup':>8}")
+    for endpoint in ENDPOINTS:
+        before = results['default'][endpoint]
+        after = results['read'][endpoint]
+        speedup = before['mean'] / after['mean'] if after['mean'] else float('inf')
+        print(f"{endpoint:32} {before['p50']:10.2f}ms {after['p50']:8.2f}ms {before['p95']:10.2f}ms {after['p95']:8.2f}ms {speedup:7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Scout Analytics - Gunicorn configuration
+Preloads the app in the master so workers share its memory copy-on-write
+"""
+
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+accesslog = '-'
+
+# Gunicorn reads this file before it preloads the app (on_starting would run
+# after), so turn the collector off here to keep it from touching objects
+# while the master loads them
+if preload_app:
+    gc.disable()
+
+def when_ready(server):
+    # Move everything the master loaded (app, snapshot) into the permanent
+    # generation so collections in workers never write to those shared pages
+    if preload_app:
+        gc.collect()
+        gc.freeze()
+
+def post_fork(server, worker):
+    gc.enable()
+    # Threads do not survive fork; warm each worker's cache before it takes traffic
+    if preload_app:
+        from src.main_with_database import start_cache_warming
+        start_cache_warming()
@@ -0,0 +1,163 @@
+"""
+Scout Analytics - Admission control for database queries
+Cost-classed queues with weighted fair sharing and load shedding in front of execute_query
+
+Queries are classified as light, standard or heavy from their SQL text. Each
+class waits in its own bounded queue; free slots are handed out by stride
+scheduling so classes share the backend in proportion to their weights, and
+heavy queries can never hold more than their cap of slots at once. A query is
+shed when its class queue is full or it cannot be admitted before its wait
+limit (or the request's time budget) runs out.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import deque
+
+COST_CLASSES = ('light', 'standard', 'heavy')
+
+# Precomputed aggregates and dimension tables are cheap to read
+LIGHT_TABLES = {
+    'store_rollups', 'time_rollups', 'cohort_matrix', 'basket_rules', 'basket_totals',
+    'substitution_edges', 'stores', 'brands', 'products', 'dim_date'
+}
+
+# Line-grain tables: aggregates over them touch every item
+LINE_TABLES = {'transaction_items', 'fact_sales_line'}
+
+_TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)', re.IGNORECASE)
+
+def _parse_setting(name, default):
+    """Parse 'light=6,standard=3,heavy=1' style settings from the environment"""
+    values = dict(default)
+    for part in os.environ.get(name, '').split(','):
+        if '=' in part:
+            key, value = part.split('=', 1)
+            if key.strip() in values:
+                values[key.strip()] = float(value)
+    return values
+
+WEIGHTS = _parse_setting('ADMISSION_WEIGHTS', {'light': 6, 'standard': 3, 'heavy': 1})
+QUEUE_LIMITS = _parse_setting('ADMISSION_QUEUE_LIMITS', {'light': 200, 'standard': 100, 'heavy': 20})
+MAX_WAIT_MS = _parse_setting('ADMISSION_MAX_WAIT_MS', {'light': 10000, 'standard': 10000, 'heavy': 5000})
+HEAVY_MAX_SHARE = float(os.environ.get('ADMISSION_HEAVY_MAX_SHARE', 0.5))
+
+def classify(query):
+    """Estimate a query's cost class from its SQL text"""
+    sql = ' '.join(query.split()).upper()
+    tables = {table.lower() for table in _TABLE_PATTERN.findall(query)}
+    if tables and tables <= LIGHT_TABLES:
+        return 'light'
+    scans_items = bool(tables & LINE_TABLES)
+    aggregates = 'GROUP BY' in sql or 'COUNT(DISTINCT' in sql
+    filtered = ' WHERE ' in sql
+    if (scans_items and aggregates) or (aggregates and not filtered):
+        return 'heavy'
+    if ' LIMIT ' in sql or ' TOP ' in sql or filtered:
+        return 'light' if not aggregates else 'standard'
+    return 'standard'
+
+class _Ticket:
+    __slots__ = ('cost_class', 'enqueued', 'granted')
+
+    def __init__(self, cost_class):
+        self.cost_class = cost_class
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+class AdmissionController:
+    """Hands out a fixed number of query slots across cost classes"""
+
+    def __init__(self, slots, weights=None, queue_limits=None, max_wait_ms=None, heavy_max_share=HEAVY_MAX_SHARE):
+        self.slots = slots
+        self.weights = weights or WEIGHTS
+        self.queue_limits = queue_limits or QUEUE_LIMITS
+        self.max_wait_ms = max_wait_ms or MAX_WAIT_MS
+        self.heavy_slots = max(1, int(slots * heavy_max_share))
+        self.free = slots
+        self._condition = threading.Condition()
+        self._queues = {cost_class: deque() for cost_class in COST_CLASSES}
+        self._pass = {cost_class: 0.0 for cost_class in COST_CLASSES}
+        self._virtual_time = 0.0
+        self.in_flight = {cost_class: 0 for cost_class in COST_CLASSES}
+        self.admitted = {cost_class: 0 for cost_class in COST_CLASSES}
+        self.shed = {cost_class: 0 for cost_class in COST_CLASSES}
+        self.waits = {cost_class: deque(maxlen=500) for cost_class in COST_CLASSES}
+
+    def _eligible(self, cost_class):
+        if not self._queues[cost_class]:
+            return False
+        return cost_class != 'heavy' or self.in_flight['heavy'] < self.heavy_slots
+
+    def _dispatch(self):
+        """Grant free slots to queued tickets, lowest stride pass first"""
+        granted = False
+        while self.free > 0:
+            candidates = [cost_class for cost_class in COST_CLASSES if self._eligible(cost_class)]
+            if not candidates:
+                break
+            cost_class = min(candidates, key=lambda name: self._pass[name])
+            ticket = self._queues[cost_class].popleft()
+            ticket.granted = True
+            self._virtual_time = self._pass[cost_class]
+            self._pass[cost_class] += 1.0 / self.weights[cost_class]
+            self.free -= 1
+            self.in_flight[cost_class] += 1
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def admit(self, cost_class, timeout=None):
+        """Wait for a slot; returns False when the query is shed"""
+        limit = self.max_wait_ms[cost_class] / 1000
+        timeout = limit if timeout is None else min(timeout, limit)
+        ticket = _Ticket(cost_class)
+        with self._condition:
+            queue = self._queues[cost_class]
+            if len(queue) >= self.queue_limits[cost_class]:
+                self.shed[cost_class] += 1
+                return False
+            if not queue:
+                # An idle class rejoins at the current virtual time instead of banking credit
+                self._pass[cost_class] = max(self._pass[cost_class], self._virtual_time)
+            queue.append(ticket)
+            self._dispatch()
+            deadline = ticket.enqueued + timeout
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.remove(ticket)
+                    self.shed[cost_class] += 1
+                    return False
+                self._condition.wait(remaining)
+            self.admitted[cost_class] += 1
+            self.waits[cost_class].append((time.monotonic() - ticket.enqueued) * 1000)
+        return True
+
+    def release(self, cost_class):
+        with self._condition:
+            self.free += 1
+            self.in_flight[cost_class] -= 1
+            self._dispatch()
+
+    def stats(self):
+        with self._condition:
+            classes = {}
+            for cost_class in COST_CLASSES:
+                waits = sorted(self.waits[cost_class])
+                classes[cost_class] = {
+                    "weight": self.weights[cost_class],
+                    "queued": len(self._queues[cost_class]),
+                    "queue_limit": int(self.queue_limits[cost_class]),
+                    "in_flight": self.in_flight[cost_class],
+                    "admitted": self.admitted[cost_class],
+                    "shed": self.shed[cost_class],
+                    "queue_wait_ms": {
+                        "p50": round(waits[len(waits) // 2], 2) if waits else None,
+                        "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2) if waits else None,
+                        "max": round(waits[-1], 2) if waits else None
+                    }
+                }
+            return {"slots": self.slots, "free": self.free, "heavy_slots": self.heavy_slots, "classes": classes}
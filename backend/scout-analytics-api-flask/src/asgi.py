@@ -0,0 +1,38 @@
+"""
+Scout Analytics - ASGI entry point
+Serves the database-backed Flask API under uvicorn or gunicorn's UvicornWorker
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from src.main_with_database import app as flask_app
+
+# Threads per worker that run Flask requests concurrently
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+# Created in each worker: the pool only starts threads on first use, after fork
+_request_pool = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi-request')
+
+# asgiref decorates run_wsgi_app with a thread-sensitive sync_to_async, which runs
+# every request of the worker on one shared thread; keep the undecorated method
+_run_wsgi_app = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+
+class ThreadedWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """One request, run on the request pool instead of asgiref's single sync thread"""
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(_run_wsgi_app, thread_sensitive=False, executor=_request_pool)(self, body)
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that serves up to ASGI_THREADS requests at once per worker"""
+
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+# Independent sub-queries inside an endpoint fan out further on src.fanout's pool,
+# bounded per backend.
+app = ThreadedWsgiToAsgi(flask_app)
@@ -0,0 +1,68 @@
+"""
+Scout Analytics - Compact storage decoding
+Dictionaries that turn the integer codes of deployment/compact_storage.py back into values
+
+Compact databases keep transactions and transaction_items as
+transactions_compact / transaction_items_compact with integer surrogate keys,
+epoch-second timestamps and dictionary-coded categorical columns. The API
+aggregates on those integers and decodes only the handful of result rows,
+using dictionaries loaded once per dataset version. Region filters and
+groupings use the store's region, like the text queries, through the store
+keys of each region rather than the transaction's own region code.
+"""
+
+COMPACT_MARKER_QUERY = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'transactions_compact'"
+DICTIONARY_QUERY = "SELECT column_name, code, value FROM dictionary_values"
+PRODUCT_QUERY = "SELECT product_key, id, name, category FROM products WHERE product_key IS NOT NULL"
+STORE_QUERY = "SELECT store_key, region FROM stores WHERE store_key IS NOT NULL"
+
+class CompactDictionaries:
+    """Code -> value lookups for one compact dataset"""
+
+    def __init__(self, dictionary_rows, product_rows, store_rows=()):
+        self.values = {}
+        self.codes = {}
+        for row in dictionary_rows:
+            self.values.setdefault(row['column_name'], {})[row['code']] = row['value']
+            self.codes.setdefault(row['column_name'], {})[row['value']] = row['code']
+        self.products = {row['product_key']: row for row in product_rows}
+        self.store_regions = {row['store_key']: row['region'] for row in store_rows}
+
+    def decode(self, column, code):
+        return self.values.get(column, {}).get(code)
+
+    def encode(self, column, value):
+        """Code for a filter value; None when the value never occurs"""
+        return self.codes.get(column, {}).get(value)
+
+    def product(self, key, field='name'):
+        row = self.products.get(key)
+        return row[field] if row else None
+
+    def store_region(self, key):
+        return self.store_regions.get(key)
+
+    def where(self, date_from=None, date_to=None, region=None, alias='t'):
+        """WHERE clause over the compact columns; None when the filter cannot match"""
+        clauses = []
+        params = []
+        if date_from:
+            clauses.append(f"{alias}.created_at >= CAST(strftime('%s', ?) AS INTEGER)")
+            params.append(date_from[:10])
+        if date_to:
+            clauses.append(f"{alias}.created_at <= CAST(strftime('%s', ?) AS INTEGER)")
+            params.append(date_to[:10] + ' 23:59:59')
+        if region:
+            keys = sorted(key for key, store_region in self.store_regions.items() if store_region == region)
+            if not keys:
+                return None
+            # Store keys are integers read from the database, so they are inlined rather than bound
+            clauses.append(f"{alias}.store_key IN ({', '.join(str(int(key)) for key in keys)})")
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", tuple(params)
+
+    def stats(self):
+        return {
+            "columns": {column: len(values) for column, values in self.values.items()},
+            "products": len(self.products),
+            "stores": len(self.store_regions)
+        }
@@ -0,0 +1,78 @@
+"""
+Scout Analytics - Request time budgets
+Per-request deadline propagated into every query, with interrupts and cancellation
+
+The budget lives in a context variable, so run_parallel's worker threads (which
+copy the caller's context) share the same deadline and degraded flag.
+"""
+
+import contextvars
+import math
+import threading
+import time
+
+# SQLite virtual machine instructions between deadline checks
+SQLITE_PROGRESS_OPS = 1000
+
+_budget = contextvars.ContextVar('request_budget', default=None)
+
+class Budget:
+    """Deadline for one request plus the reasons it had to degrade"""
+
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.deadline = time.monotonic() + budget_ms / 1000
+        self.reasons = []
+        self.mock = False
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left before the deadline (never negative)"""
+        return max(self.deadline - time.monotonic(), 0)
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def mark_degraded(self, reason):
+        with self._lock:
+            if reason not in self.reasons:
+                self.reasons.append(reason)
+
+    def mark_mock(self):
+        """Record that the request fell back to mock data because a query gave no result
+
+        Such a response is degraded too, so it is flagged and never cached or warmed.
+        """
+        self.mock = True
+        self.mark_degraded("query gave no result; answered with mock data")
+
+    @property
+    def degraded(self):
+        return bool(self.reasons)
+
+def start_budget(budget_ms):
+    """Give the current context a fresh budget"""
+    budget = Budget(budget_ms)
+    _budget.set(budget)
+    return budget
+
+def current_budget():
+    """Budget of the request being served, or None outside a request"""
+    return _budget.get()
+
+def sqlite_progress_handler(budget):
+    """Progress handler that makes SQLite abort the statement once the deadline passes"""
+    def handler():
+        return 1 if budget.expired() else 0
+    return handler
+
+def odbc_timeout(budget):
+    """Whole seconds to use as a pyodbc query timeout (0 disables the timeout)"""
+    return max(1, math.ceil(budget.remaining()))
+
+def cancel_after(cursor, budget):
+    """Start a timer that cancels the cursor's running statement at the deadline"""
+    timer = threading.Timer(budget.remaining(), cursor.cancel)
+    timer.daemon = True
+    timer.start()
+    return timer
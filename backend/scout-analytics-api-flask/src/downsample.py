@@ -0,0 +1,103 @@
+"""
+Scout Analytics - Time series downsampling
+Largest-Triangle-Three-Buckets and min/max envelopes for long-range trend charts
+"""
+
+from datetime import datetime, timedelta
+
+# Approximate bucket width in seconds for each precomputed rollup grain
+GRAIN_SECONDS = {
+    'hour': 3600,
+    'day': 86400,
+    'week': 7 * 86400,
+    'month': 30 * 86400
+}
+
+# Fetch at most this many source buckets per output point before downsampling
+OVERSAMPLE = 8
+
+def choose_grain(start, end, max_points):
+    """Pick the finest rollup grain whose bucket count for [start, end] stays near max_points"""
+    span = max((end - start).total_seconds(), 0)
+    for grain, seconds in GRAIN_SECONDS.items():
+        if span / seconds <= max_points * OVERSAMPLE:
+            return grain
+    return 'month'
+
+def bucket_start(grain, value):
+    """Label of the rollup bucket that contains an ISO date (weeks start on Monday)"""
+    day = datetime.fromisoformat(value[:10]).date()
+    if grain == 'week':
+        day -= timedelta(days=day.weekday())
+    elif grain == 'month':
+        day = day.replace(day=1)
+    return day.isoformat()
+
+def parse_bucket(bucket):
+    """Epoch seconds for a rollup bucket label"""
+    return datetime.fromisoformat(bucket).timestamp()
+
+def lttb(points, threshold, key):
+    """Downsample points to threshold using Largest-Triangle-Three-Buckets
+
+    points are dicts ordered by their 't' epoch seconds; key names the value
+    that shapes the triangles. The first and last points are always kept.
+    """
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (count - 2) / (threshold - 2)
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket is the third triangle vertex
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        next_points = points[next_start:next_end] or [points[-1]]
+        avg_t = sum(point['t'] for point in next_points) / len(next_points)
+        avg_v = sum(point[key] for point in next_points) / len(next_points)
+
+        anchor_t = points[previous]['t']
+        anchor_v = points[previous][key]
+        best_area = -1.0
+        best = start
+        for index in range(start, end):
+            point = points[index]
+            area = abs((anchor_t - avg_t) * (point[key] - anchor_v)
+                       - (anchor_t - point['t']) * (avg_v - anchor_v))
+            if area > best_area:
+                best_area = area
+                best = index
+
+        sampled.append(points[best])
+        previous = best
+
+    sampled.append(points[-1])
+    return sampled
+
+def minmax_envelope(points, buckets, key):
+    """Aggregate points into at most `buckets` groups carrying min, max and total of key"""
+    count = len(points)
+    if count == 0:
+        return []
+    buckets = max(1, min(buckets, count))
+    bucket_size = count / buckets
+    envelope = []
+    for bucket in range(buckets):
+        group = points[int(bucket * bucket_size):int((bucket + 1) * bucket_size)]
+        if not group:
+            continue
+        values = [point[key] for point in group]
+        envelope.append({
+            "t": group[0]['t'],
+            "bucket": group[0]['bucket'],
+            "min": min(values),
+            "max": max(values),
+            "total": round(sum(values), 2)
+        })
+    return envelope
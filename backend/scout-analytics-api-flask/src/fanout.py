@@ -0,0 +1,90 @@
+"""
+Scout Analytics - Parallel sub-query fan-out
+Runs an endpoint's independent queries concurrently with per-backend concurrency limits
+"""
+
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FANOUT_WORKERS = int(os.environ.get('QUERY_FANOUT_WORKERS', 16))
+
+BACKEND_LIMITS = {
+    'sqlite': int(os.environ.get('SQLITE_MAX_CONCURRENCY', 8)),
+    'mssql': int(os.environ.get('DB_POOL_SIZE', 10))
+}
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='query-fanout')
+
+class BackendLimiter:
+    """Bounded semaphore that also reports in-flight and waiting queries"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak = 0
+        self.timeouts = 0
+
+    def acquire(self, timeout=None):
+        """Wait for a slot; returns False if timeout seconds pass first"""
+        with self._lock:
+            self.waiting += 1
+        acquired = self._semaphore.acquire(timeout=timeout)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+            else:
+                self.timeouts += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak": self.peak,
+            "timeouts": self.timeouts
+        }
+
+_limiters = {backend: BackendLimiter(limit) for backend, limit in BACKEND_LIMITS.items()}
+
+def backend_limiter(backend):
+    """Concurrency limiter for a database backend ('sqlite' or 'mssql')"""
+    return _limiters[backend]
+
+def limiter_stats():
+    """Current limiter state for every backend"""
+    return {backend: limiter.stats() for backend, limiter in _limiters.items()}
+
+def run_parallel(*calls):
+    """Run zero-argument callables concurrently and return their results in order
+
+    The first call runs on the calling thread; the rest go to the shared pool
+    with a copy of the caller's context, so Flask's request context is
+    visible inside them. Exceptions propagate to the caller.
+    """
+    if not calls:
+        return []
+    futures = [_executor.submit(contextvars.copy_context().run, call) for call in calls[1:]]
+    results = [calls[0]()]
+    results.extend(future.result() for future in futures)
+    return results
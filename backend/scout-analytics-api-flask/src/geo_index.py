@@ -0,0 +1,112 @@
+"""
+Scout Analytics - Spatial grid index for the store map layers
+Pre-aggregates per-store rollups into a zoom pyramid of grid cells
+"""
+
+import math
+
+MAX_ZOOM = 18
+CELLS_PER_TILE = 8
+
+def cell_size(zoom):
+    """Cell width in degrees for a map zoom level"""
+    return 360.0 / (2 ** zoom * CELLS_PER_TILE)
+
+class GridIndex:
+    """Zoom pyramid of grid cells over store coordinates
+
+    Each level maps (ix, iy) cell keys to aggregates built once from the
+    per-store rollups, so a cluster query only touches non-empty cells and
+    never re-reads individual stores.
+    """
+
+    def __init__(self, stores, max_zoom=MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self.store_count = 0
+        self.levels = [dict() for _ in range(max_zoom + 1)]
+        for store in stores:
+            self._add(store)
+
+    def _add(self, store):
+        lat = store.get('lat')
+        lng = store.get('lng')
+        if lat is None or lng is None:
+            return
+        lat = float(lat)
+        lng = float(lng)
+        self.store_count += 1
+        for zoom, cells in enumerate(self.levels):
+            size = cell_size(zoom)
+            key = (int(math.floor(lng / size)), int(math.floor(lat / size)))
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = {
+                    "store_count": 0,
+                    "transaction_count": 0,
+                    "revenue": 0.0,
+                    "lat_sum": 0.0,
+                    "lng_sum": 0.0,
+                    "store": None
+                }
+            cell["store_count"] += 1
+            cell["transaction_count"] += int(store.get('transaction_count') or 0)
+            cell["revenue"] += float(store.get('revenue') or 0)
+            cell["lat_sum"] += lat
+            cell["lng_sum"] += lng
+            cell["store"] = store if cell["store_count"] == 1 else None
+
+    def _cells_in_bbox(self, zoom, bbox):
+        min_lng, min_lat, max_lng, max_lat = bbox
+        size = cell_size(zoom)
+        x0, x1 = int(math.floor(min_lng / size)), int(math.floor(max_lng / size))
+        y0, y1 = int(math.floor(min_lat / size)), int(math.floor(max_lat / size))
+        cells = self.levels[zoom]
+
+        # Walk whichever is smaller: the bbox cell range or the non-empty cells
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(cells):
+            for ix in range(x0, x1 + 1):
+                for iy in range(y0, y1 + 1):
+                    cell = cells.get((ix, iy))
+                    if cell is not None:
+                        yield (ix, iy), cell
+        else:
+            for key, cell in cells.items():
+                if x0 <= key[0] <= x1 and y0 <= key[1] <= y1:
+                    yield key, cell
+
+    def clusters(self, bbox, zoom, max_clusters=500):
+        """Return aggregated cells inside bbox, coarsening until at most max_clusters remain
+
+        At zoom 0 more cells can remain; the max_clusters with the highest revenue are kept.
+        """
+        if max_clusters < 1:
+            raise ValueError("max_clusters must be at least 1")
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        while True:
+            cells = list(self._cells_in_bbox(zoom, bbox))
+            if len(cells) <= max_clusters or zoom == 0:
+                break
+            zoom -= 1
+
+        cells.sort(key=lambda item: item[1]["revenue"], reverse=True)
+        clusters = []
+        for (ix, iy), cell in cells[:max_clusters]:
+            count = cell["store_count"]
+            cluster = {
+                "cell": f"{zoom}/{ix}/{iy}",
+                "lat": round(cell["lat_sum"] / count, 6),
+                "lng": round(cell["lng_sum"] / count, 6),
+                "store_count": count,
+                "transaction_count": cell["transaction_count"],
+                "revenue": round(cell["revenue"], 2)
+            }
+            store = cell["store"]
+            if store is not None:
+                cluster["store"] = {
+                    "name": store.get('name'),
+                    "city": store.get('city'),
+                    "region": store.get('region')
+                }
+            clusters.append(cluster)
+
+        return zoom, clusters
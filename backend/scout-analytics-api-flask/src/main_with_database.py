@@ -4,14 +4,39 @@ Scout Analytics Flask API - Database Version
 Supports both SQLite (local) and Azure SQL Database (production)
 """
 
-from flask import Flask, jsonify, request
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
+import contextvars
+import hashlib
+import json
 import sqlite3
-import os
+import tempfile
+import threading
+import time
 from datetime import datetime, timedelta
 import random
 import pyodbc
-from urllib.parse import quote_plus
+from urllib.parse import quote_plus, urlencode, urlsplit, parse_qsl
+
+from src.geo_index import GridIndex
+from src.substitution_graph import SubstitutionGraph
+from src.downsample import bucket_start, choose_grain, lttb, minmax_envelope, parse_bucket
+from src.fanout import BACKEND_LIMITS, backend_limiter, limiter_stats, run_parallel
+from src.admission import AdmissionController, classify
+from src.replicas import SQLITE_PREFIX, WATERMARK_QUERIES, ReplicaRouter, connect_url
+from src.compact import COMPACT_MARKER_QUERY, DICTIONARY_QUERY, PRODUCT_QUERY, STORE_QUERY, CompactDictionaries
+from src.partitions import HyperLogLog, PartitionRouter, load_manifest, merge_groups, top_k, where as partition_where
+from src.sqlite_profile import connect as sqlite_connect, profile_stats, retire_version
+from src.star import PRODUCT_LINES, STAR_MARKER_QUERY, TRANSACTION_LINES, where as star_where
+from src.shm_cache import SharedCache, start_refresher
+from src.snapshot import DEFAULT_TABLES, ColumnTable, load_snapshot, mapped_tables, memory_usage
+from src.warming import AccessLog, WarmCache, start_warming
+from src.deadline import (SQLITE_PROGRESS_OPS, cancel_after, current_budget, odbc_timeout,
+                          sqlite_progress_handler, start_budget)
 
 app = Flask(__name__)
 
@@ -24,6 +49,98 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 DATABASE_SCHEMA = os.environ.get('DATABASE_SCHEMA', 'dbo')
 DB_PATH = os.path.join(os.path.dirname(__file__), 'database', 'scout_analytics.db')
 
+# Per-month (or month and region) SQLite partitions written by deployment/partition_sqlite.py
+# (default: partitions/ next to the active database file)
+PARTITION_DIR = os.environ.get('PARTITION_DIR')
+
+# Blue/green reloads: DB_PATH may be a symlink the loader repoints; on SQL Server the live
+# schema comes from the pointer table maintained by migrate_to_azure_sql.py --blue-green
+DATASET_POINTER_ENABLED = os.environ.get('DATASET_POINTER', 'false').lower() == 'true'
+DATASET_POINTER_SECONDS = int(os.environ.get('DATASET_POINTER_SECONDS', 5))
+
+# Per-request time budget shared by every query the request runs
+REQUEST_TIME_BUDGET_MS = int(os.environ.get('REQUEST_TIME_BUDGET_MS', 10000))
+
+# Read replicas ('|'-separated ODBC connection strings or sqlite:/// URLs)
+DATABASE_READ_URLS = [url.strip() for url in os.environ.get('DATABASE_READ_URLS', '').split('|') if url.strip()]
+REPLICA_MAX_STALENESS_SECONDS = int(os.environ.get('REPLICA_MAX_STALENESS_SECONDS', 60))
+REPLICA_PROBE_SECONDS = int(os.environ.get('REPLICA_PROBE_SECONDS', 15))
+REPLICA_WATERMARK_QUERY = os.environ.get(
+    'REPLICA_WATERMARK_QUERY', WATERMARK_QUERIES['mssql' if DATABASE_URL and 'mssql' in DATABASE_URL else 'sqlite']
+)
+
+# Admission control: cost-classed query queues with weighted fair sharing
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+
+# Shared-memory response cache (one segment for all gunicorn workers on the host)
+SHARED_CACHE_ENABLED = os.environ.get('SHARED_CACHE_ENABLED', 'false').lower() == 'true'
+SHARED_CACHE_PATHS = [
+    path.strip() for path in os.environ.get(
+        'SHARED_CACHE_PATHS',
+        '/api/analytics/overview,/api/analytics/trends,/api/analytics/products,'
+        '/api/analytics/consumers,/api/analytics/cohorts,/api/analytics/baskets'
+    ).split(',') if path.strip()
+]
+SHARED_CACHE_REFRESH_SECONDS = int(os.environ.get('SHARED_CACHE_REFRESH_SECONDS', 300))
+
+# Per-worker cache warming with stale-while-revalidate
+CACHE_WARMING_ENABLED = os.environ.get('CACHE_WARMING_ENABLED', 'false').lower() == 'true'
+CACHE_WARMING_PREFIXES = ('/api/analytics/', '/api/geo/')
+CACHE_TTLS = {
+    '/api/analytics/overview': 300,
+    '/api/analytics/trends': 600,
+    '/api/analytics/products': 900,
+    '/api/analytics/consumers': 1800
+}
+CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL_SECONDS', 300))
+CACHE_MAX_STALE_SECONDS = int(os.environ.get('CACHE_MAX_STALE_SECONDS', 3600))
+CACHE_WARM_TOP_N = int(os.environ.get('CACHE_WARM_TOP_N', 50))
+CACHE_WARM_WORKERS = int(os.environ.get('CACHE_WARM_WORKERS', 2))
+CACHE_WARM_MAX_ENTRIES = int(os.environ.get('CACHE_WARM_MAX_ENTRIES', 1000))
+ACCESS_LOG_PATH = os.environ.get('ACCESS_LOG_PATH', os.path.join(tempfile.gettempdir(), 'scout-analytics-access-log.json'))
+
+# Aggregate snapshot preloaded before fork (see gunicorn.conf.py)
+PRELOAD_SNAPSHOT = os.environ.get('PRELOAD_SNAPSHOT', 'false').lower() == 'true'
+SNAPSHOT_TABLES = [
+    table.strip() for table in os.environ.get('SNAPSHOT_TABLES', ','.join(DEFAULT_TABLES)).split(',') if table.strip()
+]
+# Arrow files exported by load_to_sqlite.py --snapshot (default: snapshot/ next to the database)
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR')
+
+_pinned_dataset = contextvars.ContextVar('pinned_dataset', default=None)
+_pointer_state = (0, None)
+
+def live_schema():
+    """SQL Server schema to read: the blue/green pointer's target, else DATABASE_SCHEMA"""
+    global _pointer_state
+    if not DATASET_POINTER_ENABLED:
+        return DATABASE_SCHEMA
+    checked_at, schema = _pointer_state
+    if schema and time.time() - checked_at < DATASET_POINTER_SECONDS:
+        return schema
+    try:
+        conn = pyodbc.connect(DATABASE_URL, timeout=5)
+        try:
+            row = conn.cursor().execute("SELECT active_schema FROM dbo.scout_dataset_pointer WHERE name = 'scout'").fetchone()
+        finally:
+            conn.close()
+        schema = row[0] if row else DATABASE_SCHEMA
+    except pyodbc.Error as e:
+        print(f"Dataset pointer error: {e}")
+        schema = schema or DATABASE_SCHEMA
+    _pointer_state = (time.time(), schema)
+    return schema
+
+def resolve_dataset():
+    """What is live right now: the database file DB_PATH resolves to, or the SQL Server schema"""
+    if DATABASE_URL and 'mssql' in DATABASE_URL:
+        return live_schema()
+    return os.path.realpath(DB_PATH)
+
+def active_dataset():
+    """The dataset pinned for this request, so a flip never splits one response across versions"""
+    return _pinned_dataset.get() or resolve_dataset()
+
 def get_db_connection():
     """Get database connection based on environment"""
     if DATABASE_URL and 'mssql' in DATABASE_URL:
@@ -31,34 +148,108 @@ def get_db_connection():
         return pyodbc.connect(DATABASE_URL)
     else:
         # SQLite (local development)
-        if os.path.exists(DB_PATH):
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            return conn
+        db_path = active_dataset()
+        if os.path.exists(db_path):
+            return sqlite_connect(db_path)
         else:
             return None
 
-def execute_query(query, params=None):
-    """Execute query with proper schema handling"""
-    conn = get_db_connection()
+admission = {backend: AdmissionController(limit) for backend, limit in BACKEND_LIMITS.items()}
+
+def execute_query(query, params=None, database=None):
+    """Execute query with proper schema handling; database selects a SQLite partition file"""
+    backend = 'mssql' if DATABASE_URL and 'mssql' in DATABASE_URL else 'sqlite'
+    budget = current_budget()
+    if budget is not None and budget.expired():
+        budget.mark_degraded("time budget exhausted before query could start")
+        return None
+    
+    controller = admission[backend] if ADMISSION_ENABLED else None
+    cost_class = classify(query)
+    if controller is not None and not controller.admit(cost_class, budget.remaining() if budget else None):
+        if budget is not None:
+            budget.mark_degraded(f"{cost_class} query shed under load")
+        return None
+    try:
+        limiter = backend_limiter(backend)
+        if not limiter.acquire(timeout=budget.remaining() if budget else None):
+            budget.mark_degraded("time budget exhausted before query could start")
+            return None
+        try:
+            if database is not None:
+                return _execute_query(query, params, budget, connect_url(SQLITE_PREFIX + database))
+            return _routed_query(query, params, budget)
+        except sqlite3.Error as e:
+            print(f"Partition connection error: {e}")
+            return None
+        finally:
+            limiter.release()
+    finally:
+        if controller is not None:
+            controller.release(cost_class)
+
+replica_router = None
+if DATABASE_READ_URLS:
+    replica_router = ReplicaRouter(
+        DATABASE_URL if DATABASE_URL and 'mssql' in DATABASE_URL else SQLITE_PREFIX + DB_PATH,
+        DATABASE_READ_URLS, REPLICA_MAX_STALENESS_SECONDS, probe_interval=REPLICA_PROBE_SECONDS,
+        watermark_query=REPLICA_WATERMARK_QUERY
+    )
+
+def _routed_query(query, params=None, budget=None):
+    """Run a read on a replica when one is eligible, failing back to the primary"""
+    if replica_router is None:
+        return _execute_query(query, params, budget)
+    
+    endpoint = replica_router.choose()
+    started = time.perf_counter()
+    try:
+        conn = connect_url(endpoint.url) if endpoint.role == 'replica' else get_db_connection()
+    except Exception as e:
+        print(f"Replica connection error: {e}")
+        replica_router.record(endpoint, 0, False)
+        return _execute_query(query, params, budget)
+    
+    result = _execute_query(query, params, budget, conn)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    cancelled = budget is not None and budget.expired()
+    if result is not None or cancelled or endpoint.role == 'primary':
+        replica_router.record(endpoint, elapsed_ms, result is not None or cancelled)
+        return result
+    
+    # Retry on the primary; only count the failure against the replica if the primary succeeds
+    result = _execute_query(query, params, budget)
+    replica_router.record(endpoint, elapsed_ms, result is None)
+    return result
+
+def _execute_query(query, params=None, budget=None, conn=None):
+    if conn is None:
+        conn = get_db_connection()
     
     if conn is None:
         # Return mock data if no database available
         return None
     
+    timer = None
     try:
         if isinstance(conn, pyodbc.Connection):
             # Azure SQL - prepend schema to table names
-            if DATABASE_SCHEMA != 'dbo':
+            schema = active_dataset()
+            if schema != 'dbo':
                 # Simple table name replacement for common tables
                 tables = ['stores', 'customers', 'brands', 'products', 'transactions', 
                          'transaction_items', 'substitutions']
                 for table in tables:
-                    query = query.replace(f' {table}', f' {DATABASE_SCHEMA}.{table}')
-                    query = query.replace(f'FROM {table}', f'FROM {DATABASE_SCHEMA}.{table}')
-                    query = query.replace(f'JOIN {table}', f'JOIN {DATABASE_SCHEMA}.{table}')
+                    query = query.replace(f' {table}', f' {schema}.{table}')
+                    query = query.replace(f'FROM {table}', f'FROM {schema}.{table}')
+                    query = query.replace(f'JOIN {table}', f'JOIN {schema}.{table}')
             
+            if budget is not None:
+                # Driver query timeout, plus a cancel at the exact deadline
+                conn.timeout = odbc_timeout(budget)
             cursor = conn.cursor()
+            if budget is not None:
+                timer = cancel_after(cursor, budget)
             if params:
                 cursor.execute(query, params)
             else:
@@ -72,6 +263,8 @@ def execute_query(query, params=None):
             return results
         else:
             # SQLite
+            if budget is not None:
+                conn.set_progress_handler(sqlite_progress_handler(budget), SQLITE_PROGRESS_OPS)
             cursor = conn.cursor()
             if params:
                 cursor.execute(query, params)
@@ -79,11 +272,461 @@ def execute_query(query, params=None):
                 cursor.execute(query)
             return [dict(row) for row in cursor.fetchall()]
     except Exception as e:
+        if budget is not None and budget.expired():
+            budget.mark_degraded("query cancelled at time budget")
         print(f"Database error: {e}")
         return None
     finally:
+        if timer is not None:
+            timer.cancel()
         conn.close()
 
+def dataset_version():
+    """Identify the data currently being served so in-memory indexes know when to rebuild"""
+    if DATABASE_URL and 'mssql' in DATABASE_URL:
+        # Versions end up in stats and shared memory; never expose the credentials
+        return ('mssql', hashlib.sha256(DATABASE_URL.encode()).hexdigest()[:12], active_dataset())
+    db_path = active_dataset()
+    try:
+        stat = os.stat(db_path)
+    except OSError:
+        return None
+    try:
+        # Commits to a WAL database land in the -wal file until a checkpoint
+        wal = os.stat(db_path + '-wal')
+        wal = (wal.st_mtime_ns, wal.st_size)
+    except OSError:
+        wal = None
+    try:
+        partitions = os.stat(os.path.join(partition_dir(), 'manifest.json')).st_mtime_ns
+    except OSError:
+        partitions = None
+    return (db_path, stat.st_mtime_ns, stat.st_size, wal, partitions)
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+def get_index(name, build):
+    """Return the named in-memory index, rebuilding it when the dataset version changes"""
+    version = dataset_version()
+    entry = _index_cache.get(name)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _index_lock:
+        entry = _index_cache.get(name)
+        if entry is None or entry[0] != version:
+            entry = (version, build())
+            _index_cache[name] = entry
+    return entry[1]
+
+_partition_state = (None, None)
+
+def partition_dir():
+    """Partition directory for the active dataset version"""
+    return PARTITION_DIR or os.path.join(os.path.dirname(active_dataset()), 'partitions')
+
+def partition_router():
+    """Router over the SQLite partitions, or None when the data is not partitioned"""
+    global _partition_state
+    if DATABASE_URL and 'mssql' in DATABASE_URL:
+        return None
+    directory = partition_dir()
+    try:
+        mtime = os.stat(os.path.join(directory, 'manifest.json')).st_mtime_ns
+    except OSError:
+        return None
+    if _partition_state[0] != (directory, mtime):
+        manifest = load_manifest(directory)
+        _partition_state = ((directory, mtime), PartitionRouter(directory, manifest) if manifest else None)
+    return _partition_state[1]
+
+def product_lookup(product_ids):
+    """Name and category for product ids, from the main database"""
+    product_ids = [product_id for product_id in product_ids if product_id is not None]
+    if not product_ids:
+        return {}
+    placeholders = ', '.join('?' for _ in product_ids)
+    rows = execute_query(f"SELECT id, name, category FROM products WHERE id IN ({placeholders})", tuple(product_ids))
+    return {row['id']: row for row in rows or []}
+
+def text_filter(date_from=None, date_to=None, region=None):
+    """Join, WHERE clause and parameters filtering transactions t in the text tables"""
+    date_column = 't.transaction_datetime' if DATABASE_URL and 'mssql' in DATABASE_URL else 't.created_at'
+    where, params = partition_where(date_from, date_to, region, date_column, 's.region')
+    return ("JOIN stores s ON t.store_id = s.store_id" if region else ""), where, params
+
+def get_partitioned_overview(router, date_from=None, date_to=None, region=None):
+    """Overview KPIs merged from per-partition partial aggregates"""
+    partitions = router.prune(date_from, date_to, region)
+    where, params = router.where(date_from, date_to, region)
+    sketch_where, sketch_params = router.sketch_where(date_from, date_to, region)
+    sketched = {router.path(partition) for partition in partitions if partition.get('customer_sketches')}
+    
+    def scan(path):
+        months = execute_query(f"""
+        SELECT substr(t.created_at, 1, 7) as month, COUNT(*) as transaction_count, SUM(t.total_amount) as revenue
+        FROM transactions t {where}
+        GROUP BY month
+        """, params, database=path)
+        products = execute_query(f"""
+        SELECT ti.product_id, SUM(ti.quantity * ti.unit_price) as revenue
+        FROM transaction_items ti
+        JOIN transactions t ON t.transaction_id = ti.transaction_id {where}
+        GROUP BY ti.product_id
+        """, params, database=path)
+        sketch = HyperLogLog()
+        if path in sketched:
+            # Per-day sketches written with the partition; merging them reads no customer ids
+            for row in execute_query(f"SELECT registers FROM customer_sketches {sketch_where}", sketch_params, database=path) or []:
+                sketch.merge(HyperLogLog.from_bytes(row['registers']))
+        else:
+            customers = execute_query(f"SELECT DISTINCT t.customer_id FROM transactions t {where}", params, database=path)
+            for row in customers or []:
+                if row['customer_id'] is not None:
+                    sketch.add(row['customer_id'])
+        return months, products, sketch
+    
+    partials = router.map(partitions, scan)
+    months = sorted(merge_groups([partial[0] for partial in partials], ['month'], sums=['transaction_count', 'revenue']),
+                    key=lambda row: row['month'] or '')
+    products = top_k(merge_groups([partial[1] for partial in partials], ['product_id'], sums=['revenue']), 'revenue', 5)
+    customers = HyperLogLog()
+    for partial in partials:
+        customers.merge(partial[2])
+    names = product_lookup([row['product_id'] for row in products])
+    
+    total_transactions = sum(row['transaction_count'] for row in months)
+    total_revenue = float(sum(row['revenue'] or 0 for row in months))
+    return {
+        "total_transactions": total_transactions,
+        "total_revenue": total_revenue,
+        "avg_order_value": total_revenue / total_transactions if total_transactions else 0,
+        "unique_customers": customers.count(),
+        "top_products": [
+            {"name": names.get(row['product_id'], {}).get('name', row['product_id']), "revenue": float(row['revenue'] or 0)}
+            for row in products
+        ],
+        "revenue_trend": [
+            {"month": datetime.strptime(row['month'], '%Y-%m').strftime('%b %Y'), "revenue": float(row['revenue'] or 0)}
+            for row in months[-6:] if row['month']
+        ],
+        "partitions": {"scanned": len(partitions), "total": len(router.partitions)}
+    }
+
+def get_partitioned_regions(router, date_from=None, date_to=None, region=None):
+    """Regional transaction counts and amounts merged across partitions"""
+    where, params = router.where(date_from, date_to, region)
+    query = f"""
+    SELECT s.region, COUNT(*) as count, SUM(t.total_amount) as amount
+    FROM transactions t
+    JOIN stores s ON t.store_id = s.store_id {where}
+    GROUP BY s.region
+    """
+    partials = router.map(router.prune(date_from, date_to, region), lambda path: execute_query(query, params, database=path))
+    return sorted(merge_groups(partials, ['region'], sums=['count', 'amount']), key=lambda row: row['count'], reverse=True)
+
+def get_partitioned_categories(router, date_from=None, date_to=None, region=None):
+    """Category item counts and revenue merged across partitions"""
+    where, params = router.where(date_from, date_to, region)
+    query = f"""
+    SELECT ti.product_id, COUNT(*) as count, SUM(ti.quantity * ti.unit_price) as revenue
+    FROM transaction_items ti
+    JOIN transactions t ON t.transaction_id = ti.transaction_id {where}
+    GROUP BY ti.product_id
+    """
+    partials = router.map(router.prune(date_from, date_to, region), lambda path: execute_query(query, params, database=path))
+    products = merge_groups(partials, ['product_id'], sums=['count', 'revenue'])
+    lookup = product_lookup([row['product_id'] for row in products])
+    for row in products:
+        row['category'] = lookup.get(row['product_id'], {}).get('category')
+    return sorted(merge_groups([products], ['category'], sums=['count', 'revenue']), key=lambda row: row['revenue'] or 0, reverse=True)
+
+def load_compact_dictionaries():
+    """Decoding dictionaries for a compact-storage SQLite dataset, or None for text storage"""
+    if not execute_query(COMPACT_MARKER_QUERY):
+        return None
+    dictionary_rows, product_rows, store_rows = run_parallel(
+        lambda: execute_query(DICTIONARY_QUERY),
+        lambda: execute_query(PRODUCT_QUERY),
+        lambda: execute_query(STORE_QUERY)
+    )
+    return CompactDictionaries(dictionary_rows or [], product_rows or [], store_rows or [])
+
+def compact_dictionaries():
+    if DATABASE_URL and 'mssql' in DATABASE_URL:
+        return None
+    return get_index('compact', load_compact_dictionaries)
+
+def get_compact_overview(dictionaries, date_from=None, date_to=None, region=None):
+    """Overview KPIs aggregated on integer keys and decoded through the cached dictionaries"""
+    filtered = dictionaries.where(date_from, date_to, region)
+    if filtered is None:
+        return None
+    where, params = filtered
+    metrics, months, products = run_parallel(
+        lambda: execute_query(f"""
+        SELECT COUNT(*) as total_transactions, SUM(t.total_amount) as total_revenue,
+               AVG(t.total_amount) as avg_order_value, COUNT(DISTINCT t.customer_key) as unique_customers
+        FROM transactions_compact t {where}
+        """, params),
+        lambda: execute_query(f"""
+        SELECT strftime('%Y-%m', t.created_at, 'unixepoch') as month, SUM(t.total_amount) as revenue
+        FROM transactions_compact t {where}
+        GROUP BY month
+        ORDER BY month
+        """, params),
+        lambda: execute_query(f"""
+        SELECT ti.product_key, SUM(ti.quantity * ti.unit_price) as revenue
+        FROM transaction_items_compact ti
+        {'JOIN transactions_compact t ON t.transaction_key = ti.transaction_key ' + where if where else ''}
+        GROUP BY ti.product_key
+        ORDER BY revenue DESC
+        LIMIT 5
+        """, params)
+    )
+    if not metrics:
+        return None
+    metrics = metrics[0]
+    return {
+        "total_transactions": metrics['total_transactions'],
+        "total_revenue": float(metrics['total_revenue'] or 0),
+        "avg_order_value": float(metrics['avg_order_value'] or 0),
+        "unique_customers": metrics['unique_customers'],
+        "top_products": [
+            {"name": dictionaries.product(row['product_key']), "revenue": float(row['revenue'] or 0)}
+            for row in products or []
+        ],
+        "revenue_trend": [
+            {"month": datetime.strptime(row['month'], '%Y-%m').strftime('%b %Y'), "revenue": float(row['revenue'] or 0)}
+            for row in (months or [])[-6:] if row['month']
+        ]
+    }
+
+def get_compact_regions(dictionaries, date_from=None, date_to=None, region=None):
+    """Regional transaction counts and amounts grouped on store keys, then by the stores' regions"""
+    filtered = dictionaries.where(date_from, date_to, region)
+    if filtered is None:
+        return []
+    where, params = filtered
+    rows = execute_query(f"""
+    SELECT t.store_key, COUNT(*) as count, SUM(t.total_amount) as amount
+    FROM transactions_compact t {where}
+    GROUP BY t.store_key
+    """, params)
+    if rows is None:
+        return None
+    # Transactions of unknown stores drop out, as they do from the text query's JOIN stores
+    rows = [{"region": dictionaries.store_region(row['store_key']), "count": row['count'], "amount": row['amount']}
+            for row in rows if dictionaries.store_region(row['store_key']) is not None]
+    return sorted(merge_groups([rows], ['region'], sums=['count', 'amount']), key=lambda row: row['count'], reverse=True)
+
+def get_compact_categories(dictionaries, date_from=None, date_to=None, region=None):
+    """Category item counts and revenue from per-product sums, categorised in memory"""
+    filtered = dictionaries.where(date_from, date_to, region)
+    if filtered is None:
+        return []
+    where, params = filtered
+    rows = execute_query(f"""
+    SELECT ti.product_key, COUNT(*) as count, SUM(ti.quantity * ti.unit_price) as revenue
+    FROM transaction_items_compact ti
+    {'JOIN transactions_compact t ON t.transaction_key = ti.transaction_key ' + where if where else ''}
+    GROUP BY ti.product_key
+    """, params)
+    if rows is None:
+        return None
+    for row in rows:
+        row['category'] = dictionaries.product(row['product_key'], 'category')
+    return sorted(merge_groups([rows], ['category'], sums=['count', 'revenue']), key=lambda row: row['revenue'] or 0, reverse=True)
+
+def get_compact_transactions(dictionaries, limit, offset):
+    """Latest transactions from the compact tables, keys and codes decoded for the page only"""
+    rows, total = run_parallel(
+        lambda: execute_query("""
+        SELECT k.uuid as transaction_id, kc.uuid as customer_id, datetime(t.created_at, 'unixepoch') as created_at,
+               t.total_amount, t.customer_age, t.customer_gender, t.store_location, t.store_key
+        FROM transactions_compact t
+        JOIN key_map_transaction k ON k.key = t.transaction_key
+        LEFT JOIN key_map_customer kc ON kc.key = t.customer_key
+        ORDER BY t.created_at DESC
+        LIMIT ? OFFSET ?
+        """, (limit, offset)),
+        lambda: execute_query("SELECT COUNT(*) as total FROM transactions_compact")
+    )
+    if rows is None:
+        return None, None
+    for row in rows:
+        row['customer_gender'] = dictionaries.decode('customer_gender', row['customer_gender'])
+        row['region'] = dictionaries.store_region(row.pop('store_key'))
+    return rows, total
+
+def get_compact_age_groups(dictionaries, date_from=None, date_to=None, region=None):
+    """Transaction counts and average amounts per customer age band, joined on customer keys"""
+    filtered = dictionaries.where(date_from, date_to, region)
+    if filtered is None:
+        return []
+    where, params = filtered
+    return execute_query(f"""
+    SELECT CASE
+               WHEN age BETWEEN 18 AND 25 THEN '18-25'
+               WHEN age BETWEEN 26 AND 35 THEN '26-35'
+               WHEN age BETWEEN 36 AND 45 THEN '36-45'
+               WHEN age BETWEEN 46 AND 55 THEN '46-55'
+               ELSE '55+'
+           END as age_group,
+           COUNT(*) as count, AVG(total_amount) as avg_amount
+    FROM (
+        SELECT COALESCE(c.age, t.customer_age) as age, t.total_amount
+        FROM transactions_compact t
+        LEFT JOIN customers c ON c.customer_key = t.customer_key {where}
+    )
+    GROUP BY age_group
+    ORDER BY count DESC
+    """, params)
+
+def star_schema():
+    """Whether the SQLite dataset carries the fact_sales_line star schema"""
+    if DATABASE_URL and 'mssql' in DATABASE_URL:
+        return False
+    return get_index('star', lambda: bool(execute_query(STAR_MARKER_QUERY)))
+
+def get_star_overview(date_from=None, date_to=None, region=None):
+    """Overview KPIs from covering-index scans of fact_sales_line"""
+    where, params = star_where(date_from, date_to, region)
+    product_where, product_params = star_where(date_from, date_to, region, lines=PRODUCT_LINES)
+    metrics, months, products = run_parallel(
+        lambda: execute_query(f"""
+        SELECT SUM(transaction_count) as total_transactions, SUM(transaction_amount) as total_revenue,
+               COUNT(DISTINCT customer_id) as unique_customers
+        FROM fact_sales_line {where}
+        """, params),
+        lambda: execute_query(f"""
+        SELECT date_key / 10000 as month, SUM(transaction_amount) as revenue
+        FROM fact_sales_line {where}
+        GROUP BY month
+        ORDER BY month
+        """, params),
+        lambda: execute_query(f"""
+        SELECT product_id, SUM(line_revenue) as revenue
+        FROM fact_sales_line {product_where}
+        GROUP BY product_id
+        ORDER BY revenue DESC
+        LIMIT 5
+        """, product_params)
+    )
+    if not metrics:
+        return None
+    metrics = metrics[0]
+    total_transactions = metrics['total_transactions'] or 0
+    total_revenue = float(metrics['total_revenue'] or 0)
+    names = product_lookup([row['product_id'] for row in products or []])
+    return {
+        "total_transactions": total_transactions,
+        "total_revenue": total_revenue,
+        "avg_order_value": total_revenue / total_transactions if total_transactions else 0,
+        "unique_customers": metrics['unique_customers'],
+        "top_products": [
+            {"name": names.get(row['product_id'], {}).get('name', row['product_id']), "revenue": float(row['revenue'] or 0)}
+            for row in products or []
+        ],
+        "revenue_trend": [
+            {"month": datetime.strptime(str(row['month']), '%Y%m').strftime('%b %Y'), "revenue": float(row['revenue'] or 0)}
+            for row in (months or [])[-6:] if row['month']
+        ]
+    }
+
+def get_star_regions(date_from=None, date_to=None, region=None):
+    """Transaction counts and amounts per store region"""
+    where, params = star_where(date_from, date_to, region)
+    return execute_query(f"""
+    SELECT store_region as region, SUM(transaction_count) as count, SUM(transaction_amount) as amount
+    FROM fact_sales_line {where}
+    GROUP BY store_region
+    ORDER BY count DESC
+    """, params)
+
+def get_star_calendar(date_from=None, date_to=None, region=None):
+    """Transaction counts and amounts per hour of day, weekday and holiday flag from dim_date
+
+    The fact lines are summed per date_key first, so dim_date is joined once per hour.
+    """
+    where, params = star_where(date_from, date_to, region)
+    rows = execute_query(f"""
+    SELECT d.hour, d.weekday, d.weekday_name, d.is_holiday,
+           SUM(f.count) as count, SUM(f.amount) as amount
+    FROM (
+        SELECT date_key, SUM(transaction_count) as count, SUM(transaction_amount) as amount
+        FROM fact_sales_line {where}
+        GROUP BY date_key
+    ) f
+    JOIN dim_date d ON d.date_key = f.date_key
+    GROUP BY d.hour, d.weekday, d.weekday_name, d.is_holiday
+    """, params)
+    if rows is None:
+        return None
+    hours, weekdays, holidays = {}, {}, {}
+    for row in rows:
+        for totals, key in ((hours, row['hour']), (weekdays, (row['weekday'], row['weekday_name'])),
+                            (holidays, bool(row['is_holiday']))):
+            count, amount = totals.get(key, (0, 0.0))
+            totals[key] = (count + (row['count'] or 0), amount + float(row['amount'] or 0))
+    return {
+        "hourly": [
+            {"hour": f"{hour:02d}:00", "count": hours.get(hour, (0, 0.0))[0],
+             "amount": round(hours.get(hour, (0, 0.0))[1], 2)}
+            for hour in range(24)
+        ],
+        "weekday": [
+            {"weekday": name, "count": count, "amount": round(amount, 2)}
+            for (_, name), (count, amount) in sorted(weekdays.items())
+        ],
+        "holiday": [
+            {"is_holiday": flag, "count": count, "amount": round(amount, 2)}
+            for flag, (count, amount) in sorted(holidays.items())
+        ]
+    }
+
+def get_star_categories(date_from=None, date_to=None, region=None):
+    """Category item counts and revenue"""
+    where, params = star_where(date_from, date_to, region, lines=PRODUCT_LINES)
+    return execute_query(f"""
+    SELECT category, COUNT(*) as count, SUM(line_revenue) as revenue
+    FROM fact_sales_line {where}
+    GROUP BY category
+    ORDER BY revenue DESC
+    """, params)
+
+def get_star_age_groups(date_from=None, date_to=None, region=None):
+    """Transaction counts and average amounts per customer age band"""
+    where, params = star_where(date_from, date_to, region)
+    return execute_query(f"""
+    SELECT age_group, SUM(transaction_count) as count, AVG(transaction_amount) as avg_amount
+    FROM fact_sales_line {where}
+    GROUP BY age_group
+    ORDER BY count DESC
+    """, params)
+
+snapshot = None
+
+def preload_snapshot():
+    """Load dimension tables and rollups into the columnar snapshot"""
+    global snapshot
+    mapped = None
+    if not (DATABASE_URL and 'mssql' in DATABASE_URL):
+        database = active_dataset()
+        mapped = mapped_tables(SNAPSHOT_DIR or os.path.join(os.path.dirname(database), 'snapshot'), database)
+    version = dataset_version()
+    shared = None
+    if shared_cache is not None:
+        shared = lambda table: shared_cache.get(shared_snapshot_key(table), str(version))
+    snapshot = load_snapshot(lambda table: execute_query(f"SELECT * FROM {table}"), version, SNAPSHOT_TABLES, mapped, shared)
+    return snapshot
+
+def current_snapshot():
+    """The preloaded snapshot, or None once the dataset has moved past it"""
+    if snapshot is not None and snapshot.version == dataset_version():
+        return snapshot
+    return None
+
 def get_mock_data():
     """Return mock data when database is not available"""
     return {
@@ -102,6 +745,188 @@ def get_mock_data():
         ]
     }
 
+def used_mock_data():
+    """Note that this request answered with mock data, so a degraded response says so"""
+    budget = current_budget()
+    if budget is not None:
+        budget.mark_mock()
+
+def normalize_cache_key(path, args):
+    """Cache key for a path and its query arguments, independent of argument order"""
+    query = urlencode(sorted(args))
+    return f"{path}?{query}" if query else path
+
+shared_cache = None
+_shared_refresher = None
+
+if SHARED_CACHE_ENABLED:
+    shared_cache = SharedCache(os.environ.get('SHARED_CACHE_PATH'), int(os.environ.get('SHARED_CACHE_SIZE_MB', 64)))
+
+def shared_snapshot_key(table):
+    """Shared cache key holding a snapshot table's arrays"""
+    return f"snapshot/{table}"
+
+def render_snapshot_table(table):
+    """A snapshot table serialized for the shared cache, from this worker's snapshot when it is current"""
+    preloaded = current_snapshot()
+    column_table = preloaded.get(table) if preloaded else None
+    if column_table is None:
+        rows = execute_query(f"SELECT * FROM {table}")
+        if not rows:
+            return None
+        column_table = ColumnTable(table, rows)
+    return column_table.to_bytes()
+
+def render_for_shared_cache(key):
+    """Render a cache key through the app, bypassing the shared cache itself"""
+    if key.startswith(shared_snapshot_key('')):
+        return render_snapshot_table(key[len(shared_snapshot_key('')):])
+    with app.test_client() as client:
+        response = client.get(key, headers={'X-Cache-Bypass': '1'})
+    # A degraded answer would be shared (and warmed) as if it were complete
+    if response.status_code != 200 or response.headers.get('X-Degraded'):
+        return None
+    return response.data
+
+def cache_ttl(key):
+    """TTL for a cache key, per endpoint"""
+    return CACHE_TTLS.get(urlsplit(key).path, CACHE_DEFAULT_TTL)
+
+access_log = AccessLog(ACCESS_LOG_PATH) if CACHE_WARMING_ENABLED else None
+warm_cache = WarmCache(render_for_shared_cache, cache_ttl, CACHE_MAX_STALE_SECONDS, CACHE_WARM_WORKERS,
+                       CACHE_WARM_MAX_ENTRIES) if CACHE_WARMING_ENABLED else None
+_warming_pid = None
+_warming_lock = threading.Lock()
+
+def start_cache_warming():
+    """Start the warming scheduler in this process (once per worker, after fork)"""
+    global _warming_pid
+    if warm_cache is None or _warming_pid == os.getpid():
+        return
+    with _warming_lock:
+        if _warming_pid == os.getpid():
+            return
+        base_keys = [normalize_cache_key(urlsplit(path).path, parse_qsl(urlsplit(path).query)) for path in SHARED_CACHE_PATHS]
+        start_warming(warm_cache, access_log, base_keys, lambda: str(dataset_version()), CACHE_WARM_TOP_N)
+        _warming_pid = os.getpid()
+
+@app.before_request
+def start_request_budget():
+    """Start this request's time budget; clients may ask for a shorter one"""
+    budget_ms = REQUEST_TIME_BUDGET_MS
+    requested = request.headers.get('X-Time-Budget-Ms')
+    if requested and requested.isdigit():
+        budget_ms = min(budget_ms, int(requested))
+    start_budget(budget_ms)
+
+_dataset_requests = {}
+_dataset_lock = threading.Lock()
+_last_dataset = None
+
+@app.before_request
+def pin_dataset():
+    """Pin the live dataset for this request and count it so old versions can be seen draining"""
+    global _last_dataset
+    dataset = resolve_dataset()
+    _pinned_dataset.set(dataset)
+    g.pinned_dataset = dataset
+    with _dataset_lock:
+        _dataset_requests[dataset] = _dataset_requests.get(dataset, 0) + 1
+        previous, _last_dataset = _last_dataset, dataset
+    if previous is not None and previous != dataset:
+        on_dataset_switch(previous, dataset)
+
+@app.teardown_request
+def release_dataset(exc):
+    dataset = g.pop('pinned_dataset', None)
+    if dataset is None:
+        return
+    with _dataset_lock:
+        _dataset_requests[dataset] -= 1
+        if _dataset_requests[dataset] <= 0:
+            del _dataset_requests[dataset]
+
+def on_dataset_switch(previous, current):
+    """Drop per-version state once requests start landing on a new dataset version"""
+    print(f"🔄 Dataset switched: {previous} -> {current}")
+    if not (DATABASE_URL and 'mssql' in DATABASE_URL):
+        retire_version(previous, current)
+    with _index_lock:
+        _index_cache.clear()
+    if PRELOAD_SNAPSHOT:
+        threading.Thread(target=preload_snapshot, name='snapshot-reload', daemon=True).start()
+
+@app.before_request
+def serve_from_shared_cache():
+    """Answer GETs from the shared-memory segment when it holds the current dataset version"""
+    global _shared_refresher
+    if shared_cache is None or request.method != 'GET' or request.headers.get('X-Cache-Bypass'):
+        return None
+    
+    # Threads do not survive fork, so the refresher starts in the worker on first use
+    if _shared_refresher is None:
+        keys = [normalize_cache_key(urlsplit(path).path, parse_qsl(urlsplit(path).query)) for path in SHARED_CACHE_PATHS]
+        if PRELOAD_SNAPSHOT:
+            # Workers reloading the snapshot after a dataset switch read these instead of querying
+            keys += [shared_snapshot_key(table) for table in SNAPSHOT_TABLES]
+        _shared_refresher = start_refresher(shared_cache, render_for_shared_cache, keys,
+                                            lambda: str(dataset_version()), SHARED_CACHE_REFRESH_SECONDS)
+    
+    body = shared_cache.get(normalize_cache_key(request.path, request.args.items(multi=True)), str(dataset_version()))
+    if body is not None:
+        return app.response_class(body, mimetype='application/json', headers={'X-Cache': 'shared'})
+    return None
+
+@app.before_request
+def serve_from_warm_cache():
+    """Answer popular GETs from the worker's warm cache, serving stale entries while they refresh"""
+    if warm_cache is None or request.method != 'GET' or request.headers.get('X-Cache-Bypass'):
+        return None
+    if not request.path.startswith(CACHE_WARMING_PREFIXES):
+        return None
+    start_cache_warming()
+    
+    key = normalize_cache_key(request.path, request.args.items(multi=True))
+    access_log.record(key)
+    body = warm_cache.get(key, str(dataset_version()))
+    if body is not None:
+        return app.response_class(body, mimetype='application/json', headers={'X-Cache': 'warm'})
+    g.warm_cache_key = key
+    return None
+
+@app.after_request
+def store_in_warm_cache(response):
+    """Keep live responses for cacheable keys that missed the warm cache"""
+    key = g.pop('warm_cache_key', None)
+    budget = current_budget()
+    if budget is not None and budget.degraded:
+        return response
+    if key is not None and response.status_code == 200:
+        warm_cache.put(key, response.get_data(), str(dataset_version()))
+    return response
+
+@app.after_request
+def flag_degraded_response(response):
+    """Swap in the last cached result, or mark the partial one, when the time budget ran out"""
+    budget = current_budget()
+    if budget is None or not budget.degraded or response.status_code != 200 or not response.is_json:
+        return response
+    
+    body = response.get_json()
+    source = "mock" if budget.mock else "partial"
+    if warm_cache is not None and request.method == 'GET':
+        cached = warm_cache.peek(normalize_cache_key(request.path, request.args.items(multi=True)))
+        if cached is not None:
+            body = json.loads(cached)
+            source = "cached"
+    if isinstance(body, dict):
+        body["degraded"] = True
+        body["degraded_reasons"] = budget.reasons
+        body["degraded_source"] = source
+        response.set_data(json.dumps(body))
+    response.headers['X-Degraded'] = source
+    return response
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -110,7 +935,14 @@ def health_check():
         "status": "ok", 
         "database": database_status, 
         "timestamp": datetime.now().isoformat(),
-        "schema": DATABASE_SCHEMA if DATABASE_URL else "sqlite"
+        "schema": live_schema() if DATABASE_URL else "sqlite",
+        "dataset": {
+            "active": resolve_dataset(),
+            "in_flight_requests": dict(_dataset_requests)
+        },
+        "request_time_budget_ms": REQUEST_TIME_BUDGET_MS,
+        "query_concurrency": limiter_stats(),
+        "shared_cache": shared_cache.stats() if shared_cache else None
     })
 
 @app.route('/api/transactions', methods=['GET'])
@@ -132,15 +964,33 @@ def get_transactions():
         LIMIT ? OFFSET ?
         """
         
-        results = execute_query(query, (limit, offset))
+        total_query = "SELECT COUNT(*) as total FROM transactions"
+        
+        if star_schema():
+            query = f"""
+            SELECT transaction_id, customer_id, created_at, transaction_amount as total_amount,
+                   customer_age, customer_gender, store_city as store_location, store_region as region
+            FROM fact_sales_line
+            WHERE {TRANSACTION_LINES}
+            ORDER BY created_at DESC
+            LIMIT ? OFFSET ?
+            """
+            total_query = f"SELECT COUNT(*) as total FROM fact_sales_line WHERE {TRANSACTION_LINES}"
+        
+        dictionaries = None if star_schema() else compact_dictionaries()
+        if dictionaries is not None:
+            results, total_result = get_compact_transactions(dictionaries, limit, offset)
+        else:
+            results, total_result = run_parallel(
+                lambda: execute_query(query, (limit, offset)),
+                lambda: execute_query(total_query)
+            )
         
         if results:
             # Add mock payment methods since we don't have that in our schema
             for result in results:
                 result['payment_method'] = random.choice(["Cash", "Card", "GCash", "PayMaya", "GrabPay"])
             
-            total_query = "SELECT COUNT(*) as total FROM transactions"
-            total_result = execute_query(total_query)
             total = total_result[0]['total'] if total_result else len(results)
             
             return jsonify({
@@ -151,6 +1001,7 @@ def get_transactions():
             })
         else:
             # Fallback to mock data
+            used_mock_data()
             mock_data = get_mock_data()
             return jsonify({
                 "transactions": mock_data["transactions"][:limit],
@@ -166,32 +1017,59 @@ def get_transactions():
 def get_overview_analytics():
     """Get overview analytics data"""
     try:
+        router = partition_router()
+        if router is not None:
+            return jsonify(get_partitioned_overview(
+                router, request.args.get('date_from'), request.args.get('date_to'), request.args.get('region')
+            ))
+        
+        if star_schema():
+            overview = get_star_overview(
+                request.args.get('date_from'), request.args.get('date_to'), request.args.get('region')
+            )
+            if overview is not None:
+                return jsonify(overview)
+        
+        dictionaries = compact_dictionaries()
+        if dictionaries is not None:
+            overview = get_compact_overview(
+                dictionaries, request.args.get('date_from'), request.args.get('date_to'), request.args.get('region')
+            )
+            if overview is not None:
+                return jsonify(overview)
+        
         # Try database queries
-        overview_query = """
+        join, where, params = text_filter(
+            request.args.get('date_from'), request.args.get('date_to'), request.args.get('region')
+        )
+        overview_query = f"""
         SELECT 
             COUNT(*) as total_transactions,
-            SUM(total_amount) as total_revenue,
-            AVG(total_amount) as avg_order_value,
-            COUNT(DISTINCT customer_id) as unique_customers
-        FROM transactions
+            SUM(t.total_amount) as total_revenue,
+            AVG(t.total_amount) as avg_order_value,
+            COUNT(DISTINCT t.customer_id) as unique_customers
+        FROM transactions t {join} {where}
         """
         
-        results = execute_query(overview_query)
+        # Top products
+        products_query = f"""
+        SELECT p.product_name as name, SUM(ti.quantity * ti.unit_price) as revenue
+        FROM transaction_items ti
+        JOIN products p ON ti.product_id = p.product_id
+        {'JOIN transactions t ON t.transaction_id = ti.transaction_id ' + join + ' ' + where if where else ''}
+        GROUP BY p.product_id, p.product_name
+        ORDER BY revenue DESC
+        LIMIT 5
+        """
+        
+        results, top_products = run_parallel(
+            lambda: execute_query(overview_query, params),
+            lambda: execute_query(products_query, params)
+        )
         
         if results:
             metrics = results[0]
-            
-            # Get top products
-            products_query = """
-            SELECT p.product_name as name, SUM(ti.quantity * ti.unit_price) as revenue
-            FROM transaction_items ti
-            JOIN products p ON ti.product_id = p.product_id
-            GROUP BY p.product_id, p.product_name
-            ORDER BY revenue DESC
-            LIMIT 5
-            """
-            
-            top_products = execute_query(products_query) or []
+            top_products = top_products or []
             
             # Get revenue trend (mock for now)
             revenue_trend = [
@@ -213,6 +1091,7 @@ def get_overview_analytics():
             })
         else:
             # Fallback to mock data
+            used_mock_data()
             return jsonify({
                 "total_transactions": 15000,
                 "total_revenue": 2847392.50,
@@ -243,15 +1122,51 @@ def get_trends_analytics():
     """Get transaction trends analytics"""
     try:
         # Regional distribution from database
-        regional_query = """
+        _, where, params = text_filter(
+            request.args.get('date_from'), request.args.get('date_to'), request.args.get('region')
+        )
+        regional_query = f"""
         SELECT s.region, COUNT(*) as count, SUM(t.total_amount) as amount
         FROM transactions t
-        JOIN stores s ON t.store_id = s.store_id
+        JOIN stores s ON t.store_id = s.store_id {where}
         GROUP BY s.region
         ORDER BY count DESC
         """
         
-        regional_data = execute_query(regional_query)
+        router = partition_router()
+        star = router is None and star_schema()
+        dictionaries = compact_dictionaries() if router is None and not star else None
+        filters = (request.args.get('date_from'), request.args.get('date_to'), request.args.get('region'))
+        if router is not None:
+            fetch_regional = lambda: get_partitioned_regions(router, *filters)
+        elif star:
+            fetch_regional = lambda: get_star_regions(*filters)
+        elif dictionaries is not None:
+            fetch_regional = lambda: get_compact_regions(dictionaries, *filters)
+        else:
+            fetch_regional = lambda: execute_query(regional_query, params)
+        
+        max_points = request.args.get('max_points')
+        if max_points:
+            series_args = (
+                max(3, min(int(max_points), 5000)),
+                request.args.get('date_from'),
+                request.args.get('date_to'),
+                request.args.get('region', 'ALL'),
+                request.args.get('metric', 'revenue'),
+                request.args.get('mode', 'lttb')
+            )
+            regional_data, calendar, series = run_parallel(
+                fetch_regional,
+                lambda: get_star_calendar(*filters) if star else None,
+                lambda: get_downsampled_series(*series_args)
+            )
+        elif star:
+            regional_data, calendar = run_parallel(fetch_regional, lambda: get_star_calendar(*filters))
+            series = None
+        else:
+            regional_data, calendar, series = fetch_regional(), None, None
+        hourly_data = calendar['hourly'] if calendar else None
         
         if regional_data:
             # Convert to expected format
@@ -264,6 +1179,7 @@ def get_trends_analytics():
             ]
         else:
             # Mock regional data
+            used_mock_data()
             regional_distribution = [
                 {"region": "NCR", "count": 5970, "amount": 1133000.00},
                 {"region": "Central Luzon", "count": 3060, "amount": 580000.00},
@@ -272,38 +1188,152 @@ def get_trends_analytics():
                 {"region": "Northern Mindanao", "count": 1560, "amount": 297000.00}
             ]
         
-        # Mock hourly data (would need datetime parsing for real implementation)
-        hourly_volume = []
-        for hour in range(24):
-            count = random.randint(200, 800) if 6 <= hour <= 22 else random.randint(50, 200)
-            hourly_volume.append({
-                "hour": f"{hour:02d}:00",
-                "count": count,
-                "amount": round(count * random.uniform(150, 250), 2)
-            })
+        if hourly_data:
+            hourly_volume = hourly_data
+        else:
+            # Mock hourly data (would need datetime parsing for real implementation)
+            used_mock_data()
+            hourly_volume = []
+            for hour in range(24):
+                count = random.randint(200, 800) if 6 <= hour <= 22 else random.randint(50, 200)
+                hourly_volume.append({
+                    "hour": f"{hour:02d}:00",
+                    "count": count,
+                    "amount": round(count * random.uniform(150, 250), 2)
+                })
         
-        return jsonify({
+        result = {
             "hourly": hourly_volume,
             "regional": regional_distribution
-        })
+        }
+        if calendar:
+            result["weekday"] = calendar['weekday']
+            result["holiday"] = calendar['holiday']
+        if series is not None:
+            result["series"] = series
+        
+        return jsonify(result)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def get_downsampled_series(max_points, date_from, date_to, region, metric, mode):
+    """Read a trend series from the coarsest-fitting time rollup and downsample it to max_points"""
+    if metric not in ('count', 'revenue'):
+        raise ValueError("metric must be 'count' or 'revenue'")
+    if mode not in ('lttb', 'envelope'):
+        raise ValueError("mode must be 'lttb' or 'envelope'")
+    
+    if not date_from or not date_to:
+        range_query = """
+        SELECT MIN(bucket) as first_bucket, MAX(bucket) as last_bucket
+        FROM time_rollups
+        WHERE grain = 'day' AND region = ?
+        """
+        range_data = execute_query(range_query, (region,))
+        if range_data and range_data[0]['first_bucket']:
+            date_from = date_from or range_data[0]['first_bucket']
+            date_to = date_to or range_data[0]['last_bucket']
+    
+    if date_from and date_to:
+        grain = choose_grain(datetime.fromisoformat(date_from[:10]), datetime.fromisoformat(date_to[:10]), max_points)
+        series_query = """
+        SELECT bucket, transaction_count, revenue
+        FROM time_rollups
+        WHERE grain = ? AND region = ? AND bucket >= ? AND bucket <= ?
+        ORDER BY bucket
+        """
+        # Floor the start so the week or month bucket containing date_from is kept
+        series_data = execute_query(series_query, (grain, region, bucket_start(grain, date_from),
+                                                   date_to[:10] + ' 23:59:59'))
+    else:
+        series_data = None
+    
+    if series_data:
+        points = [
+            {
+                "t": parse_bucket(row['bucket']),
+                "bucket": row['bucket'],
+                "count": row['transaction_count'],
+                "revenue": round(float(row['revenue']), 2)
+            } for row in series_data
+        ]
+    else:
+        # Mock monthly series
+        used_mock_data()
+        grain = 'month'
+        points = [
+            {"t": parse_bucket(bucket), "bucket": bucket, "count": count, "revenue": revenue}
+            for bucket, count, revenue in [
+                ("2025-01-01", 12600, 2400000.00), ("2025-02-01", 13200, 2520000.00),
+                ("2025-03-01", 14100, 2680000.00), ("2025-04-01", 14500, 2750000.00),
+                ("2025-05-01", 14850, 2820000.00), ("2025-06-01", 15000, 2847392.50)
+            ]
+        ]
+    
+    if mode == 'envelope':
+        sampled = minmax_envelope(points, max_points, metric)
+    else:
+        sampled = lttb(points, max_points, metric)
+    
+    return {
+        "grain": grain,
+        "mode": mode,
+        "metric": metric,
+        "source_points": len(points),
+        "points": sampled
+    }
+
+def build_substitution_graph():
+    """Build the substitution graph index from the precomputed substitution edges"""
+    edges_query = """
+    SELECT original_product_id, substituted_product_id, original_name, substituted_name,
+           original_brand, substituted_brand, reason, region, count
+    FROM substitution_edges
+    """
+    
+    edges_data = execute_query(edges_query)
+    
+    if edges_data:
+        return SubstitutionGraph(edges_data)
+    return None
+
 @app.route('/api/analytics/products', methods=['GET'])
 def get_product_analytics():
     """Get product mix analytics"""
     try:
         # Try to get categories from database
-        categories_query = """
+        join, where, params = text_filter(
+            request.args.get('date_from'), request.args.get('date_to'), request.args.get('region')
+        )
+        categories_query = f"""
         SELECT p.category, COUNT(*) as count, SUM(ti.quantity * ti.unit_price) as revenue
         FROM transaction_items ti
         JOIN products p ON ti.product_id = p.product_id
+        {'JOIN transactions t ON t.transaction_id = ti.transaction_id ' + join + ' ' + where if where else ''}
         GROUP BY p.category
         ORDER BY revenue DESC
         """
         
-        categories_data = execute_query(categories_query)
+        router = partition_router()
+        star = router is None and star_schema()
+        dictionaries = compact_dictionaries() if router is None and not star else None
+        filters = (request.args.get('date_from'), request.args.get('date_to'), request.args.get('region'))
+        if router is not None:
+            fetch_categories = lambda: get_partitioned_categories(router, *filters)
+        elif star:
+            fetch_categories = lambda: get_star_categories(*filters)
+        elif dictionaries is not None:
+            fetch_categories = lambda: get_compact_categories(dictionaries, *filters)
+        else:
+            fetch_categories = lambda: execute_query(categories_query, params)
+        
+        categories_data, graph = run_parallel(
+            fetch_categories,
+            lambda: get_index('substitutions', build_substitution_graph)
+        )
         
         if categories_data:
             categories = [
@@ -315,6 +1345,7 @@ def get_product_analytics():
             ]
         else:
             # Mock categories
+            used_mock_data()
             categories = [
                 {"category": "Beverages", "count": 4250, "revenue": 812456.00},
                 {"category": "Food & Snacks", "count": 3630, "revenue": 689234.00},
@@ -323,29 +1354,18 @@ def get_product_analytics():
                 {"category": "Others", "count": 2020, "revenue": 378123.00}
             ]
         
-        # Get substitutions from database
-        substitutions_query = """
-        SELECT p1.product_name as from_product, p2.product_name as to_product, COUNT(*) as count
-        FROM substitutions s
-        JOIN products p1 ON s.original_product_id = p1.product_id
-        JOIN products p2 ON s.substituted_product_id = p2.product_id
-        GROUP BY p1.product_name, p2.product_name
-        ORDER BY count DESC
-        LIMIT 5
-        """
-        
-        substitutions_data = execute_query(substitutions_query)
-        
-        if substitutions_data:
+        # Substitutions from the substitution graph index
+        if graph is not None:
             top_substitutions = [
                 {
-                    "from": row['from_product'],
-                    "to": row['to_product'],
-                    "count": row['count']
-                } for row in substitutions_data
+                    "from": edge['from'],
+                    "to": edge['to'],
+                    "count": edge['count']
+                } for edge in graph.top(5)
             ]
         else:
             # Mock substitutions
+            used_mock_data()
             top_substitutions = [
                 {"from": "Coca-Cola", "to": "Pepsi", "count": 234},
                 {"from": "Lucky Me", "to": "Nissin", "count": 189},
@@ -360,6 +1380,106 @@ def get_product_analytics():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/analytics/substitutions', methods=['GET'])
+def get_substitution_analytics():
+    """Get substitution patterns from the substitution graph index"""
+    try:
+        product = request.args.get('product')
+        brand_a = request.args.get('brand_a')
+        brand_b = request.args.get('brand_b')
+        reason = request.args.get('reason')
+        region = request.args.get('region')
+        limit = min(int(request.args.get('limit', 10)), 50)
+        
+        graph = get_index('substitutions', build_substitution_graph)
+        
+        if graph is None:
+            # Mock substitutions
+            used_mock_data()
+            return jsonify({
+                "top_substitutions": [
+                    {"from": "Coca-Cola", "to": "Pepsi", "from_brand": "Coca-Cola", "to_brand": "Pepsi", "count": 234},
+                    {"from": "Lucky Me", "to": "Nissin", "from_brand": "Monde Nissin", "to_brand": "Nissin", "count": 189},
+                    {"from": "Tide", "to": "Surf", "from_brand": "P&G", "to_brand": "Unilever", "count": 156}
+                ],
+                "total": 1500
+            })
+        
+        result = {
+            "top_substitutions": graph.top(limit, reason=reason, region=region),
+            "total": graph.total
+        }
+        if product:
+            result["replacements"] = graph.replacements(product, limit)
+        if brand_a and brand_b:
+            result["brand_switching"] = graph.brand_switching(brand_a, brand_b)
+        
+        return jsonify(result)
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/analytics/baskets', methods=['GET'])
+def get_basket_analytics():
+    """Get frequently-bought-together rules with lift metrics"""
+    try:
+        region = request.args.get('region', 'ALL')
+        category = request.args.get('category')
+        limit = min(int(request.args.get('limit', 20)), 200)
+        
+        rules_query = """
+        SELECT antecedent_name, consequent_name, antecedent_category, consequent_category,
+               pair_count, support, confidence, lift
+        FROM basket_rules
+        WHERE region = ?
+        """
+        params = [region]
+        if category:
+            rules_query += " AND (antecedent_category = ? OR consequent_category = ?)"
+            params.extend([category, category])
+        rules_query += " ORDER BY lift DESC, pair_count DESC LIMIT ?"
+        params.append(limit)
+        
+        rules_data = execute_query(rules_query, tuple(params))
+        
+        if rules_data:
+            rules = [
+                {
+                    "antecedent": row['antecedent_name'],
+                    "consequent": row['consequent_name'],
+                    "antecedent_category": row['antecedent_category'],
+                    "consequent_category": row['consequent_category'],
+                    "count": row['pair_count'],
+                    "support": round(float(row['support']), 4),
+                    "confidence": round(float(row['confidence']), 4),
+                    "lift": round(float(row['lift']), 3)
+                } for row in rules_data
+            ]
+        else:
+            # Mock basket rules
+            used_mock_data()
+            rules = [
+                {"antecedent": "Coke 330ml", "consequent": "Potato Chips", "antecedent_category": "Beverages",
+                 "consequent_category": "Snacks", "count": 412, "support": 0.0275, "confidence": 0.3120, "lift": 2.41},
+                {"antecedent": "Shampoo 200ml", "consequent": "Soap Bar", "antecedent_category": "Personal Care",
+                 "consequent_category": "Personal Care", "count": 289, "support": 0.0193, "confidence": 0.2570, "lift": 1.98},
+                {"antecedent": "Baby Diapers", "consequent": "Baby Wipes", "antecedent_category": "Baby Care",
+                 "consequent_category": "Baby Care", "count": 176, "support": 0.0117, "confidence": 0.4410, "lift": 3.12}
+            ]
+        
+        return jsonify({
+            "rules": rules,
+            "region": region,
+            "category": category
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/analytics/consumers', methods=['GET'])
 def get_consumer_analytics():
     """Get consumer insights analytics"""
@@ -388,7 +1508,27 @@ def get_consumer_analytics():
         ORDER BY count DESC
         """
         
-        age_data = execute_query(age_query)
+        # Store locations from database
+        stores_query = """
+        SELECT store_name as name, city, region, latitude as lat, longitude as lng
+        FROM stores
+        LIMIT 10
+        """
+        
+        star = star_schema()
+        dictionaries = None if star else compact_dictionaries()
+        filters = (request.args.get('date_from'), request.args.get('date_to'), request.args.get('region'))
+        if star:
+            fetch_ages = lambda: get_star_age_groups(*filters)
+        elif dictionaries is not None:
+            fetch_ages = lambda: get_compact_age_groups(dictionaries, *filters)
+        else:
+            fetch_ages = lambda: execute_query(age_query)
+        
+        age_data, stores_data = run_parallel(
+            fetch_ages,
+            lambda: execute_query(stores_query)
+        )
         
         if age_data:
             age_distribution = [
@@ -400,6 +1540,7 @@ def get_consumer_analytics():
             ]
         else:
             # Mock age distribution
+            used_mock_data()
             age_distribution = [
                 {"age_group": "26-35", "count": 4680, "avg_amount": 189.83},
                 {"age_group": "36-45", "count": 4320, "avg_amount": 195.45},
@@ -408,15 +1549,6 @@ def get_consumer_analytics():
                 {"age_group": "55+", "count": 810, "avg_amount": 225.80}
             ]
         
-        # Store locations from database
-        stores_query = """
-        SELECT store_name as name, city, region, latitude as lat, longitude as lng
-        FROM stores
-        LIMIT 10
-        """
-        
-        stores_data = execute_query(stores_query)
-        
         if stores_data:
             store_locations = [
                 {
@@ -429,6 +1561,7 @@ def get_consumer_analytics():
             ]
         else:
             # Mock store locations
+            used_mock_data()
             store_locations = [
                 {"name": "Metro Manila Store", "city": "Manila", "region": "NCR", "lat": 14.5995, "lng": 120.9842},
                 {"name": "Cebu Store", "city": "Cebu", "region": "Central Visayas", "lat": 10.3157, "lng": 123.8854},
@@ -443,6 +1576,159 @@ def get_consumer_analytics():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def build_geo_index():
+    """Build the store grid index from the precomputed store rollups"""
+    preloaded = current_snapshot()
+    if preloaded is not None and preloaded.get('store_rollups') is not None:
+        rows = preloaded.get('store_rollups').rows()
+        return GridIndex(dict(row, lat=row['latitude'], lng=row['longitude']) for row in rows)
+    
+    stores_query = """
+    SELECT store_id, name, city, region, latitude as lat, longitude as lng,
+           transaction_count, revenue
+    FROM store_rollups
+    """
+    
+    stores_data = execute_query(stores_query)
+    
+    if stores_data:
+        return GridIndex(stores_data)
+    
+    # Mock store rollups
+    used_mock_data()
+    return GridIndex([
+        {"name": "Metro Manila Store", "city": "Manila", "region": "NCR", "lat": 14.5995, "lng": 120.9842,
+         "transaction_count": 5970, "revenue": 1133000.00},
+        {"name": "Cebu Store", "city": "Cebu", "region": "Central Visayas", "lat": 10.3157, "lng": 123.8854,
+         "transaction_count": 2250, "revenue": 427000.00},
+        {"name": "Davao Store", "city": "Davao", "region": "Davao Region", "lat": 7.1907, "lng": 125.4553,
+         "transaction_count": 1560, "revenue": 297000.00}
+    ])
+
+@app.route('/api/geo/clusters', methods=['GET'])
+def get_geo_clusters():
+    """Get store clusters with transaction density for the map view"""
+    try:
+        bbox_param = request.args.get('bbox', '-180,-90,180,90')
+        bbox = [float(value) for value in bbox_param.split(',')]
+        if len(bbox) != 4:
+            return jsonify({"error": "bbox must be min_lng,min_lat,max_lng,max_lat"}), 400
+        zoom = int(request.args.get('zoom', 5))
+        max_clusters = min(int(request.args.get('max_clusters', 500)), 2000)
+        
+        index = get_index('geo', build_geo_index)
+        cluster_zoom, clusters = index.clusters(bbox, zoom, max_clusters)
+        
+        return jsonify({
+            "clusters": clusters,
+            "zoom": cluster_zoom,
+            "bbox": bbox,
+            "total_stores": index.store_count
+        })
+        
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def month_offset(cohort_month, activity_month):
+    """Whole months between two YYYY-MM strings"""
+    cohort_year, cohort_mon = (int(part) for part in cohort_month.split('-'))
+    activity_year, activity_mon = (int(part) for part in activity_month.split('-'))
+    return (activity_year - cohort_year) * 12 + (activity_mon - cohort_mon)
+
+@app.route('/api/analytics/cohorts', methods=['GET'])
+def get_cohort_analytics():
+    """Get cohort retention matrix from the precomputed cohort table"""
+    try:
+        region = request.args.get('region', 'ALL')
+        store_id = request.args.get('store_id', 'ALL')
+        if store_id != 'ALL':
+            # Store rows are keyed by the store alone; its region is implied
+            region = 'ALL'
+        
+        cohorts_query = """
+        SELECT cohort_month, activity_month, active_customers, transaction_count, revenue
+        FROM cohort_matrix
+        WHERE region = ? AND store_id = ?
+        ORDER BY cohort_month, activity_month
+        """
+        
+        cohorts_data = execute_query(cohorts_query, (region, store_id))
+        
+        if cohorts_data:
+            cohorts = {}
+            for row in cohorts_data:
+                offset = month_offset(row['cohort_month'], row['activity_month'])
+                if offset < 0:
+                    continue
+                cohort = cohorts.setdefault(row['cohort_month'], {
+                    "cohort": row['cohort_month'],
+                    "size": 0,
+                    "periods": []
+                })
+                if offset == 0:
+                    cohort["size"] = row['active_customers']
+                cohort["periods"].append({
+                    "period": offset,
+                    "month": row['activity_month'],
+                    "active_customers": row['active_customers'],
+                    "transactions": row['transaction_count'],
+                    "revenue": round(float(row['revenue']), 2)
+                })
+            for cohort in cohorts.values():
+                for period in cohort["periods"]:
+                    period["retention"] = round(period["active_customers"] / cohort["size"], 4) if cohort["size"] else None
+            cohort_matrix = list(cohorts.values())
+        else:
+            # Mock cohort matrix
+            used_mock_data()
+            cohort_matrix = [
+                {"cohort": "2025-01", "size": 1200, "periods": [
+                    {"period": 0, "month": "2025-01", "active_customers": 1200, "transactions": 1850, "revenue": 351500.00, "retention": 1.0},
+                    {"period": 1, "month": "2025-02", "active_customers": 540, "transactions": 760, "revenue": 144400.00, "retention": 0.45},
+                    {"period": 2, "month": "2025-03", "active_customers": 410, "transactions": 590, "revenue": 112100.00, "retention": 0.3417}
+                ]},
+                {"cohort": "2025-02", "size": 980, "periods": [
+                    {"period": 0, "month": "2025-02", "active_customers": 980, "transactions": 1490, "revenue": 283100.00, "retention": 1.0},
+                    {"period": 1, "month": "2025-03", "active_customers": 430, "transactions": 610, "revenue": 115900.00, "retention": 0.4388}
+                ]}
+            ]
+        
+        return jsonify({
+            "cohorts": cohort_matrix,
+            "region": region,
+            "store_id": store_id
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/system/memory', methods=['GET'])
+def get_memory_usage():
+    """Per-worker unique and shared resident memory plus snapshot size"""
+    preloaded = current_snapshot()
+    return jsonify({
+        "worker": memory_usage(),
+        "snapshot": preloaded.stats() if preloaded else None,
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Cache warming queue depth, refresh latencies and hit rates"""
+    return jsonify({
+        "cache_warming": warm_cache.stats() if warm_cache else None,
+        "shared_cache": shared_cache.stats() if shared_cache else None,
+        "query_concurrency": limiter_stats(),
+        "replicas": replica_router.stats() if replica_router else None,
+        "partitions": partition_router().stats() if partition_router() else None,
+        "admission": {backend: controller.stats() for backend, controller in admission.items()} if ADMISSION_ENABLED else None,
+        "sqlite": profile_stats() if not (DATABASE_URL and 'mssql' in DATABASE_URL) else None,
+        "compact": compact_dictionaries().stats() if compact_dictionaries() else None,
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/api/ask', methods=['GET'])
 def ask_ai():
     """AI chat endpoint (mock response)"""
@@ -461,6 +1747,10 @@ def ask_ai():
         "timestamp": datetime.now().isoformat()
     })
 
+if PRELOAD_SNAPSHOT:
+    preload_snapshot()
+
 if __name__ == "__main__":
+    start_cache_warming()
     port = int(os.environ.get('PORT', 5000))
-    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,162 @@
+"""
+Scout Analytics - Partitioned SQLite query router
+Prunes month/region partitions by filter, scans them in parallel and merges partial aggregates
+
+Partitions are written by deployment/partition_sqlite.py: one SQLite file
+per month (optionally per month and store region) holding that slice of
+transactions and transaction_items plus a copy of stores, described by
+manifest.json. As in the text queries, a transaction's region is its
+store's region. Each
+partition returns partial aggregates (sums and counts per group, or a
+HyperLogLog sketch for distinct counts) which are merged here; top-K is
+taken after merging so it is exact.
+"""
+
+import contextvars
+import hashlib
+import heapq
+import json
+import math
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+PARTITION_WORKERS = int(os.environ.get('PARTITION_WORKERS', 8))
+
+_executor = ThreadPoolExecutor(max_workers=PARTITION_WORKERS, thread_name_prefix='partition-scan')
+
+def load_manifest(directory):
+    """Partition manifest for a directory, or None when it has not been partitioned"""
+    path = os.path.join(directory, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+class PartitionRouter:
+    """Chooses the partitions a filter can touch and fans queries out over them"""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.partition_by = manifest['partition_by']
+        self.partitions = manifest['partitions']
+
+    def prune(self, date_from=None, date_to=None, region=None):
+        """Partitions whose month (and region, when partitioned by region) can match the filter"""
+        month_from = date_from[:7] if date_from else None
+        month_to = date_to[:7] if date_to else None
+        selected = []
+        for partition in self.partitions:
+            month = partition['month']
+            if month is None:
+                # Undated rows can only match an unbounded date filter
+                if month_from or month_to:
+                    continue
+            elif (month_from and month < month_from) or (month_to and month > month_to):
+                continue
+            if region and self.partition_by == 'month_region' and partition['region'] != region:
+                continue
+            selected.append(partition)
+        return selected
+
+    def where(self, date_from=None, date_to=None, region=None, alias='t'):
+        """WHERE clause and parameters applying the filter inside each partition; region goes through stores"""
+        clause, params = where(date_from, date_to, None, f"{alias}.created_at", None)
+        if region:
+            clause += (" AND " if clause else "WHERE ") + f"{alias}.store_id IN (SELECT store_id FROM stores WHERE region = ?)"
+            params += (region,)
+        return clause, params
+
+    def sketch_where(self, date_from=None, date_to=None, region=None):
+        """The same filter over customer_sketches, whose rows each cover one day and store region"""
+        return where(date_from, date_to, region, 'day', 'region', day_end='')
+
+    def path(self, partition):
+        return os.path.join(self.directory, partition['file'])
+
+    def map(self, partitions, scan):
+        """Run scan(path) for every partition on the worker pool; results in partition order"""
+        futures = [_executor.submit(contextvars.copy_context().run, scan, self.path(partition)) for partition in partitions]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        return {
+            "partition_by": self.partition_by,
+            "partitions": len(self.partitions),
+            "transactions": sum(partition['transactions'] for partition in self.partitions)
+        }
+
+def where(date_from, date_to, region, date_column, region_column, day_end=' 23:59:59'):
+    """WHERE clause and parameters for a range of whole days and a region"""
+    clauses = []
+    params = []
+    if date_from:
+        clauses.append(f"{date_column} >= ?")
+        params.append(date_from[:10])
+    if date_to:
+        clauses.append(f"{date_column} <= ?")
+        params.append(date_to[:10] + day_end)
+    if region:
+        clauses.append(f"{region_column} = ?")
+        params.append(region)
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", tuple(params)
+
+def merge_groups(partials, keys, sums=(), mins=(), maxs=()):
+    """Merge per-partition grouped rows: sums/counts add, mins and maxs combine"""
+    merged = {}
+    for rows in partials:
+        for row in rows or []:
+            group = tuple(row[key] for key in keys)
+            target = merged.get(group)
+            if target is None:
+                merged[group] = dict(row)
+                continue
+            for column in sums:
+                target[column] = (target[column] or 0) + (row[column] or 0)
+            for column in mins:
+                if row[column] is not None and (target[column] is None or row[column] < target[column]):
+                    target[column] = row[column]
+            for column in maxs:
+                if row[column] is not None and (target[column] is None or row[column] > target[column]):
+                    target[column] = row[column]
+    return list(merged.values())
+
+def top_k(rows, column, k):
+    """The k rows with the largest value of column"""
+    return heapq.nlargest(k, rows, key=lambda row: row[column] or 0)
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch"""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value):
+        hashed = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    @classmethod
+    def from_bytes(cls, data, precision=12):
+        """Sketch from the zlib-compressed registers deployment/partition_sqlite.py stores"""
+        self = cls(precision)
+        self.registers = bytearray(zlib.decompress(data))
+        return self
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Small-range correction (linear counting)
+            estimate = self.size * math.log(self.size / zeros)
+        return int(round(estimate))
@@ -0,0 +1,205 @@
+"""
+Scout Analytics - Read-replica routing
+Spreads reads across replica endpoints with health, latency and staleness tracking
+
+Endpoints are ODBC connection strings (e.g. Azure SQL with
+ApplicationIntent=ReadOnly) or sqlite:///path URLs, so the routing can be
+exercised locally with copies of the SQLite database standing in for replicas.
+
+Each endpoint keeps an EWMA of query latency, a count of in-flight queries and
+consecutive failures. Reads go to the better of two randomly sampled eligible
+replicas (power of two choices on latency x load). A replica is ineligible
+until a probe has measured its lag, while it is marked down, or while its data
+watermark trails the primary's by more than the staleness bound; with no
+eligible replica, reads fail back to the primary. A background probe refreshes watermarks and brings recovered
+replicas back into rotation.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime
+
+import pyodbc
+
+from src.sqlite_profile import connect as sqlite_connect
+
+SQLITE_PREFIX = 'sqlite:///'
+
+# Latest transaction timestamp per backend schema; lag is how far a replica's trails the primary's
+WATERMARK_QUERIES = {
+    'mssql': "SELECT MAX(transaction_datetime) AS watermark FROM transactions",
+    'sqlite': "SELECT MAX(created_at) AS watermark FROM transactions"
+}
+
+def connect_url(url, timeout=15):
+    """Open a connection for an ODBC connection string or a sqlite:/// URL"""
+    if url.startswith(SQLITE_PREFIX):
+        return sqlite_connect(url[len(SQLITE_PREFIX):], timeout=timeout)
+    return pyodbc.connect(url, timeout=timeout)
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value)[:19])
+
+def redact(url):
+    """Endpoint label without credentials"""
+    if url.startswith(SQLITE_PREFIX):
+        return url
+    parts = [part for part in url.split(';') if part and not part.strip().lower().startswith(('pwd=', 'password=', 'uid=', 'user id='))]
+    return ';'.join(parts)
+
+class Endpoint:
+    """One database endpoint and its observed health"""
+
+    def __init__(self, url, role, alpha=0.2):
+        self.url = url
+        self.role = role
+        self.alpha = alpha
+        self.latency_ms = None
+        self.in_flight = 0
+        self.failures = 0
+        self.down = False
+        self.watermark = None
+        self.lag_seconds = None
+        self.queries = 0
+        self.errors = 0
+
+    def score(self):
+        latency = self.latency_ms if self.latency_ms is not None else 1.0
+        return latency * (1 + self.in_flight)
+
+    def stats(self):
+        return {
+            "endpoint": redact(self.url),
+            "role": self.role,
+            "down": self.down,
+            "latency_ms": round(self.latency_ms, 2) if self.latency_ms is not None else None,
+            "in_flight": self.in_flight,
+            "lag_seconds": self.lag_seconds if self.lag_seconds != float('inf') else None,
+            "queries": self.queries,
+            "errors": self.errors
+        }
+
+class ReplicaRouter:
+    """Chooses an endpoint for each read and learns from the outcome"""
+
+    def __init__(self, primary_url, replica_urls, max_staleness=60, failure_threshold=3,
+                 probe_interval=15, watermark_query=WATERMARK_QUERIES['mssql']):
+        self.primary = Endpoint(primary_url, 'primary')
+        self.replicas = [Endpoint(url, 'replica') for url in replica_urls]
+        self.max_staleness = max_staleness
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.watermark_query = watermark_query
+        self.failbacks = 0
+        self._lock = threading.Lock()
+        self._probed_at = 0
+        self._probing = False
+
+    def _eligible(self, endpoint):
+        # Replicas join the rotation only once a probe has measured their lag
+        if endpoint.down or endpoint.lag_seconds is None:
+            return False
+        return endpoint.lag_seconds <= self.max_staleness
+
+    def choose(self):
+        """Endpoint for the next read: a healthy, fresh replica, else the primary"""
+        self._maybe_probe()
+        eligible = [endpoint for endpoint in self.replicas if self._eligible(endpoint)]
+        if not eligible:
+            if self.replicas:
+                self.failbacks += 1
+            chosen = self.primary
+        elif len(eligible) == 1:
+            chosen = eligible[0]
+        else:
+            first, second = random.sample(eligible, 2)
+            chosen = first if first.score() <= second.score() else second
+        with self._lock:
+            chosen.in_flight += 1
+        return chosen
+
+    def record(self, endpoint, elapsed_ms, ok):
+        """Fold a finished query into the endpoint's latency and health"""
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.queries += 1
+            if ok:
+                endpoint.failures = 0
+                if endpoint.latency_ms is None:
+                    endpoint.latency_ms = elapsed_ms
+                else:
+                    endpoint.latency_ms += endpoint.alpha * (elapsed_ms - endpoint.latency_ms)
+            else:
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.role == 'replica' and endpoint.failures >= self.failure_threshold:
+                    endpoint.down = True
+
+    def _read_watermark(self, endpoint):
+        conn = connect_url(endpoint.url, timeout=5)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.watermark_query)
+            row = cursor.fetchone()
+            return _as_datetime(row[0] if row else None)
+        finally:
+            conn.close()
+
+    def probe(self):
+        """Refresh watermarks and lag; replicas that answer come back into rotation"""
+        try:
+            primary_mark = self._read_watermark(self.primary)
+            self.primary.watermark = primary_mark
+        except Exception as e:
+            print(f"Replica probe error (primary): {e}")
+            primary_mark = None
+        for endpoint in self.replicas:
+            try:
+                started = time.perf_counter()
+                mark = self._read_watermark(endpoint)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+            except Exception as e:
+                print(f"Replica probe error ({redact(endpoint.url)}): {e}")
+                endpoint.down = True
+                continue
+            with self._lock:
+                endpoint.watermark = mark
+                endpoint.down = False
+                endpoint.failures = 0
+                if endpoint.latency_ms is None:
+                    endpoint.latency_ms = elapsed_ms
+                if primary_mark is None:
+                    # Primary unreachable: staleness cannot be measured, keep serving reads
+                    endpoint.lag_seconds = 0
+                elif mark is None:
+                    endpoint.lag_seconds = float('inf')
+                else:
+                    endpoint.lag_seconds = max((primary_mark - mark).total_seconds(), 0)
+
+    def _maybe_probe(self):
+        """Start a background probe when the last one is older than the probe interval"""
+        if not self.replicas or time.time() - self._probed_at < self.probe_interval:
+            return
+        with self._lock:
+            if self._probing or time.time() - self._probed_at < self.probe_interval:
+                return
+            self._probing = True
+            self._probed_at = time.time()
+
+        def run():
+            try:
+                self.probe()
+            finally:
+                self._probing = False
+
+        threading.Thread(target=run, name='replica-probe', daemon=True).start()
+
+    def stats(self):
+        return {
+            "max_staleness_seconds": self.max_staleness,
+            "failbacks_to_primary": self.failbacks,
+            "endpoints": [self.primary.stats()] + [endpoint.stats() for endpoint in self.replicas]
+        }
@@ -0,0 +1,209 @@
+"""
+Scout Analytics - Shared-memory response cache
+mmap-backed segment shared by every gunicorn worker on the host
+
+Layout: a fixed header followed by two slots. The single refresher writes a
+complete generation into the inactive slot and then flips the header, so
+readers never block and never observe a half-written generation.
+
+    header: magic | generation | active slot
+    slot:   generation | index length | data length | index JSON | data bytes
+
+The index maps cache keys to (offset, length) within the data area and is
+decoded once per generation by each reader; entry bodies are sliced straight
+out of the mapping on lookup.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+MAGIC = 0x53434F5554434831  # "SCOUTCH1"
+HEADER = struct.Struct('<QQQ')
+SLOT_HEADER = struct.Struct('<QQQ')
+HEADER_SIZE = 64
+
+def default_path():
+    """Segment path, preferring tmpfs so the pages never touch disk"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'scout-analytics-cache')
+
+class SharedCache:
+    """Double-buffered, generation-versioned cache segment"""
+
+    def __init__(self, path=None, size_mb=64):
+        self.path = path or default_path()
+        self.size = max(int(size_mb), 1) * 1024 * 1024
+        self.slot_size = (self.size - HEADER_SIZE) // 2
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+        finally:
+            os.close(fd)
+        magic, _, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            HEADER.pack_into(self._map, 0, MAGIC, 0, 0)
+
+        self._lock_file = None
+        self._reader_state = (None, None, None)
+        self.skipped = []
+        self.hits = 0
+        self.misses = 0
+
+    def _slot_offset(self, slot):
+        return HEADER_SIZE + slot * self.slot_size
+
+    def _read_index(self):
+        """Decode the active generation's index, reusing it while the generation is unchanged"""
+        for _ in range(3):
+            _, generation, slot = HEADER.unpack_from(self._map, 0)
+            if generation == 0:
+                return None, None, None
+            if generation == self._reader_state[0]:
+                return self._reader_state
+            offset = self._slot_offset(slot)
+            slot_generation, index_length, _ = SLOT_HEADER.unpack_from(self._map, offset)
+            if slot_generation != generation:
+                continue
+            start = offset + SLOT_HEADER.size
+            index = json.loads(self._map[start:start + index_length])
+            if SLOT_HEADER.unpack_from(self._map, offset)[0] != generation:
+                continue
+            self._reader_state = (generation, slot, index)
+            return self._reader_state
+        return None, None, None
+
+    def get(self, key, version=None):
+        """Return the cached bytes for key, or None on a miss or a dataset version mismatch"""
+        generation, slot, index = self._read_index()
+        if index is None or index.get('__version__') != version:
+            self.misses += 1
+            return None
+        entry = index['entries'].get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        offset = self._slot_offset(slot)
+        _, index_length, _ = SLOT_HEADER.unpack_from(self._map, offset)
+        start = offset + SLOT_HEADER.size + index_length + entry[0]
+        body = self._map[start:start + entry[1]]
+        # A slot is only rewritten two flips later; check it was not reused mid-copy
+        if SLOT_HEADER.unpack_from(self._map, offset)[0] != generation:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body
+
+    def _layout(self, entries, version):
+        data = bytearray()
+        positions = {}
+        for key, body in entries.items():
+            positions[key] = (len(data), len(body))
+            data.extend(body)
+        index = json.dumps({'__version__': version, 'entries': positions}).encode()
+        return index, data
+
+    def publish(self, entries, version=None):
+        """Write a complete generation of key -> bytes entries and make it visible atomically
+
+        Entries that do not fit in a slot are left out, largest first; their
+        keys are kept in self.skipped and miss until a later generation fits.
+        """
+        entries = dict(entries)
+        skipped = []
+        index, data = self._layout(entries, version)
+        while SLOT_HEADER.size + len(index) + len(data) > self.slot_size:
+            largest = max(entries, key=lambda key: len(entries[key]))
+            skipped.append(largest)
+            del entries[largest]
+            index, data = self._layout(entries, version)
+        self.skipped = skipped
+
+        _, generation, slot = HEADER.unpack_from(self._map, 0)
+        target = 1 - slot if generation else 0
+        new_generation = generation + 1
+        offset = self._slot_offset(target)
+
+        SLOT_HEADER.pack_into(self._map, offset, 0, len(index), len(data))
+        start = offset + SLOT_HEADER.size
+        self._map[start:start + len(index)] = index
+        self._map[start + len(index):start + len(index) + len(data)] = data
+        SLOT_HEADER.pack_into(self._map, offset, new_generation, len(index), len(data))
+        HEADER.pack_into(self._map, 0, MAGIC, new_generation, target)
+        return new_generation
+
+    def try_become_refresher(self):
+        """Take the host-wide refresher lock; only one process holds it at a time"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def stats(self):
+        _, generation, slot = HEADER.unpack_from(self._map, 0)
+        index = self._reader_state[2]
+        return {
+            "path": self.path,
+            "size_bytes": self.size,
+            "generation": generation,
+            "active_slot": slot,
+            "entries": len(index['entries']) if index else 0,
+            "refresher": self._lock_file is not None,
+            "skipped": self.skipped,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+def start_refresher(cache, render, keys, version, interval=300, poll=5):
+    """Run the refresher loop in a daemon thread of whichever worker wins the lock
+
+    render(key) returns the bytes to cache for key (or None to skip it), and
+    version() returns the current dataset version. A new generation is
+    published every interval seconds, or as soon as the version changes.
+    Workers that lose the election keep retrying so a replacement takes over
+    if the refresher process exits.
+    """
+    def loop():
+        published_at = 0
+        published_version = None
+        while True:
+            if cache.try_become_refresher():
+                current = version()
+                if current != published_version or time.time() - published_at >= interval:
+                    entries = {}
+                    for key in keys:
+                        try:
+                            body = render(key)
+                        except Exception as e:
+                            print(f"Shared cache refresh error for {key}: {e}")
+                            body = None
+                        if body is not None:
+                            entries[key] = body
+                    try:
+                        cache.publish(entries, current)
+                        if cache.skipped:
+                            print(f"Shared cache: {len(cache.skipped)} entries too large for a slot: "
+                                  f"{', '.join(cache.skipped)}")
+                    except Exception as e:
+                        print(f"Shared cache publish error: {e}")
+                    # Recorded even on failure, so a bad generation waits for the next interval
+                    published_at, published_version = time.time(), current
+            time.sleep(poll)
+
+    thread = threading.Thread(target=loop, name='shared-cache-refresher', daemon=True)
+    thread.start()
+    return thread
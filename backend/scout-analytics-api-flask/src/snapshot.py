@@ -0,0 +1,207 @@
+"""
+Scout Analytics - Preloaded aggregate snapshot
+Dimension tables and rollups held as NumPy columns for copy-on-write sharing
+
+Loaded once in the gunicorn master (preload_app) before workers fork. Each
+column is one contiguous NumPy buffer and strings are dictionary-encoded into
+integer codes plus a single tuple of distinct values, so there are no
+per-row Python objects whose reference counts would dirty shared pages.
+Combined with gc.freeze() in the master (see gunicorn.conf.py), workers keep
+reading the master's pages instead of copying them.
+
+When the loader exported the tables (load_to_sqlite.py --snapshot writes
+snapshot/<table>.arrow next to the database) and pyarrow is installed, the
+columns are memory-mapped from those Arrow IPC files instead of queried:
+startup does no decoding, and the pages are file-backed, so every worker
+shares them through the page cache. Otherwise, with the shared-memory cache
+on, the refresher publishes each table's arrays into the segment, and a
+worker reloading after a dataset switch copies them from there instead of
+querying the database again.
+"""
+
+import io
+import json
+import os
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+DEFAULT_TABLES = ['stores', 'products', 'brands', 'store_rollups', 'time_rollups']
+
+class ColumnTable:
+    """Column-oriented, dictionary-encoded copy of a table"""
+
+    def __init__(self, name, rows):
+        self.name = name
+        self.length = len(rows)
+        self.columns = {}
+        self.dictionaries = {}
+        names = list(rows[0].keys()) if rows else []
+        for column in names:
+            values = [row[column] for row in rows]
+            present = [value for value in values if value is not None]
+            if present and all(isinstance(value, (int, bool)) for value in present) and len(present) == len(values):
+                self.columns[column] = np.array(values, dtype=np.int64)
+            elif present and all(isinstance(value, (int, float)) for value in present):
+                self.columns[column] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+            else:
+                distinct = sorted({str(value) for value in present})
+                lookup = {value: code for code, value in enumerate(distinct)}
+                codes = np.array([-1 if value is None else lookup[str(value)] for value in values], dtype=np.int32)
+                self.columns[column] = codes
+                self.dictionaries[column] = tuple(distinct)
+        for array in self.columns.values():
+            array.flags.writeable = False
+
+    @classmethod
+    def from_arrow(cls, name, table):
+        """Wrap an Arrow table already encoded like __init__ would, without copying"""
+        self = cls.__new__(cls)
+        self.name = name
+        self.length = table.num_rows
+        self.columns = {}
+        self.dictionaries = {}
+        for column, chunked in zip(table.column_names, table.columns):
+            array = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+            if pa.types.is_dictionary(array.type):
+                self.dictionaries[column] = tuple(array.dictionary.to_pylist())
+                array = array.indices.fill_null(-1) if array.null_count else array.indices
+            self.columns[column] = array.to_numpy(zero_copy_only=False)
+        for array in self.columns.values():
+            if array.flags.writeable:
+                array.flags.writeable = False
+        return self
+
+    @classmethod
+    def from_bytes(cls, name, data):
+        """Rebuild a table serialized by to_bytes"""
+        self = cls.__new__(cls)
+        self.name = name
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            self.dictionaries = {column: tuple(values)
+                                 for column, values in json.loads(str(arrays['__dictionaries__'])).items()}
+            self.columns = {column: arrays[column] for column in arrays.files if column != '__dictionaries__'}
+        self.length = len(next(iter(self.columns.values()))) if self.columns else 0
+        for array in self.columns.values():
+            array.flags.writeable = False
+        return self
+
+    def to_bytes(self):
+        """Columns and dictionaries as an .npz archive, for the shared-memory cache"""
+        buffer = io.BytesIO()
+        np.savez(buffer, __dictionaries__=np.array(json.dumps(self.dictionaries)), **self.columns)
+        return buffer.getvalue()
+
+    def value(self, column, position):
+        """Decoded value of one cell"""
+        raw = self.columns[column][position]
+        dictionary = self.dictionaries.get(column)
+        if dictionary is not None:
+            return dictionary[raw] if raw >= 0 else None
+        if raw.dtype.kind == 'f' and np.isnan(raw):
+            return None
+        return raw.item()
+
+    def rows(self):
+        """Decode back into row dicts (allocates; use on cold paths only)"""
+        for position in range(self.length):
+            yield {column: self.value(column, position) for column in self.columns}
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.columns.values())
+
+class AggregateSnapshot:
+    """Set of ColumnTables captured at one dataset version"""
+
+    def __init__(self, version, tables, mapped=(), shared=()):
+        self.version = version
+        self.tables = tables
+        self.mapped = set(mapped)
+        self.shared = set(shared)
+
+    def get(self, name):
+        return self.tables.get(name)
+
+    def stats(self):
+        return {
+            "version": str(self.version),
+            "tables": {
+                name: {"rows": table.length, "bytes": table.nbytes, "mapped": name in self.mapped,
+                       "shared": name in self.shared}
+                for name, table in self.tables.items()
+            },
+            "total_bytes": sum(table.nbytes for table in self.tables.values())
+        }
+
+def mapped_tables(directory, database_path):
+    """Exported Arrow files usable for this database: {table: path}, empty when stale or unavailable"""
+    if pa is None or not directory:
+        return {}
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest.get('database_bytes') != os.path.getsize(database_path):
+            return {}
+    except (OSError, ValueError):
+        return {}
+    return {
+        name: os.path.join(directory, f"{name}.arrow") for name in manifest.get('tables', {})
+        if os.path.exists(os.path.join(directory, f"{name}.arrow"))
+    }
+
+def map_table(name, path):
+    """ColumnTable over a memory-mapped Arrow IPC file"""
+    source = pa.memory_map(path, 'r')
+    return ColumnTable.from_arrow(name, pa.ipc.open_file(source).read_all())
+
+def load_snapshot(fetch_rows, version, tables=None, mapped=None, shared=None):
+    """Build a snapshot; fetch_rows(table) returns a list of row dicts or None
+
+    Tables in mapped ({table: path}, see mapped_tables) are memory-mapped
+    rather than fetched. Otherwise shared(table), when given, returns the
+    to_bytes form of the table from the shared-memory cache, or None.
+    """
+    loaded = {}
+    mapped_names = []
+    shared_names = []
+    for name in tables or DEFAULT_TABLES:
+        if mapped and name in mapped:
+            try:
+                loaded[name] = map_table(name, mapped[name])
+                mapped_names.append(name)
+                continue
+            except (OSError, pa.ArrowException) as e:
+                print(f"Snapshot file {mapped[name]} unusable, querying {name}: {e}")
+        data = shared(name) if shared else None
+        if data is not None:
+            loaded[name] = ColumnTable.from_bytes(name, data)
+            shared_names.append(name)
+            continue
+        rows = fetch_rows(name)
+        if rows:
+            loaded[name] = ColumnTable(name, rows)
+    return AggregateSnapshot(version, loaded, mapped_names, shared_names)
+
+def memory_usage():
+    """Unique and shared resident memory of this process from /proc/self/smaps_rollup"""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": fields.get('Rss', 0),
+        "pss_bytes": fields.get('Pss', 0),
+        "unique_bytes": fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        "shared_bytes": fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)
+    }
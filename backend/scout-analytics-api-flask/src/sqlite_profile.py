@@ -0,0 +1,191 @@
+"""
+Scout Analytics - SQLite read profile
+Read-optimized SQLite connections: WAL, mmap, large page cache, query_only, reused per thread
+
+SQLITE_PROFILE=default keeps the original behaviour (a fresh read-write
+connection per query). SQLITE_PROFILE=read opens each database once per
+thread and keeps it: the connection's page cache, mmap and prepared
+statement cache (cached_statements) survive across queries instead of being
+rebuilt on every call. Published blue/green versions and their partitions
+(anything under a versions/ directory) are never written again, so they are
+opened with immutable=1 and skip locking and change detection entirely;
+other files are switched to WAL once so readers never block on a writer.
+After a blue/green flip the previous version directory is retired: each
+thread closes its pooled connections into it the next time it connects,
+and requests still draining on it get unpooled connections.
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'read').lower()
+SQLITE_CACHE_KB = int(os.environ.get('SQLITE_CACHE_KB', 65536))
+SQLITE_MMAP_MAX_MB = int(os.environ.get('SQLITE_MMAP_MAX_MB', 1024))
+SQLITE_CACHED_STATEMENTS = int(os.environ.get('SQLITE_CACHED_STATEMENTS', 256))
+SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 16))
+# auto: immutable for files under versions/ (frozen once published); true/false force it
+SQLITE_IMMUTABLE = os.environ.get('SQLITE_IMMUTABLE', 'auto').lower()
+
+MMAP_ALIGN = 1 << 20
+
+_local = threading.local()
+_wal_checked = set()
+_wal_lock = threading.Lock()
+_stats = {"opened": 0, "reused": 0, "evicted": 0, "retired": 0}
+_stats_lock = threading.Lock()
+# Connections inherited across fork: never touched or closed in the child
+_orphaned = []
+# Version directories replaced by a flip; bumping the generation makes threads sweep their pools
+_retired = set()
+_retired_generation = 0
+_retired_lock = threading.Lock()
+
+class PooledConnection(sqlite3.Connection):
+    """Connection whose close() hands it back to its thread's pool"""
+
+    pooled = False
+
+    def close(self):
+        if not self.pooled:
+            super().close()
+            return
+        # Budgets install a progress handler per query; don't leak one into the next
+        self.set_progress_handler(None, 0)
+        if self.in_transaction:
+            self.rollback()
+
+    def discard(self):
+        self.pooled = False
+        super().close()
+
+def is_frozen(path):
+    """Whether the file may be opened immutable"""
+    if SQLITE_IMMUTABLE in ('true', '1', 'yes'):
+        return True
+    if SQLITE_IMMUTABLE in ('false', '0', 'no'):
+        return False
+    return 'versions' in os.path.realpath(path).split(os.sep)[:-1]
+
+def version_directory(path):
+    """The versions/<ts> directory a published database lives in, or None"""
+    directory = os.path.dirname(os.path.realpath(path))
+    return directory if os.path.basename(os.path.dirname(directory)) == 'versions' else None
+
+def retire_version(previous, current):
+    """Note a flip from the database previous to current; pooled connections into previous's version close"""
+    global _retired_generation
+    with _retired_lock:
+        _retired.discard(version_directory(current))
+        if version_directory(previous):
+            _retired.add(version_directory(previous))
+        _retired_generation += 1
+
+def is_retired(path):
+    """Whether path (a database or one of its partitions) lies in a retired version directory"""
+    real = os.path.realpath(path)
+    return any(real.startswith(directory + os.sep) for directory in _retired)
+
+def mmap_size(path):
+    """Map the whole database, rounded up to 1 MiB and capped at SQLITE_MMAP_MAX_MB"""
+    size = os.path.getsize(path)
+    size = (size + MMAP_ALIGN - 1) // MMAP_ALIGN * MMAP_ALIGN
+    return min(size, SQLITE_MMAP_MAX_MB * MMAP_ALIGN)
+
+def ensure_wal(path):
+    """Switch a writable database to WAL once per process (persisted in the file)"""
+    if path in _wal_checked:
+        return
+    with _wal_lock:
+        if path in _wal_checked:
+            return
+        try:
+            conn = sqlite3.connect(path, timeout=5)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # Read-only filesystem or a writer holding the lock; the rollback journal still works
+            print(f"SQLite WAL unavailable for {path}: {e}")
+        _wal_checked.add(path)
+
+def open_read(path, timeout=15):
+    """New connection with the read profile applied"""
+    frozen = is_frozen(path)
+    if frozen:
+        uri = f"file:{path}?immutable=1"
+    else:
+        ensure_wal(path)
+        uri = f"file:{path}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=timeout, factory=PooledConnection,
+                           cached_statements=SQLITE_CACHED_STATEMENTS, check_same_thread=True)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={mmap_size(path)}")
+    conn.execute("PRAGMA query_only=ON")
+    with _stats_lock:
+        _stats["opened"] += 1
+    return conn
+
+def _pool():
+    """This thread's connections, dropped (not closed) if inherited across fork"""
+    pool = getattr(_local, 'pool', None)
+    if pool is None or _local.pid != os.getpid():
+        if pool is not None:
+            _orphaned.extend(pool.values())
+        pool = _local.pool = OrderedDict()
+        _local.pid = os.getpid()
+    return pool
+
+def connect(path, timeout=15):
+    """Connection to a SQLite file for reads, following SQLITE_PROFILE"""
+    if SQLITE_PROFILE != 'read':
+        conn = sqlite3.connect(path, timeout=timeout)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    stat = os.stat(path)
+    # A file rewritten in place (new inode or mtime) gets a new connection
+    key = (path, stat.st_dev, stat.st_ino, stat.st_mtime_ns)
+    pool = _pool()
+    if getattr(_local, 'generation', 0) != _retired_generation:
+        _local.generation = _retired_generation
+        for retired in [k for k in pool if is_retired(k[0])]:
+            pool.pop(retired).discard()
+            with _stats_lock:
+                _stats["retired"] += 1
+    if _retired and is_retired(path):
+        # A request still pinned to the previous version; its connection closes with the query
+        return open_read(path, timeout)
+    conn = pool.get(key)
+    if conn is not None:
+        pool.move_to_end(key)
+        with _stats_lock:
+            _stats["reused"] += 1
+        return conn
+
+    for stale in [k for k in pool if k[0] == path]:
+        pool.pop(stale).discard()
+    conn = open_read(path, timeout)
+    conn.pooled = True
+    pool[key] = conn
+    while len(pool) > SQLITE_POOL_SIZE:
+        _, evicted = pool.popitem(last=False)
+        evicted.discard()
+        with _stats_lock:
+            _stats["evicted"] += 1
+    return conn
+
+def profile_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "profile": SQLITE_PROFILE,
+        "cache_kb": SQLITE_CACHE_KB,
+        "mmap_max_mb": SQLITE_MMAP_MAX_MB,
+        "cached_statements": SQLITE_CACHED_STATEMENTS,
+        "immutable": SQLITE_IMMUTABLE
+    })
+    return stats
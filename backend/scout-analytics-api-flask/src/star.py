@@ -0,0 +1,34 @@
+"""
+Scout Analytics - Star schema queries
+Filters over fact_sales_line, the pre-joined line-grain table of deployment/star_schema.py
+
+Transaction-level measures sit on each transaction's first line
+(transaction_count = 1), and both partial covering indexes are keyed on
+date_key (YYYYMMDDHH), so every endpoint query is a single-table index scan;
+trends joins dim_date on date_key only after summing the lines per hour.
+"""
+
+STAR_MARKER_QUERY = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'fact_sales_line'"
+
+# Conditions that select each partial index; queries must repeat them verbatim
+TRANSACTION_LINES = "transaction_count = 1"
+PRODUCT_LINES = "product_id IS NOT NULL"
+
+def date_key(value, end=False):
+    """YYYYMMDDHH key for the first (or last) hour of an ISO date"""
+    return int(value[:10].replace('-', '')) * 100 + (23 if end else 0)
+
+def where(date_from=None, date_to=None, region=None, lines=TRANSACTION_LINES):
+    """WHERE clause and parameters for fact_sales_line; region is the store's region, as in the text queries"""
+    clauses = [lines]
+    params = []
+    if date_from:
+        clauses.append("date_key >= ?")
+        params.append(date_key(date_from))
+    if date_to:
+        clauses.append("date_key <= ?")
+        params.append(date_key(date_to, end=True))
+    if region:
+        clauses.append("store_region = ?")
+        params.append(region)
+    return "WHERE " + " AND ".join(clauses), tuple(params)
@@ -0,0 +1,169 @@
+"""
+Scout Analytics - Substitution graph index
+Holds original -> substituted product edges as compact adjacency arrays
+"""
+
+from array import array
+
+class SubstitutionGraph:
+    """CSR adjacency over substitution edges with per-reason, per-region and per-(reason, region) counts
+
+    Products, reasons and regions are interned to dense integers. Edges are
+    grouped by original product and sorted by count, so "what replaces X" is a
+    slice of the targets array. Top-N lists and brand-to-brand flows are
+    precomputed at build time.
+    """
+
+    def __init__(self, edge_rows, top_n=50):
+        self.product_ids = []
+        self.product_names = []
+        self.product_brands = []
+        self.reasons = []
+        self.regions = []
+        product_index = {}
+        reason_index = {}
+        region_index = {}
+
+        def intern(values, index, value):
+            position = index.get(value)
+            if position is None:
+                position = index[value] = len(values)
+                values.append(value)
+            return position
+
+        def intern_product(product_id, name, brand):
+            position = intern(self.product_ids, product_index, product_id)
+            if position == len(self.product_names):
+                self.product_names.append(name)
+                self.product_brands.append(brand)
+                name_index.setdefault(name, position)
+            return position
+
+        # Collapse rows (one per edge x reason x region) into edges
+        name_index = {}
+        edges = {}
+        for row in edge_rows:
+            source = intern_product(row['original_product_id'], row['original_name'], row['original_brand'])
+            target = intern_product(row['substituted_product_id'], row['substituted_name'], row['substituted_brand'])
+            reason = intern(self.reasons, reason_index, row['reason'])
+            region = intern(self.regions, region_index, row['region'])
+            edge = edges.setdefault((source, target), [0, {}, {}, {}])
+            count = int(row['count'])
+            edge[0] += count
+            edge[1][reason] = edge[1].get(reason, 0) + count
+            edge[2][region] = edge[2].get(region, 0) + count
+            edge[3][(reason, region)] = edge[3].get((reason, region), 0) + count
+
+        self._product_index = product_index
+        self._name_index = name_index
+        self._reason_index = reason_index
+        self._region_index = region_index
+
+        ordered = sorted(edges.items(), key=lambda item: (item[0][0], -item[1][0]))
+        n_reasons = len(self.reasons)
+        n_regions = len(self.regions)
+        self.offsets = array('l', [0] * (len(self.product_ids) + 1))
+        self.targets = array('l')
+        self.counts = array('l')
+        self.reason_counts = array('l', [0] * (len(ordered) * n_reasons))
+        self.region_counts = array('l', [0] * (len(ordered) * n_regions))
+
+        brand_flows = {}
+        # Reason x region counts are sparse, so they stay as per-pair (position, count) lists
+        by_pair = {}
+        for position, ((source, target), (count, by_reason, by_region, by_reason_region)) in enumerate(ordered):
+            self.offsets[source + 1] += 1
+            self.targets.append(target)
+            self.counts.append(count)
+            for reason, reason_count in by_reason.items():
+                self.reason_counts[position * n_reasons + reason] = reason_count
+            for region, region_count in by_region.items():
+                self.region_counts[position * n_regions + region] = region_count
+            for pair, pair_count in by_reason_region.items():
+                by_pair.setdefault(pair, []).append((position, pair_count))
+            brands = (self.product_brands[source], self.product_brands[target])
+            if brands[0] != brands[1]:
+                brand_flows[brands] = brand_flows.get(brands, 0) + count
+        for source in range(len(self.product_ids)):
+            self.offsets[source + 1] += self.offsets[source]
+        self._sources = array('l', [0] * len(ordered))
+        for source in range(len(self.product_ids)):
+            for position in range(self.offsets[source], self.offsets[source + 1]):
+                self._sources[position] = source
+
+        self.brand_flows = brand_flows
+        self.edge_count = len(ordered)
+        self.total = sum(self.counts)
+
+        # Precompute top lists overall, per reason and per region
+        self._top = {None: self._top_edges(self.counts, 1, 0, top_n)}
+        for reason in range(n_reasons):
+            self._top[('reason', reason)] = self._top_edges(self.reason_counts, n_reasons, reason, top_n)
+        for region in range(n_regions):
+            self._top[('region', region)] = self._top_edges(self.region_counts, n_regions, region, top_n)
+        for (reason, region), pair_edges in by_pair.items():
+            pair_edges.sort(key=lambda item: item[1], reverse=True)
+            self._top[('reason_region', reason, region)] = pair_edges[:top_n]
+
+    def _top_edges(self, counts, stride, offset, top_n):
+        ranked = sorted(
+            (position for position in range(self.edge_count) if counts[position * stride + offset]),
+            key=lambda position: counts[position * stride + offset],
+            reverse=True
+        )
+        return [(position, counts[position * stride + offset]) for position in ranked[:top_n]]
+
+    def _edge(self, position, count):
+        source = self._sources[position]
+        target = self.targets[position]
+        return {
+            "from": self.product_names[source],
+            "to": self.product_names[target],
+            "from_brand": self.product_brands[source],
+            "to_brand": self.product_brands[target],
+            "count": count
+        }
+
+    def top(self, limit=5, reason=None, region=None):
+        """Most frequent substitutions, optionally for one reason, one region or both"""
+        if reason is not None and region is not None:
+            key = ('reason_region', self._reason_index.get(reason), self._region_index.get(region))
+        elif reason is not None:
+            key = ('reason', self._reason_index.get(reason))
+        elif region is not None:
+            key = ('region', self._region_index.get(region))
+        else:
+            key = None
+        return [self._edge(position, count) for position, count in self._top.get(key, [])[:limit]]
+
+    def replacements(self, product, limit=10):
+        """Products that replace the given product id or name, most frequent first"""
+        source = self._product_index.get(product)
+        if source is None:
+            source = self._name_index.get(product)
+        if source is None:
+            return []
+        start, end = self.offsets[source], self.offsets[source + 1]
+        n_reasons = len(self.reasons)
+        results = []
+        for position in range(start, min(end, start + limit)):
+            edge = self._edge(position, self.counts[position])
+            edge["reasons"] = {
+                self.reasons[reason]: self.reason_counts[position * n_reasons + reason]
+                for reason in range(n_reasons)
+                if self.reason_counts[position * n_reasons + reason]
+            }
+            results.append(edge)
+        return results
+
+    def brand_switching(self, brand_a, brand_b):
+        """Net substitutions from brand_a to brand_b (negative means towards brand_a)"""
+        a_to_b = self.brand_flows.get((brand_a, brand_b), 0)
+        b_to_a = self.brand_flows.get((brand_b, brand_a), 0)
+        return {
+            "brand_a": brand_a,
+            "brand_b": brand_b,
+            "a_to_b": a_to_b,
+            "b_to_a": b_to_a,
+            "net": a_to_b - b_to_a
+        }
@@ -0,0 +1,235 @@
+"""
+Scout Analytics - Cache warming and stale-while-revalidate
+Per-worker response cache refreshed in the background from an access log of popular filters
+
+Every cacheable GET is recorded in an access log keyed by its filter
+fingerprint (the normalized path and query). On startup and whenever the
+dataset version changes, the scheduler queues the most popular fingerprints
+for rendering, so the first dashboard hit after a deploy or data load is
+already cached. Entries past their TTL are still served while a refresh is
+queued; only entries past the stale limit, or from another dataset version,
+fall through to a live query.
+"""
+
+import fcntl
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+class AccessLog:
+    """Counts requests per filter fingerprint and persists the counts between restarts
+
+    Every worker shares one file: save() adds the requests recorded since the
+    last save to what is on disk under a file lock, so workers do not
+    overwrite each other's counts.
+    """
+
+    def __init__(self, path=None, capacity=5000):
+        self.path = path
+        self.capacity = capacity
+        self.counts = Counter()
+        self._unsaved = Counter()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.counts.update(self._read())
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return Counter(json.load(f))
+        except FileNotFoundError:
+            return Counter()
+        except (OSError, ValueError) as e:
+            print(f"Access log load error: {e}")
+            return Counter()
+
+    def _trim(self, counts):
+        # Keep the log bounded by dropping the long tail
+        if len(counts) > self.capacity * 2:
+            return Counter(dict(counts.most_common(self.capacity)))
+        return counts
+
+    def record(self, key):
+        with self._lock:
+            self.counts[key] += 1
+            self._unsaved[key] += 1
+            self.counts = self._trim(self.counts)
+            self._unsaved = self._trim(self._unsaved)
+
+    def top(self, n):
+        with self._lock:
+            return [key for key, _ in self.counts.most_common(n)]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, Counter()
+        try:
+            with open(f"{self.path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                merged = self._read()
+                merged.update(unsaved)
+                data = dict(merged.most_common(self.capacity))
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w') as f:
+                    json.dump(data, f)
+                os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Access log save error: {e}")
+            with self._lock:
+                self._unsaved.update(unsaved)
+            return
+        # Pick up what the other workers recorded, plus anything counted meanwhile
+        with self._lock:
+            self.counts = Counter(data) + self._unsaved
+
+class WarmCache:
+    """Response cache with stale-while-revalidate and a background refresh queue"""
+
+    def __init__(self, render, ttl_for, max_stale=3600, workers=2, max_entries=1000, latency_samples=500):
+        self.render = render
+        self.ttl_for = ttl_for
+        self.max_stale = max_stale
+        self.workers = workers
+        self.max_entries = max_entries
+        # Least recently used first; put() evicts from the front past max_entries
+        self.entries = OrderedDict()
+        self.queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._entries_lock = threading.Lock()
+        self.latencies = deque(maxlen=latency_samples)
+        self.in_flight = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshed = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """Cached body for key, scheduling a refresh when it is past its TTL"""
+        with self._entries_lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None or entry[1] != version:
+            self.misses += 1
+            return None
+        body, _, fetched_at = entry
+        age = time.time() - fetched_at
+        if age <= self.ttl_for(key):
+            self.hits += 1
+            return body
+        if age <= self.ttl_for(key) + self.max_stale:
+            self.stale_hits += 1
+            self.enqueue(key, version)
+            return body
+        self.misses += 1
+        return None
+
+    def peek(self, key):
+        """Last body stored for key regardless of age or dataset version"""
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def put(self, key, body, version):
+        with self._entries_lock:
+            self.entries[key] = (body, version, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def enqueue(self, key, version):
+        """Queue a refresh unless one is already pending for key"""
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending.add(key)
+        self.queue.put((key, version))
+        return True
+
+    def _refresh(self, key, version):
+        started = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            body = self.render(key)
+            if body is None:
+                self.failures += 1
+            else:
+                self.put(key, body, version)
+                self.refreshed += 1
+        except Exception as e:
+            print(f"Cache refresh error for {key}: {e}")
+            self.failures += 1
+        finally:
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            with self._lock:
+                self.in_flight -= 1
+                self._pending.discard(key)
+
+    def _work(self):
+        while True:
+            key, version = self.queue.get()
+            self._refresh(key, version)
+            self.queue.task_done()
+
+    def start(self):
+        for number in range(self.workers):
+            threading.Thread(target=self._work, name=f'cache-refresh-{number}', daemon=True).start()
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2) if latencies else None
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "queue_depth": self.queue.qsize(),
+            "in_flight": self.in_flight,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+            "refresh_latency_ms": {
+                "samples": len(latencies),
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1], 2) if latencies else None
+            }
+        }
+
+def start_warming(cache, access_log, base_keys, version, top_n=50, poll=5, save_every=60):
+    """Start the refresh workers and a scheduler that warms popular keys per dataset version
+
+    base_keys are always warmed (the unfiltered dashboard views); the access
+    log supplies the top_n most requested fingerprints on top of those.
+    """
+    cache.start()
+
+    def loop():
+        warmed_version = object()
+        saved_at = time.time()
+        while True:
+            current = version()
+            if current != warmed_version:
+                keys = list(dict.fromkeys(list(base_keys) + access_log.top(top_n)))
+                for key in keys:
+                    cache.enqueue(key, current)
+                warmed_version = current
+            if time.time() - saved_at >= save_every:
+                access_log.save()
+                saved_at = time.time()
+            time.sleep(poll)
+
+    thread = threading.Thread(target=loop, name='cache-warming', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Precomputed Aggregate Builder
+Builds rollup tables the API serves from instead of scanning the fact tables
+"""
+
+import argparse
+import sqlite3
+from pathlib import Path
+
+from star_schema import build_star_schema, refresh_star_schema
+
+STORE_ROLLUPS_SELECT = '''
+SELECT s.store_id, s.name, s.city, s.region, s.latitude, s.longitude,
+       COUNT(t.transaction_id), COALESCE(SUM(t.total_amount), 0)
+FROM stores s
+LEFT JOIN transactions t ON t.store_id = s.store_id
+WHERE s.latitude IS NOT NULL AND s.longitude IS NOT NULL {where}
+GROUP BY s.store_id
+'''
+
+def build_store_rollups(conn):
+    """Build per-store transaction counts and revenue with coordinates for the map layers"""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS store_rollups")
+    cursor.execute('''
+    CREATE TABLE store_rollups (
+        store_id TEXT PRIMARY KEY,
+        name TEXT,
+        city TEXT,
+        region TEXT,
+        latitude REAL,
+        longitude REAL,
+        transaction_count INTEGER,
+        revenue REAL
+    )
+    ''')
+    cursor.execute("INSERT INTO store_rollups " + STORE_ROLLUPS_SELECT.format(where=''))
+    count = cursor.execute("SELECT COUNT(*) FROM store_rollups").fetchone()[0]
+    print(f"✅ Built store_rollups: {count:,} stores")
+    return count
+
+def refresh_store_rollups(conn, store_ids):
+    """Recompute the rollup rows of just the given stores"""
+    cursor = conn.cursor()
+    store_ids = [store_id for store_id in store_ids if store_id is not None]
+    for start in range(0, len(store_ids), 500):
+        batch = store_ids[start:start + 500]
+        placeholders = ', '.join('?' for _ in batch)
+        cursor.execute(f"DELETE FROM store_rollups WHERE store_id IN ({placeholders})", batch)
+        cursor.execute("INSERT INTO store_rollups " + STORE_ROLLUPS_SELECT.format(
+            where=f"AND s.store_id IN ({placeholders})"), batch)
+    print(f"✅ Refreshed store_rollups: {len(store_ids):,} stores")
+    return len(store_ids)
+
+SUBSTITUTION_EDGES_SELECT = '''
+SELECT sub.original_product_id, sub.substituted_product_id,
+       po.name, ps.name, po.brand_name, ps.brand_name,
+       COALESCE(sub.reason, 'unknown'), COALESCE(t.region, 'Unknown'), COUNT(*)
+FROM substitutions sub
+LEFT JOIN products po ON po.id = sub.original_product_id
+LEFT JOIN products ps ON ps.id = sub.substituted_product_id
+LEFT JOIN transactions t ON t.transaction_id = sub.transaction_id
+{where}
+GROUP BY sub.original_product_id, sub.substituted_product_id,
+         COALESCE(sub.reason, 'unknown'), COALESCE(t.region, 'Unknown')
+'''
+
+def build_substitution_edges(conn):
+    """Build substitution edge counts per reason and region for the substitution graph"""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS substitution_edges")
+    cursor.execute('''
+    CREATE TABLE substitution_edges (
+        original_product_id TEXT,
+        substituted_product_id TEXT,
+        original_name TEXT,
+        substituted_name TEXT,
+        original_brand TEXT,
+        substituted_brand TEXT,
+        reason TEXT,
+        region TEXT,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (original_product_id, substituted_product_id, reason, region)
+    )
+    ''')
+    cursor.execute("INSERT INTO substitution_edges " + SUBSTITUTION_EDGES_SELECT.format(where=''))
+    count = cursor.execute("SELECT COUNT(*) FROM substitution_edges").fetchone()[0]
+    print(f"✅ Built substitution_edges: {count:,} edges")
+    return count
+
+def refresh_substitution_edges(conn, substitution_ids):
+    """Add newly appended substitutions to the edge counts without rebuilding"""
+    cursor = conn.cursor()
+    substitution_ids = list(substitution_ids)
+    for start in range(0, len(substitution_ids), 500):
+        batch = substitution_ids[start:start + 500]
+        where = f"WHERE sub.substitution_id IN ({', '.join('?' for _ in batch)})"
+        cursor.execute('''
+        INSERT INTO substitution_edges
+        ''' + SUBSTITUTION_EDGES_SELECT.format(where=where) + '''
+        ON CONFLICT(original_product_id, substituted_product_id, reason, region)
+        DO UPDATE SET count = count + excluded.count
+        ''', batch)
+    return len(substitution_ids)
+
+def create_cohort_tables(cursor):
+    """Create the cohort membership and matrix tables"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS cohort_members (
+        region TEXT,
+        store_id TEXT,
+        cohort_month TEXT,
+        activity_month TEXT,
+        customer_id TEXT,
+        PRIMARY KEY (region, store_id, cohort_month, activity_month, customer_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS cohort_matrix (
+        region TEXT,
+        store_id TEXT,
+        cohort_month TEXT,
+        activity_month TEXT,
+        active_customers INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        revenue REAL NOT NULL,
+        PRIMARY KEY (region, store_id, cohort_month, activity_month)
+    )
+    ''')
+
+def update_cohorts(conn, transaction_ids=None):
+    """Fold transactions into the cohort-month x activity-month matrix
+
+    Each transaction counts towards three grains: all stores ('ALL', 'ALL'),
+    its region (region, 'ALL') and its store ('ALL', store_id). A customer's
+    cohort is their registration month, or their first transaction month when
+    they have no registration date. Distinct active customers stay exact under
+    appends because a customer only adds to a cell the first time they appear
+    in cohort_members for it. With no transaction_ids the tables are rebuilt
+    from every transaction.
+    """
+    cursor = conn.cursor()
+    if transaction_ids is not None and cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cohort_matrix'").fetchone() and \
+            cursor.execute("SELECT 1 FROM cohort_matrix WHERE region != 'ALL' AND store_id != 'ALL' LIMIT 1").fetchone():
+        # Built when store rows were keyed by (region, store_id)
+        transaction_ids = None
+    if transaction_ids is None:
+        cursor.execute("DROP TABLE IF EXISTS cohort_members")
+        cursor.execute("DROP TABLE IF EXISTS cohort_matrix")
+    create_cohort_tables(cursor)
+
+    cursor.execute("DROP TABLE IF EXISTS temp.cohort_source")
+    cursor.execute("CREATE TEMP TABLE cohort_source (transaction_id TEXT PRIMARY KEY)")
+    if transaction_ids is None:
+        cursor.execute("INSERT INTO temp.cohort_source SELECT transaction_id FROM transactions")
+    else:
+        cursor.executemany("INSERT OR IGNORE INTO temp.cohort_source VALUES (?)",
+                           ((transaction_id,) for transaction_id in transaction_ids))
+        # An unregistered customer's cohort is their first month; an earlier new transaction moves it
+        if cursor.execute('''
+        SELECT 1 FROM temp.cohort_source src
+        JOIN transactions t ON t.transaction_id = src.transaction_id
+        LEFT JOIN customers c ON c.id = t.customer_id
+        WHERE NULLIF(c.registration_date, '') IS NULL AND EXISTS (
+            SELECT 1 FROM transactions o
+            WHERE o.customer_id = t.customer_id
+              AND substr(o.created_at, 1, 7) > substr(t.created_at, 1, 7)
+              AND o.transaction_id NOT IN (SELECT transaction_id FROM temp.cohort_source)
+        )
+        LIMIT 1
+        ''').fetchone():
+            cursor.execute("DROP TABLE temp.cohort_source")
+            return update_cohorts(conn)
+
+    cursor.execute("DROP TABLE IF EXISTS temp.cohort_delta")
+    cursor.execute('''
+    CREATE TEMP TABLE cohort_delta AS
+    WITH source AS (
+        SELECT t.* FROM temp.cohort_source src
+        JOIN transactions t ON t.transaction_id = src.transaction_id
+        WHERE t.customer_id IS NOT NULL AND t.created_at IS NOT NULL
+    ),
+    first_months AS (
+        SELECT customer_id, MIN(substr(created_at, 1, 7)) AS first_month
+        FROM transactions
+        WHERE customer_id IN (SELECT customer_id FROM source) AND created_at IS NOT NULL
+        GROUP BY customer_id
+    ),
+    base AS (
+        SELECT COALESCE(t.region, 'Unknown') AS region, t.store_id,
+               COALESCE(substr(NULLIF(c.registration_date, ''), 1, 7), f.first_month) AS cohort_month,
+               substr(t.created_at, 1, 7) AS activity_month,
+               t.customer_id, t.total_amount
+        FROM source t
+        JOIN first_months f ON f.customer_id = t.customer_id
+        LEFT JOIN customers c ON c.id = t.customer_id
+    )
+    SELECT 'ALL' AS region, 'ALL' AS store_id, cohort_month, activity_month, customer_id, total_amount FROM base
+    UNION ALL
+    SELECT region, 'ALL', cohort_month, activity_month, customer_id, total_amount FROM base
+    UNION ALL
+    SELECT 'ALL', store_id, cohort_month, activity_month, customer_id, total_amount FROM base
+    WHERE store_id IS NOT NULL
+    ''')
+
+    cursor.execute("DROP TABLE IF EXISTS temp.cohort_new_members")
+    cursor.execute('''
+    CREATE TEMP TABLE cohort_new_members AS
+    SELECT DISTINCT d.region, d.store_id, d.cohort_month, d.activity_month, d.customer_id
+    FROM temp.cohort_delta d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM cohort_members m
+        WHERE m.region = d.region AND m.store_id = d.store_id AND m.cohort_month = d.cohort_month
+          AND m.activity_month = d.activity_month AND m.customer_id = d.customer_id
+    )
+    ''')
+    cursor.execute("INSERT INTO cohort_members SELECT * FROM temp.cohort_new_members")
+
+    cursor.execute('''
+    INSERT INTO cohort_matrix
+    SELECT d.region, d.store_id, d.cohort_month, d.activity_month,
+           COALESCE(n.new_customers, 0), d.transaction_count, d.revenue
+    FROM (
+        SELECT region, store_id, cohort_month, activity_month,
+               COUNT(*) AS transaction_count, COALESCE(SUM(total_amount), 0) AS revenue
+        FROM temp.cohort_delta
+        GROUP BY region, store_id, cohort_month, activity_month
+    ) d
+    LEFT JOIN (
+        SELECT region, store_id, cohort_month, activity_month, COUNT(*) AS new_customers
+        FROM temp.cohort_new_members
+        GROUP BY region, store_id, cohort_month, activity_month
+    ) n USING (region, store_id, cohort_month, activity_month)
+    WHERE true
+    ON CONFLICT(region, store_id, cohort_month, activity_month) DO UPDATE SET
+        active_customers = active_customers + excluded.active_customers,
+        transaction_count = transaction_count + excluded.transaction_count,
+        revenue = revenue + excluded.revenue
+    ''')
+
+    for table in ['cohort_source', 'cohort_delta', 'cohort_new_members']:
+        cursor.execute(f"DROP TABLE temp.{table}")
+
+    cells = cursor.execute("SELECT COUNT(*) FROM cohort_matrix").fetchone()[0]
+    print(f"✅ Updated cohort_matrix: {cells:,} cells")
+    return cells
+
+TIME_GRAINS = {
+    'hour': "strftime('%Y-%m-%d %H:00:00', created_at)",
+    'day': "date(created_at)",
+    'week': "date(created_at, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m-01', created_at)"
+}
+
+def fold_time_rollups(cursor, source, sign=1):
+    """Add (sign=1) or subtract (sign=-1) the rows of source from every grain's buckets"""
+    for grain, bucket_expr in TIME_GRAINS.items():
+        cursor.execute(f'''
+        INSERT INTO time_rollups
+        SELECT '{grain}', bucket, region, {sign} * COUNT(*), {sign} * COALESCE(SUM(total_amount), 0)
+        FROM (
+            SELECT {bucket_expr} AS bucket, 'ALL' AS region, total_amount FROM {source}
+            WHERE created_at IS NOT NULL
+            UNION ALL
+            SELECT {bucket_expr}, COALESCE(region, 'Unknown'), total_amount FROM {source}
+            WHERE created_at IS NOT NULL
+        )
+        WHERE bucket IS NOT NULL
+        GROUP BY bucket, region
+        ON CONFLICT(grain, region, bucket) DO UPDATE SET
+            transaction_count = transaction_count + excluded.transaction_count,
+            revenue = revenue + excluded.revenue
+        ''')
+
+def retract_time_rollups(conn, replaced_table):
+    """Take the previous versions of updated transactions back out of the rollups"""
+    cursor = conn.cursor()
+    fold_time_rollups(cursor, replaced_table, sign=-1)
+    cursor.execute("DELETE FROM time_rollups WHERE transaction_count <= 0")
+
+def update_time_rollups(conn, transaction_ids=None):
+    """Fold transactions into hourly, daily, weekly and monthly rollups per region
+
+    Buckets are keyed by their start timestamp. With no transaction_ids the
+    table is rebuilt from every transaction; otherwise the given transactions
+    are added to the existing buckets.
+    """
+    cursor = conn.cursor()
+    if transaction_ids is None:
+        cursor.execute("DROP TABLE IF EXISTS time_rollups")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS time_rollups (
+        grain TEXT,
+        bucket TEXT,
+        region TEXT,
+        transaction_count INTEGER NOT NULL,
+        revenue REAL NOT NULL,
+        PRIMARY KEY (grain, region, bucket)
+    )
+    ''')
+
+    if transaction_ids is None:
+        source = "transactions"
+    else:
+        cursor.execute("DROP TABLE IF EXISTS temp.rollup_source")
+        cursor.execute("CREATE TEMP TABLE rollup_source (transaction_id TEXT PRIMARY KEY)")
+        cursor.executemany("INSERT OR IGNORE INTO temp.rollup_source VALUES (?)",
+                           ((transaction_id,) for transaction_id in transaction_ids))
+        source = "(SELECT t.* FROM transactions t JOIN temp.rollup_source USING (transaction_id))"
+
+    fold_time_rollups(cursor, source)
+
+    if transaction_ids is not None:
+        cursor.execute("DROP TABLE temp.rollup_source")
+
+    buckets = cursor.execute("SELECT COUNT(*) FROM time_rollups").fetchone()[0]
+    print(f"✅ Updated time_rollups: {buckets:,} buckets")
+    return buckets
+
+def build_aggregates(conn, star=False):
+    """Build every precomputed aggregate table from the loaded fact tables, plus the star schema if asked"""
+    print("\n📐 Building precomputed aggregates...")
+    build_store_rollups(conn)
+    build_substitution_edges(conn)
+    update_cohorts(conn)
+    update_time_rollups(conn)
+    if star:
+        build_star_schema(conn)
+    conn.commit()
+
+def _keys(changes, table, kind=None):
+    entry = changes.get(table, {})
+    if kind is not None:
+        return list(entry.get(kind, []))
+    return list(entry.get('inserted', [])) + list(entry.get('updated', []))
+
+def _referenced(cursor, query, keys, exclude):
+    """Whether any row matched by query (one IN placeholder list) is outside exclude"""
+    for start in range(0, len(keys), 500):
+        batch = keys[start:start + 500]
+        for (key,) in cursor.execute(query.format(placeholders=', '.join('?' for _ in batch)), batch):
+            if key not in exclude:
+                return True
+    return False
+
+def refresh_aggregates(conn, changes):
+    """Bring the rollups up to date with an incremental load's changed keys
+
+    changes maps table -> {'inserted': keys, 'updated': keys}. Previous
+    versions of updated transactions are read from temp.replaced_transactions
+    (filled by the loader) so their contributions can be taken back out.
+    Appends fold in incrementally; an update to something a distinct count
+    or an edge label depends on rebuilds that aggregate instead.
+    """
+    print("\n📐 Refreshing precomputed aggregates for changed keys...")
+    cursor = conn.cursor()
+    inserted_transactions = _keys(changes, 'transactions', 'inserted')
+    updated_transactions = _keys(changes, 'transactions', 'updated')
+    changed_transactions = inserted_transactions + updated_transactions
+    new_transactions = set(inserted_transactions)
+
+    # Stores: recompute every store a changed transaction moved into or out of
+    store_ids = set(_keys(changes, 'stores'))
+    for start in range(0, len(changed_transactions), 500):
+        batch = changed_transactions[start:start + 500]
+        placeholders = ', '.join('?' for _ in batch)
+        store_ids.update(row[0] for row in cursor.execute(
+            f"SELECT DISTINCT store_id FROM transactions WHERE transaction_id IN ({placeholders})", batch))
+    if updated_transactions:
+        store_ids.update(row[0] for row in cursor.execute("SELECT DISTINCT store_id FROM temp.replaced_transactions"))
+    if store_ids:
+        refresh_store_rollups(conn, sorted(store_ids, key=str))
+
+    # Time rollups: plain sums, so updates retract the old row and add the new one
+    if updated_transactions:
+        retract_time_rollups(conn, "temp.replaced_transactions")
+    if changed_transactions:
+        update_time_rollups(conn, changed_transactions)
+
+    # Cohorts hold distinct customers, which cannot be retracted; rebuild when history changed
+    changed_customers = _keys(changes, 'customers')
+    if updated_transactions or _referenced(
+            cursor, "SELECT transaction_id FROM transactions WHERE customer_id IN ({placeholders})",
+            changed_customers, new_transactions):
+        update_cohorts(conn)
+    elif inserted_transactions:
+        update_cohorts(conn, inserted_transactions)
+
+    # Substitution edges carry product names and the transaction's region
+    inserted_substitutions = _keys(changes, 'substitutions', 'inserted')
+    if (_keys(changes, 'substitutions', 'updated') or _keys(changes, 'products', 'updated') or updated_transactions
+            or _referenced(cursor, "SELECT substitution_id FROM substitutions WHERE transaction_id IN ({placeholders})",
+                           inserted_transactions, set(inserted_substitutions))):
+        build_substitution_edges(conn)
+    elif inserted_substitutions:
+        refresh_substitution_edges(conn, inserted_substitutions)
+        print(f"✅ Refreshed substitution_edges: {len(inserted_substitutions):,} substitutions")
+
+    refresh_star_schema(conn, changes)
+    conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description='Build Scout Analytics precomputed aggregates')
+    parser.add_argument('--db_path', required=True, help='SQLite database path')
+    parser.add_argument('--star', action='store_true',
+                        help='Also build the fact_sales_line and dim_date star schema tables')
+
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path)
+    if not db_path.exists():
+        print(f"❌ SQLite database not found: {db_path}")
+        return
+
+    conn = sqlite3.connect(str(db_path))
+    try:
+        build_aggregates(conn, star=args.star)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Bulk Migration
+Array-bound, parallel SQLite to SQL Server loads with bad-row isolation
+
+Each batch goes out as a single fast_executemany round trip and commits on
+its own. Tables start as soon as the tables they reference have finished,
+and large tables are split into rowid ranges (the integer key for compact
+storage views), each written by its own connection. A batch the server refuses is rolled back and bisected, so k bad
+rows cost about k * log2(batch size) extra round trips. The bad rows go to a
+JSON-lines reject file instead of stopping the load.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import pyodbc
+
+from compact_storage import primary_key, range_bounds, range_column
+from migration_journal import MigrationJournal, source_version
+
+# Foreign keys between the migrated tables (see create_azure_tables / create_mvp_schema_tables)
+TABLE_DEPENDENCIES = {
+    'stores': [],
+    'brands': [],
+    'customers': [],
+    'products': ['brands'],
+    'transactions': ['stores', 'customers'],
+    'transaction_items': ['transactions', 'products'],
+    'substitutions': ['transactions', 'products'],
+}
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_RANGE_ROWS = 250000
+DEFAULT_WORKERS = 4
+
+# Errors caused by the rows themselves; anything else (connection loss, missing table) aborts the load
+ROW_ERRORS = (pyodbc.DataError, pyodbc.IntegrityError)
+
+class RejectLog:
+    """JSON-lines file of rows the target refused, shared by all writer threads"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, table, columns, row, error):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            record = {'table': table, 'row': dict(zip(columns, row)), 'error': str(error)}
+            self._file.write(json.dumps(record, default=str) + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def rotate(self):
+        """Start an empty file for a new run; the last run's rejects move to <path>.previous"""
+        self.close()
+        if self.path.exists():
+            self.path.replace(self.path.with_name(self.path.name + '.previous'))
+        self.count = 0
+
+    def rows(self):
+        """{table: [row, ...]} of the rejected rows in the file, as dicts of column values
+
+        A range redone after an interruption logs its rejects again; each row is listed once.
+        """
+        rejected = {}
+        seen = set()
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    row_text = json.dumps([record['table'], record['row']], sort_keys=True)
+                    if row_text not in seen:
+                        seen.add(row_text)
+                        rejected.setdefault(record['table'], []).append(record['row'])
+        return rejected
+
+class TableStats:
+    """Running totals for one table"""
+
+    def __init__(self, ranges):
+        self.ranges = ranges
+        self.ranges_left = len(ranges)
+        self.rows = 0
+        self.resumed_rows = 0
+        self.rejected = 0
+        self.round_trips = 0
+        self.started = None
+        self.seconds = 0.0
+
+def target_name(azure_conn, schema):
+    """Journal key of a target schema: server/database/schema"""
+    return '/'.join([azure_conn.getinfo(pyodbc.SQL_SERVER_NAME), azure_conn.getinfo(pyodbc.SQL_DATABASE_NAME), schema])
+
+def rowid_ranges(sqlite_conn, table, range_rows=DEFAULT_RANGE_ROWS):
+    """Inclusive (low, high) ranges of range_column of about range_rows rows covering table"""
+    low, high = range_bounds(sqlite_conn, table)
+    if low is None:
+        return []
+    return [(start, min(start + range_rows - 1, high)) for start in range(low, high + 1, range_rows)]
+
+def insert_batch(conn, cursor, insert_sql, rows, reject):
+    """Insert and commit rows in one round trip, bisecting on row errors: (inserted, round_trips)"""
+    try:
+        cursor.executemany(insert_sql, rows)
+        conn.commit()
+        return len(rows), 1
+    except ROW_ERRORS as e:
+        conn.rollback()
+        if len(rows) == 1:
+            reject(rows[0], e)
+            return 0, 1
+        middle = len(rows) // 2
+        left_rows, left_trips = insert_batch(conn, cursor, insert_sql, rows[:middle], reject)
+        right_rows, right_trips = insert_batch(conn, cursor, insert_sql, rows[middle:], reject)
+        return left_rows + right_rows, 1 + left_trips + right_trips
+
+class BulkMigrator:
+    """Writes SQLite tables into SQL Server with a pool of writer threads, one connection each"""
+
+    def __init__(self, sqlite_path, azure_conn_str, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                 range_rows=DEFAULT_RANGE_ROWS, reject_path=None, journal=None, restart=False):
+        self.sqlite_path = str(sqlite_path)
+        self.azure_conn_str = azure_conn_str
+        self.workers = workers
+        self.batch_size = batch_size
+        self.range_rows = range_rows
+        self.rejects = RejectLog(reject_path or Path(sqlite_path).with_suffix('.rejects.jsonl'))
+        self.journal = journal
+        self.restart = restart
+        self.run = None
+        self.resuming = False
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connections(self):
+        """This thread's (sqlite, azure) connection pair, opened on first use"""
+        if not hasattr(self._local, 'azure'):
+            self._local.sqlite = sqlite3.connect(f"file:{self.sqlite_path}?mode=ro", uri=True,
+                                                 check_same_thread=False)
+            self._local.azure = pyodbc.connect(self.azure_conn_str, autocommit=False)
+            with self._lock:
+                self._connections += [self._local.sqlite, self._local.azure]
+        return self._local.sqlite, self._local.azure
+
+    def start(self, run):
+        """Open the journal run for this target; True when an interrupted run is being resumed"""
+        if self.journal is None:
+            return False
+        self.run = run
+        range_rows = self.journal.begin(run, source_version(self.sqlite_path), self.range_rows, self.restart)
+        self.resuming = range_rows is not None
+        if self.resuming:
+            # Ranges must line up with the ones already recorded
+            self.range_rows = range_rows
+            print(f"⏯️  Resuming the interrupted migration into {run}")
+        return self.resuming
+
+    def complete(self):
+        """Mark the journal run finished, so the next migration starts from scratch"""
+        if self.journal is not None and self.run is not None:
+            self.journal.complete(self.run)
+            self.journal.close()
+
+    def clear_range(self, cursor, azure_conn, sqlite_conn, table, target, key, low, high):
+        """Delete whatever an interrupted run committed for this range, by the range's keys"""
+        column = range_column(sqlite_conn, table)
+        keys = sqlite_conn.execute(f"SELECT {key} FROM {table} WHERE {column} BETWEEN ? AND ?", (low, high)).fetchall()
+        cursor.execute("IF OBJECT_ID('tempdb..#range_keys') IS NOT NULL DROP TABLE #range_keys")
+        cursor.execute(f"SELECT TOP 0 {key} INTO #range_keys FROM {target}")
+        for start in range(0, len(keys), self.batch_size):
+            cursor.executemany(f"INSERT INTO #range_keys ({key}) VALUES (?)", keys[start:start + self.batch_size])
+        cursor.execute(f"DELETE target FROM {target} AS target JOIN #range_keys AS range_keys "
+                       f"ON target.{key} = range_keys.{key}")
+        azure_conn.commit()
+
+    def copy_range(self, table, target, columns, key, low, high):
+        """Copy one rowid range of table into target: (inserted, rejected, round_trips)
+
+        key is the column to clear a partly committed range by, or None on a fresh run.
+        """
+        sqlite_conn, azure_conn = self.connections()
+        cursor = azure_conn.cursor()
+        cursor.fast_executemany = True
+        if key is not None:
+            self.clear_range(cursor, azure_conn, sqlite_conn, table, target, key, low, high)
+        insert_sql = (f"INSERT INTO {target} ({', '.join(columns)}) "
+                      f"VALUES ({', '.join('?' for _ in columns)})")
+        column = range_column(sqlite_conn, table)
+        source = sqlite_conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE {column} BETWEEN ? AND ? ORDER BY {column}", (low, high))
+
+        rejected = []
+        def reject(row, error):
+            rejected.append(row)
+            self.rejects.write(table, columns, row, error)
+
+        inserted = round_trips = 0
+        while True:
+            rows = source.fetchmany(self.batch_size)
+            if not rows:
+                break
+            batch_rows, batch_trips = insert_batch(azure_conn, cursor, insert_sql, rows, reject)
+            inserted += batch_rows
+            round_trips += batch_trips
+        return inserted, len(rejected), round_trips
+
+    def migrate(self, tables, target_for, columns_for):
+        """Load tables in dependency order, in parallel where foreign keys allow; returns total rows"""
+        print(f"🚚 Bulk mode: {self.workers} writers, {self.batch_size:,}-row batches, "
+              f"{self.range_rows:,}-row ranges")
+        sqlite_conn = sqlite3.connect(self.sqlite_path)
+        stats = {table: TableStats(rowid_ranges(sqlite_conn, table, self.range_rows)) for table in tables}
+        keys = {table: primary_key(sqlite_conn, table) for table in tables}
+        sqlite_conn.close()
+        remaining = {table: set(TABLE_DEPENDENCIES.get(table, [])) & set(tables) for table in tables}
+        started = time.time()
+
+        try:
+            # Ranges an interrupted run cleared are re-inserted after deleting their keys on the target
+            clear_keys = {}
+            if self.resuming:
+                for table in tables:
+                    clear_keys[table] = self.skip_completed(table, target_for(table), columns_for(table),
+                                                            keys[table], stats[table])
+
+            executor = ThreadPoolExecutor(max_workers=self.workers)
+            try:
+                running = {}
+                while remaining or running:
+                    # Start every table whose referenced tables are loaded; empty ones finish at once
+                    ready = [table for table, needs in remaining.items() if not needs]
+                    for table in ready:
+                        del remaining[table]
+                        stats[table].started = time.time()
+                        for low, high in stats[table].ranges:
+                            future = executor.submit(self.copy_range, table, target_for(table), columns_for(table),
+                                                     clear_keys.get(table), low, high)
+                            running[future] = (table, low, high)
+                        if not stats[table].ranges:
+                            self.finish(table, target_for(table), stats[table], remaining)
+                    if ready and not running:
+                        continue
+                    if not running:
+                        raise ValueError(f"circular table dependencies: {', '.join(remaining)}")
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        table, low, high = running.pop(future)
+                        inserted, rejected, round_trips = future.result()
+                        if self.journal is not None:
+                            self.journal.record_range(self.run, table, low, high, inserted, rejected)
+                        table_stats = stats[table]
+                        table_stats.rows += inserted
+                        table_stats.rejected += rejected
+                        table_stats.round_trips += round_trips
+                        table_stats.ranges_left -= 1
+                        if not table_stats.ranges_left:
+                            self.finish(table, target_for(table), table_stats, remaining)
+            finally:
+                # On failure, ranges not yet started are dropped rather than run
+                executor.shutdown(cancel_futures=True)
+        finally:
+            self.close()
+
+        total_rows = sum(table_stats.rows + table_stats.resumed_rows for table_stats in stats.values())
+        elapsed = time.time() - started
+        copied = total_rows - sum(table_stats.resumed_rows for table_stats in stats.values())
+        print(f"📊 Bulk load: {copied:,} rows in {elapsed:.1f}s ({copied / elapsed if elapsed else 0:,.0f} rows/s)")
+        if self.rejects.count:
+            print(f"⚠️  {self.rejects.count:,} rejected rows written to {self.rejects.path}")
+        return total_rows
+
+    def skip_completed(self, table, target, columns, key, table_stats):
+        """Drop ranges the interrupted run finished; returns the key to clear the others by, or None"""
+        completed = self.journal.completed_ranges(self.run, table)
+        if key not in columns:
+            # Without the key on the target (IDENTITY tables), a partly committed range cannot be
+            # told apart, so the table restarts unless its row count matches the finished ranges
+            _, azure_conn = self.connections()
+            count = azure_conn.cursor().execute(f"SELECT COUNT(*) FROM {target}").fetchone()[0]
+            if count != sum(rows for _, rows, _ in completed.values()):
+                print(f"  ↩️  {target} has rows from unfinished ranges; reloading it from scratch")
+                azure_conn.cursor().execute(f"DELETE FROM {target}")
+                azure_conn.commit()
+                self.journal.reset_table(self.run, table)
+                completed = {}
+            key = None
+        table_stats.ranges = [(low, high) for low, high in table_stats.ranges if low not in completed]
+        table_stats.ranges_left = len(table_stats.ranges)
+        table_stats.resumed_rows = sum(rows for _, rows, _ in completed.values())
+        if completed:
+            print(f"  ⏭️  {target}: {len(completed):,} ranges ({table_stats.resumed_rows:,} rows) already loaded")
+        return key
+
+    def finish(self, table, target, table_stats, remaining):
+        """Report a completed table and release the tables waiting on it"""
+        table_stats.seconds = time.time() - table_stats.started
+        rate = table_stats.rows / table_stats.seconds if table_stats.seconds else 0
+        resumed = f", {table_stats.resumed_rows:,} from the earlier run" if table_stats.resumed_rows else ""
+        print(f"✅ Completed migration of {target}: {table_stats.rows:,} rows in {table_stats.seconds:.1f}s "
+              f"({rate:,.0f} rows/s, {table_stats.round_trips:,} round trips, {table_stats.rejected:,} rejected"
+              f"{resumed})")
+        for needs in remaining.values():
+            needs.discard(table)
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        self._local = threading.local()
+        self.rejects.close()
+
+def bulk_migrator(args, sqlite_path, azure_conn_str):
+    """BulkMigrator configured from add_bulk_arguments options, or None in batch mode"""
+    if args.mode != 'bulk':
+        return None
+    journal = MigrationJournal(args.journal or Path(sqlite_path).with_suffix('.checkpoints.db'))
+    return BulkMigrator(sqlite_path, azure_conn_str, args.workers, args.batch_size, args.range_rows,
+                        args.reject_file, journal, args.restart)
+
+def add_bulk_arguments(parser):
+    """Command-line options shared by the migration scripts"""
+    parser.add_argument('--mode', choices=['bulk', 'batch'], default='bulk',
+                        help='bulk: parallel fast_executemany writers; batch: previous one-connection inserts')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Writer connections in bulk mode')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Rows per round trip and commit in bulk mode')
+    parser.add_argument('--range-rows', type=int, default=DEFAULT_RANGE_ROWS,
+                        help='Rows per key range; ranges of one table are written concurrently')
+    parser.add_argument('--reject-file', help='Where refused rows are written (default: <sqlite-path>.rejects.jsonl)')
+    parser.add_argument('--journal', help='Checkpoint journal of bulk loads (default: <sqlite-path>.checkpoints.db)')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore an interrupted run in the journal and reload from scratch')
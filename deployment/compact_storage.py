@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Compact SQLite Storage
+Rewrites the fact tables with integer surrogate keys, epoch timestamps and dictionary codes
+
+    key_map_<entity>        key INTEGER PRIMARY KEY <-> the original UUID / id text
+    dictionary_values       (column_name, code) -> value for categorical columns
+    transactions_compact    transaction_key, customer_key, store_key, ... all integers
+    transaction_items_compact
+
+stores, products, customers and devices gain a <entity>_key column so the
+compact facts join them on integers. The original fact tables are replaced by
+views of the same name that decode back to text (plus the integer key, so
+range scans over a view stay on the primary key); these keep the rollup
+builders and ad-hoc SQL working. The decoding joins make those views slow to
+scan, so the API endpoints, the basket miner and the migrations read the
+compact tables or split by the integer key instead; range_column() and
+migrated_columns() tell the migration scripts how.
+"""
+
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+
+# Dimension table -> (id column, entity)
+KEY_DIMENSIONS = {
+    'stores': ('store_id', 'store'),
+    'customers': ('id', 'customer'),
+    'products': ('id', 'product'),
+    'devices': ('id', 'device')
+}
+
+COMPACT_TABLES = {
+    'transactions': {
+        'key': ('transaction_id', 'transaction'),
+        'refs': {'customer_id': 'customer', 'store_id': 'store', 'device_id': 'device'},
+        'times': ['created_at', 'nlp_processed_at', 'checkout_time'],
+        'codes': ['customer_gender', 'payment_method', 'request_type', 'region', 'city', 'barangay']
+    },
+    'transaction_items': {
+        'key': ('id', 'transaction_item'),
+        'refs': {'transaction_id': 'transaction', 'product_id': 'product'},
+        'times': [],
+        'codes': []
+    }
+}
+
+COMPACT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transactions_compact_created_at ON transactions_compact(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_compact_store ON transactions_compact(store_key)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_compact_region ON transactions_compact(region)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_compact_customer ON transactions_compact(customer_key)",
+    "CREATE INDEX IF NOT EXISTS idx_transaction_items_compact_transaction ON transaction_items_compact(transaction_key)",
+    "CREATE INDEX IF NOT EXISTS idx_transaction_items_compact_product ON transaction_items_compact(product_key)"
+]
+
+def is_compact(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_compact'").fetchone() is not None
+
+def compact_spec(conn, table):
+    """COMPACT_TABLES entry when table is a decoding view over a compact table, else None"""
+    return COMPACT_TABLES.get(table) if table in COMPACT_TABLES and is_compact(conn) else None
+
+def range_column(conn, table):
+    """Integer column to split table into ranges by: rowid, or a compact view's key"""
+    spec = compact_spec(conn, table)
+    return f"{spec['key'][1]}_key" if spec else "rowid"
+
+def range_bounds(conn, table):
+    """(low, high) of range_column, read from the compact table rather than through the view"""
+    spec = compact_spec(conn, table)
+    source = f"{table}_compact" if spec else table
+    return conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {source}").fetchone()
+
+def primary_key(conn, table):
+    """Original key column of table; views report none through PRAGMA table_info"""
+    spec = compact_spec(conn, table)
+    if spec:
+        return spec['key'][0]
+    return next((row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[5]), None)
+
+def migrated_columns(conn, table):
+    """Columns of table that hold source data, without the integer surrogate keys added here"""
+    surrogates = {f"{entity}_key" for _, entity in KEY_DIMENSIONS.values()}
+    surrogates |= {f"{spec['key'][1]}_key" for spec in COMPACT_TABLES.values()}
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})") if row[1] not in surrogates]
+
+def table_columns(conn, table):
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def build_key_maps(conn):
+    """One key map per entity, seeded from the dimension tables then from fact references"""
+    entities = {entity for _, entity in KEY_DIMENSIONS.values()}
+    for spec in COMPACT_TABLES.values():
+        entities.add(spec['key'][1])
+        entities.update(spec['refs'].values())
+    for entity in sorted(entities):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS key_map_{entity} (key INTEGER PRIMARY KEY, uuid TEXT NOT NULL UNIQUE)")
+
+    for table, (column, entity) in KEY_DIMENSIONS.items():
+        conn.execute(f"INSERT OR IGNORE INTO key_map_{entity} (uuid) SELECT {column} FROM {table} WHERE {column} IS NOT NULL")
+        if f"{entity}_key" not in [name for name, _ in table_columns(conn, table)]:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {entity}_key INTEGER")
+        conn.execute(f"UPDATE {table} SET {entity}_key = (SELECT key FROM key_map_{entity} WHERE uuid = {table}.{column})")
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_{entity}_key ON {table}({entity}_key)")
+
+    for table, spec in COMPACT_TABLES.items():
+        column, entity = spec['key']
+        conn.execute(f"INSERT OR IGNORE INTO key_map_{entity} (uuid) SELECT {column} FROM {table} WHERE {column} IS NOT NULL")
+    for table, spec in COMPACT_TABLES.items():
+        for column, entity in spec['refs'].items():
+            conn.execute(f"INSERT OR IGNORE INTO key_map_{entity} (uuid) SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
+
+def build_dictionaries(conn):
+    """Codes 0..n-1 per categorical column, in value order"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS dictionary_values (
+        column_name TEXT,
+        code INTEGER,
+        value TEXT,
+        PRIMARY KEY (column_name, code)
+    )
+    ''')
+    for table, spec in COMPACT_TABLES.items():
+        for column in spec['codes']:
+            values = [row[0] for row in conn.execute(
+                f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY {column}")]
+            conn.execute("DELETE FROM dictionary_values WHERE column_name = ?", (column,))
+            conn.executemany("INSERT INTO dictionary_values VALUES (?, ?, ?)",
+                             ((column, code, value) for code, value in enumerate(values)))
+
+def compact_table(conn, table, spec):
+    """Copy a fact table into its compact form and replace it with a decoding view"""
+    columns = table_columns(conn, table)
+    key_column, key_entity = spec['key']
+    definitions, selects, joins = [], [], []
+    for name, declared in columns:
+        if name == key_column:
+            definitions.append(f"{key_entity}_key INTEGER PRIMARY KEY")
+            selects.append(f"k_{name}.key")
+            joins.append(f"JOIN key_map_{key_entity} k_{name} ON k_{name}.uuid = src.{name}")
+        elif name in spec['refs']:
+            entity = spec['refs'][name]
+            definitions.append(f"{entity}_key INTEGER")
+            selects.append(f"k_{name}.key")
+            joins.append(f"LEFT JOIN key_map_{entity} k_{name} ON k_{name}.uuid = src.{name}")
+        elif name in spec['times']:
+            definitions.append(f"{name} INTEGER")
+            selects.append(f"CAST(strftime('%s', src.{name}) AS INTEGER)")
+        elif name in spec['codes']:
+            definitions.append(f"{name} INTEGER")
+            selects.append(f"d_{name}.code")
+            joins.append(f"LEFT JOIN dictionary_values d_{name} ON d_{name}.column_name = '{name}' AND d_{name}.value = src.{name}")
+        else:
+            definitions.append(f"{name} {declared}")
+            selects.append(f"src.{name}")
+
+    # Decoding view, columns in the original order
+    decoded = []
+    decoded_joins = []
+    for name, _ in columns:
+        if name == key_column:
+            decoded.append(f"k_{name}.uuid AS {name}")
+            decoded_joins.append(f"JOIN key_map_{key_entity} k_{name} ON k_{name}.key = c.{key_entity}_key")
+        elif name in spec['refs']:
+            entity = spec['refs'][name]
+            decoded.append(f"k_{name}.uuid AS {name}")
+            decoded_joins.append(f"LEFT JOIN key_map_{entity} k_{name} ON k_{name}.key = c.{entity}_key")
+        elif name in spec['times']:
+            decoded.append(f"datetime(c.{name}, 'unixepoch') AS {name}")
+        elif name in spec['codes']:
+            decoded.append(f"d_{name}.value AS {name}")
+            decoded_joins.append(
+                f"LEFT JOIN dictionary_values d_{name} ON d_{name}.column_name = '{name}' AND d_{name}.code = c.{name}")
+        else:
+            decoded.append(f"c.{name}")
+    decoded.append(f"c.{key_entity}_key")
+
+    compact = f"{table}_compact"
+    conn.execute(f"DROP TABLE IF EXISTS {compact}")
+    conn.execute(f"CREATE TABLE {compact} ({', '.join(definitions)})")
+    conn.execute(f"INSERT INTO {compact} SELECT {', '.join(selects)} FROM {table} src {' '.join(joins)}")
+
+    unparsed = []
+    for name in spec['times']:
+        lost = conn.execute(f'''
+        SELECT COUNT(*) FROM {table} src JOIN key_map_{key_entity} k ON k.uuid = src.{key_column}
+        JOIN {compact} c ON c.{key_entity}_key = k.key
+        WHERE src.{name} IS NOT NULL AND c.{name} IS NULL
+        ''').fetchone()[0]
+        if lost:
+            unparsed.append(f"{name} ({lost:,} unparseable)")
+    if unparsed:
+        print(f"   ⚠️  {table}: timestamps stored as NULL: {', '.join(unparsed)}")
+
+    rows = conn.execute(f"SELECT COUNT(*) FROM {compact}").fetchone()[0]
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"CREATE VIEW {table} AS SELECT {', '.join(decoded)} FROM {compact} c {' '.join(decoded_joins)}")
+    print(f"✅ Compacted {table}: {rows:,} rows")
+    return rows
+
+def compact_database(db_path):
+    """Convert a loaded database to compact storage in place, then VACUUM"""
+    started = time.perf_counter()
+    size_before = Path(db_path).stat().st_size
+    conn = sqlite3.connect(str(db_path))
+    try:
+        if is_compact(conn):
+            print(f"⏭️  {db_path} already uses compact storage")
+            return
+        print(f"\n🗜️  Converting {db_path} to compact storage...")
+        with conn:
+            build_key_maps(conn)
+            build_dictionaries(conn)
+            for table, spec in COMPACT_TABLES.items():
+                compact_table(conn, table, spec)
+            for index_sql in COMPACT_INDEXES:
+                conn.execute(index_sql)
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    size_after = Path(db_path).stat().st_size
+    print(f"✅ Compact storage: {size_before / 1e6:,.1f} MB -> {size_after / 1e6:,.1f} MB "
+          f"in {time.perf_counter() - started:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a Scout Analytics SQLite database to compact storage')
+    parser.add_argument('--db_path', required=True, help='SQLite database path')
+
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path)
+    if not db_path.exists():
+        print(f"❌ SQLite database not found: {db_path}")
+        return
+
+    compact_database(db_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Blue/Green Dataset Versions
+Builds each SQLite load into its own version directory and flips a symlink to publish it
+
+Layout next to the served database path:
+
+    scout_analytics.db -> versions/20250621-103000/scout_analytics.db
+    versions/20250621-103000/scout_analytics.db
+    versions/20250621-103000/partitions/        (optional)
+
+The API resolves the symlink between requests, so a flip is picked up without
+a restart and readers of the previous version finish on the file they opened.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+REQUIRED_TABLES = ['stores', 'products', 'transactions', 'transaction_items']
+
+def versions_dir(db_path):
+    return Path(db_path).parent / 'versions'
+
+def new_version_path(db_path):
+    """Path of the database file for a fresh version directory"""
+    version = datetime.now().strftime('%Y%m%d-%H%M%S')
+    version_dir = versions_dir(db_path) / version
+    suffix = 1
+    while version_dir.exists():
+        suffix += 1
+        version_dir = versions_dir(db_path) / f"{version}-{suffix}"
+    version_dir.mkdir(parents=True)
+    return version_dir / Path(db_path).name
+
+def current_version_path(db_path):
+    """Database file the served path currently points at, or None"""
+    db_path = Path(db_path)
+    if not db_path.exists():
+        return None
+    return db_path.resolve()
+
+def validate_database(path, required_tables=None):
+    """Check integrity and that the core tables loaded; raises ValueError on failure"""
+    if required_tables is None:
+        # Fact rows may live only in the version's partitions
+        partitioned = (Path(path).parent / 'partitions' / 'manifest.json').exists()
+        required_tables = ['stores', 'products'] if partitioned else REQUIRED_TABLES
+    conn = sqlite3.connect(str(path))
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if result != 'ok':
+            raise ValueError(f"quick_check failed: {result}")
+        counts = {}
+        for table in required_tables:
+            try:
+                counts[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except sqlite3.Error as e:
+                raise ValueError(f"{table}: {e}")
+            if counts[table] == 0:
+                raise ValueError(f"{table} is empty")
+    finally:
+        conn.close()
+    print(f"✅ Validated {path}: " + ", ".join(f"{table} {count:,}" for table, count in counts.items()))
+    return counts
+
+def activate_version(db_path, version_path):
+    """Atomically repoint db_path at version_path (symlink swapped with rename)"""
+    db_path = Path(db_path)
+    link = db_path.with_name(f".{db_path.name}.{os.getpid()}.link")
+    if link.is_symlink() or link.exists():
+        link.unlink()
+    os.symlink(os.path.relpath(version_path, db_path.parent), link)
+    os.replace(link, db_path)
+    print(f"🔀 Activated {version_path}")
+
+def prune_versions(db_path, keep=3):
+    """Delete old version directories, keeping the newest `keep` and the active one"""
+    root = versions_dir(db_path)
+    if not root.exists():
+        return []
+    active = current_version_path(db_path)
+    active_dir = active.parent if active else None
+    versions = sorted((path for path in root.iterdir() if path.is_dir()), key=lambda path: path.name, reverse=True)
+    removed = []
+    for path in versions[max(keep, 1):]:
+        if path == active_dir:
+            continue
+        shutil.rmtree(path)
+        removed.append(path.name)
+    if removed:
+        print(f"🗑️  Pruned {len(removed)} old dataset versions")
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage blue/green Scout Analytics SQLite dataset versions')
+    parser.add_argument('--db_path', required=True, help='Served SQLite database path (symlink)')
+    parser.add_argument('--activate', help='Version directory name to switch to (e.g. for a rollback)')
+    parser.add_argument('--keep-versions', dest='keep_versions', type=int, default=3)
+
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path)
+    if args.activate:
+        version_path = versions_dir(db_path) / args.activate / db_path.name
+        validate_database(version_path)
+        activate_version(db_path, version_path)
+    prune_versions(db_path, args.keep_versions)
+
+    active = current_version_path(db_path)
+    print(f"📁 Active version: {active.parent.name if active else 'none'}")
+    for path in sorted(versions_dir(db_path).glob('*/')) if versions_dir(db_path).exists() else []:
+        print(f"   {'*' if active and path == active.parent else ' '} {path.name}")
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,11 @@ from datetime import datetime, timedelta
 import uuid
 import random
 from faker import Faker
+import argparse
 import json
+import os
+
+from parquet_dataset import write_parquet
 
 # Initialize Faker for Philippine locale
 fake = Faker(['en_PH', 'en_US'])
@@ -214,6 +218,12 @@ def generate_enhanced_stores(count=25):
 
 def main():
     """Main function to generate enhanced dataset"""
+    parser = argparse.ArgumentParser(description='Generate the enhanced Scout Analytics dataset')
+    parser.add_argument('--output_dir', default='/home/ubuntu/enhanced_output', help='Output directory')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv',
+                        help='parquet writes typed, month-partitioned datasets (needs pyarrow)')
+    args = parser.parse_args()
+    
     print("=== Scout Analytics Dataset Enhancement ===")
     print("Generating enhanced dataset for better dashboard analytics...")
     
@@ -224,15 +234,21 @@ def main():
     stores_df = generate_enhanced_stores(25)
     
     # Save enhanced datasets
-    output_dir = '/home/ubuntu/enhanced_output'
-    import os
+    output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
     
     print("\nSaving enhanced datasets...")
-    transactions_df.to_csv(f'{output_dir}/transactions.csv', index=False)
-    substitutions_df.to_csv(f'{output_dir}/substitutions.csv', index=False)
-    behaviors_df.to_csv(f'{output_dir}/request_behaviors.csv', index=False)
-    stores_df.to_csv(f'{output_dir}/stores.csv', index=False)
+    datasets = {
+        'transactions': transactions_df,
+        'substitutions': substitutions_df,
+        'request_behaviors': behaviors_df,
+        'stores': stores_df
+    }
+    for table_name, df in datasets.items():
+        if args.format in ('csv', 'both'):
+            df.to_csv(f'{output_dir}/{table_name}.csv', index=False)
+        if args.format in ('parquet', 'both'):
+            write_parquet(df, output_dir, table_name)
     
     # Generate summary statistics
     print("\n=== Dataset Summary ===")
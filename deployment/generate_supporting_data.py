@@ -7,8 +7,12 @@ import pandas as pd
 import numpy as np
 import uuid
 import random
+import argparse
+import os
 from datetime import datetime
 
+from parquet_dataset import parquet_path, read_parquet, write_parquet
+
 # Product categories and brands mapping
 PRODUCT_DATA = {
     'Beverages': {
@@ -228,10 +232,22 @@ def generate_devices(transactions_df):
 
 def main():
     """Main function to generate all supporting datasets"""
+    parser = argparse.ArgumentParser(description='Generate Scout Analytics products, brands, items, customers and devices')
+    parser.add_argument('--output_dir', default='/home/ubuntu/enhanced_output',
+                        help='Directory holding the enhanced transactions; outputs are written there too')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'both'], default='csv',
+                        help='parquet writes typed, month-partitioned datasets (needs pyarrow)')
+    args = parser.parse_args()
+    output_dir = args.output_dir
+    
     print("=== Generating Supporting Datasets ===")
     
-    # Load enhanced transactions
-    transactions_df = pd.read_csv('/home/ubuntu/enhanced_output/transactions.csv')
+    # Load enhanced transactions, preferring the typed Parquet dataset
+    if parquet_path(output_dir, 'transactions') is not None:
+        transactions_df = read_parquet(output_dir, 'transactions')
+        transactions_df['created_at'] = transactions_df['created_at'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        transactions_df = pd.read_csv(os.path.join(output_dir, 'transactions.csv'))
     
     # Generate all datasets
     brands_df, brand_id_map = generate_brands()
@@ -241,14 +257,22 @@ def main():
     devices_df = generate_devices(transactions_df)
     
     # Save all datasets
-    output_dir = '/home/ubuntu/enhanced_output'
-    
     print("\nSaving supporting datasets...")
-    brands_df.to_csv(f'{output_dir}/brands.csv', index=False)
-    products_df.to_csv(f'{output_dir}/products.csv', index=False)
-    transaction_items_df.to_csv(f'{output_dir}/transaction_items.csv', index=False)
-    customers_df.to_csv(f'{output_dir}/customers.csv', index=False)
-    devices_df.to_csv(f'{output_dir}/devices.csv', index=False)
+    datasets = {
+        'brands': brands_df,
+        'products': products_df,
+        'transaction_items': transaction_items_df,
+        'customers': customers_df,
+        'devices': devices_df
+    }
+    # Items land in their transaction's month partition
+    transaction_months = dict(zip(transactions_df['transaction_id'], transactions_df['created_at'].str[:7]))
+    for table_name, df in datasets.items():
+        if args.format in ('csv', 'both'):
+            df.to_csv(f'{output_dir}/{table_name}.csv', index=False)
+        if args.format in ('parquet', 'both'):
+            months = df['transaction_id'].map(transaction_months).tolist() if table_name == 'transaction_items' else None
+            write_parquet(df, output_dir, table_name, months)
     
     # Generate summary
     print("\n=== Supporting Datasets Summary ===")
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 """
 Quick CSV column inspector to match database schema
+Parquet datasets are described from their footers (types and row counts, no data read)
 """
 
 import pandas as pd
 import os
 
+from parquet_dataset import pa, parquet_path, read_schema
+
 csv_files = [
     'stores.csv', 'brands.csv', 'products.csv', 'customers.csv', 
     'devices.csv', 'transactions.csv', 'transaction_items.csv',
@@ -16,10 +19,14 @@ csv_dir = './enhanced_output'
 
 for csv_file in csv_files:
     csv_path = os.path.join(csv_dir, csv_file)
-    if os.path.exists(csv_path):
+    table_name = csv_file[:-len('.csv')]
+    if pa is not None and parquet_path(csv_dir, table_name) is not None:
+        schema, rows = read_schema(csv_dir, table_name)
+        print(f"\n{table_name}/ (Parquet, {rows:,} rows):")
+        print(f"Columns: {[f'{field.name}: {field.type}' for field in schema]}")
+    elif os.path.exists(csv_path):
         df = pd.read_csv(csv_path, nrows=0)  # Just read headers
         print(f"\n{csv_file}:")
         print(f"Columns: {list(df.columns)}")
     else:
         print(f"\n{csv_file}: NOT FOUND")
-
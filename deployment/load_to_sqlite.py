@@ -7,9 +7,57 @@ Loads enhanced CSV data into SQLite database for local development
 import sqlite3
 import pandas as pd
 import argparse
+import hashlib
+import io
+import json
 import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
 
+from build_aggregates import build_aggregates, refresh_aggregates
+from partition_sqlite import drop_partitioned_facts, write_partitions
+from compact_storage import compact_database
+from parquet_dataset import SNAPSHOT_TABLES, iter_parquet_frames, parquet_path, require_pyarrow, write_snapshot
+from dataset_versions import (REQUIRED_TABLES, activate_version, new_version_path, prune_versions, validate_database,
+                              versions_dir)
+
+# Secondary indexes, built once every row is in (maintaining them row by row is far slower)
+LOAD_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_store_id ON transactions(store_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_region ON transactions(region)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_customer_id ON transactions(customer_id)",
+    "CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)",
+    "CREATE INDEX IF NOT EXISTS idx_products_brand_id ON products(brand_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transaction_items_transaction_id ON transaction_items(transaction_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transaction_items_product_id ON transaction_items(product_id)",
+    "CREATE INDEX IF NOT EXISTS idx_substitutions_transaction_id ON substitutions(transaction_id)",
+    "CREATE INDEX IF NOT EXISTS idx_request_behaviors_transaction_id ON request_behaviors(transaction_id)"
+]
+
+# Bulk-load settings: no rollback journal or fsyncs; a crash mid-load means rerunning the load
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA locking_mode=EXCLUSIVE",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-131072"
+]
+
+# SQLite's default SQLITE_MAX_ATTACHED: staged files are merged this many at a time
+ATTACH_LIMIT = 10
+
+RESTORE_PRAGMAS = [
+    "PRAGMA journal_mode=DELETE",
+    "PRAGMA synchronous=FULL",
+    "PRAGMA locking_mode=NORMAL"
+]
+
 def create_tables(cursor):
     """Create all necessary tables with proper schema matching actual CSV structure"""
     
@@ -167,6 +215,15 @@ def create_tables(cursor):
     )
     ''')
 
+def discard_table(conn, table_name):
+    """Empty a table whose load failed; with journal_mode=OFF a rollback cannot undo its rows"""
+    conn.rollback()
+    conn.execute(f"DELETE FROM {table_name}")
+    conn.commit()
+
+def clean_columns(columns):
+    return columns.str.strip().str.replace(' ', '_').str.replace('-', '_')
+
 def load_csv_to_table(csv_path, table_name, cursor, conn):
     """Load CSV data into specified table"""
     if not os.path.exists(csv_path):
@@ -177,7 +234,7 @@ def load_csv_to_table(csv_path, table_name, cursor, conn):
         df = pd.read_csv(csv_path)
         
         # Clean column names (remove spaces, special chars)
-        df.columns = df.columns.str.strip().str.replace(' ', '_').str.replace('-', '_')
+        df.columns = clean_columns(df.columns)
         
         # Insert data
         df.to_sql(table_name, conn, if_exists='append', index=False)
@@ -187,26 +244,501 @@ def load_csv_to_table(csv_path, table_name, cursor, conn):
         return row_count
         
     except Exception as e:
-        print(f"❌ Error loading {table_name}: {e}")
+        discard_table(conn, table_name)
+        raise ValueError(f"{table_name}: {e}") from e
+
+def insert_chunks(conn, table_name, chunks):
+    """executemany each DataFrame chunk into table_name; returns the row count"""
+    table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    row_count = 0
+    insert = None
+    for chunk in chunks:
+        chunk.columns = clean_columns(chunk.columns)
+        if insert is None:
+            columns = [column for column in chunk.columns if column in table_columns]
+            skipped = [column for column in chunk.columns if column not in table_columns]
+            if skipped:
+                print(f"   ⚠️  {table_name}: ignoring columns not in the schema: {', '.join(skipped)}")
+            insert = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        chunk = chunk[columns].astype(object)
+        conn.executemany(insert, chunk.where(chunk.notna(), None).values.tolist())
+        row_count += len(chunk)
+    return row_count
+
+def stream_csv_to_table(csv_path, table_name, conn, chunk_size=50000):
+    """Load a CSV in bounded chunks with executemany inside one transaction per table"""
+    if not os.path.exists(csv_path):
+        print(f"Warning: {csv_path} not found, skipping {table_name}")
+        return 0
+    
+    started = time.perf_counter()
+    try:
+        with conn:
+            row_count = insert_chunks(conn, table_name, pd.read_csv(csv_path, chunksize=chunk_size))
+    except Exception as e:
+        discard_table(conn, table_name)
+        raise ValueError(f"{table_name}: {e}") from e
+    
+    elapsed = time.perf_counter() - started
+    print(f"✅ Loaded {row_count:,} rows into {table_name} ({row_count / elapsed if elapsed else 0:,.0f} rows/s)")
+    return row_count
+
+def stream_parquet_to_table(data_dir, table_name, conn, chunk_size=50000):
+    """Load a Parquet dataset reading only the table's columns, streamed row group by row group"""
+    if parquet_path(data_dir, table_name) is None:
+        print(f"Warning: {Path(data_dir) / table_name} not found, skipping {table_name}")
         return 0
+    
+    started = time.perf_counter()
+    table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    try:
+        with conn:
+            row_count = insert_chunks(conn, table_name, iter_parquet_frames(data_dir, table_name, table_columns, chunk_size))
+    except Exception as e:
+        discard_table(conn, table_name)
+        raise ValueError(f"{table_name}: {e}") from e
+    
+    elapsed = time.perf_counter() - started
+    print(f"✅ Loaded {row_count:,} rows into {table_name} from Parquet ({row_count / elapsed if elapsed else 0:,.0f} rows/s)")
+    return row_count
+
+def split_csv(csv_path, target_bytes):
+    """Byte ranges of roughly target_bytes that start and end on record boundaries
+
+    A newline ends a record only outside quotes (text fields such as
+    transcription_text may contain newlines), i.e. where the number of quote
+    characters seen so far is even. Returns the header bytes and the ranges.
+    """
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        start = f.tell()
+        offset = start
+        quotes = 0
+        next_cut = start + target_bytes
+        ranges = []
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            position = 0
+            while offset + len(block) > next_cut:
+                search = max(position, next_cut - offset)
+                quotes += block.count(b'"', position, search)
+                position = search
+                newline = block.find(b'\n', position)
+                while newline >= 0:
+                    quotes += block.count(b'"', position, newline)
+                    position = newline + 1
+                    if quotes % 2 == 0:
+                        break
+                    newline = block.find(b'\n', position)
+                if newline < 0:
+                    # No boundary left in this block; keep looking in the next one
+                    break
+                ranges.append((start, offset + position))
+                start = offset + position
+                next_cut = start + target_bytes
+            quotes += block.count(b'"', position)
+            offset += len(block)
+        if start < offset:
+            ranges.append((start, offset))
+    return header, ranges
+
+def stage_csv_range(job):
+    """Process-pool worker: parse one CSV byte range into its own staging SQLite file"""
+    csv_path, table_name, start, end, header, staging_path, chunk_size = job
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        data = header + f.read(end - start)
+    conn = sqlite3.connect(staging_path)
+    try:
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+        create_tables(conn.cursor())
+        with conn:
+            rows = insert_chunks(conn, table_name, pd.read_csv(io.BytesIO(data), chunksize=chunk_size))
+    finally:
+        conn.close()
+    return table_name, staging_path, rows
+
+def parallel_load(csv_dir, tables_to_load, conn, staging_dir, workers, chunk_size=50000, target_bytes=32 << 20):
+    """Parse CSVs into staging databases in a process pool, then merge them in dependency order
+
+    Each table merges ATTACH_LIMIT staged files per transaction. A failure
+    empties the table and raises ValueError, aborting the load.
+    """
+    jobs = []
+    for csv_file, table_name in tables_to_load:
+        csv_path = csv_dir / csv_file
+        if not csv_path.exists():
+            print(f"Warning: {csv_path} not found, skipping {table_name}")
+            continue
+        header, ranges = split_csv(csv_path, target_bytes)
+        for part, (start, end) in enumerate(ranges):
+            staging_path = str(Path(staging_dir) / f"{table_name}-{part:04d}.db")
+            jobs.append((str(csv_path), table_name, start, end, header, staging_path, chunk_size))
+    
+    print(f"⚡ Staging {len(jobs)} CSV chunks across {workers} worker processes")
+    started = time.perf_counter()
+    staged = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(stage_csv_range, job): job for job in jobs}
+        for future in as_completed(futures):
+            table_name = futures[future][1]
+            try:
+                _, staging_path, rows = future.result()
+            except Exception as e:
+                for pending in futures:
+                    pending.cancel()
+                raise ValueError(f"staging {table_name}: {e}") from e
+            staged.setdefault(table_name, []).append((staging_path, rows))
+    print(f"✅ Staged in {time.perf_counter() - started:.1f}s")
+    
+    # Merge in dependency order; ranges within a table keep file order
+    total_rows = 0
+    for _, table_name in tables_to_load:
+        if table_name not in staged:
+            continue
+        merge_started = time.perf_counter()
+        parts = sorted(staged[table_name])
+        rows = sum(part_rows for _, part_rows in parts)
+        attached = []
+        try:
+            for first in range(0, len(parts), ATTACH_LIMIT):
+                # DETACH is refused inside a transaction, so each group is attached up front and committed
+                for number, (staging_path, _) in enumerate(parts[first:first + ATTACH_LIMIT]):
+                    conn.execute(f"ATTACH DATABASE ? AS staging{number}", (staging_path,))
+                    attached.append(f"staging{number}")
+                with conn:
+                    for schema in attached:
+                        conn.execute(f"INSERT INTO main.{table_name} SELECT * FROM {schema}.{table_name}")
+                while attached:
+                    conn.execute(f"DETACH DATABASE {attached.pop()}")
+        except sqlite3.Error as e:
+            discard_table(conn, table_name)
+            raise ValueError(f"{table_name}: {e}") from e
+        finally:
+            for schema in attached:
+                conn.execute(f"DETACH DATABASE {schema}")
+        elapsed = time.perf_counter() - merge_started
+        print(f"✅ Loaded {rows:,} rows into {table_name} ({len(staged[table_name])} chunks, merged in {elapsed:.1f}s)")
+        total_rows += rows
+    return total_rows
+
+# Tables whose rows carry a timestamp: rows older than the last load's high-water mark are skipped
+WATERMARK_COLUMNS = {
+    'transactions': 'created_at',
+    'request_behaviors': 'timestamp',
+    'substitutions': 'timestamp'
+}
+
+FINGERPRINT_BYTES = 1 << 20
+FINGERPRINT_SAMPLES = 16
+FINGERPRINT_SAMPLE_BYTES = 64 << 10
+
+def create_watermark_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS load_watermarks (
+        table_name TEXT PRIMARY KEY,
+        source_file TEXT,
+        file_size INTEGER,
+        fingerprint TEXT,
+        watermark_column TEXT,
+        high_water TEXT,
+        loaded_at TEXT
+    )
+    ''')
+    # Every key an incremental load inserted or updated, committed with the rows
+    # themselves; consumers (mine_baskets.py) remember the last seq they processed
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS load_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        table_name TEXT,
+        key,
+        change TEXT,
+        loaded_at TEXT
+    )
+    ''')
+
+def file_fingerprint(path, size):
+    """Hash of the size plus the first and last MiB and evenly spaced samples of the first size bytes
+
+    Sampled rather than a full hash so a daily delta does not re-read the
+    whole history; a restated history should be loaded without --incremental.
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        blocks = [(0, FINGERPRINT_BYTES), (max(0, size - FINGERPRINT_BYTES), FINGERPRINT_BYTES)]
+        blocks += [(size * i // (FINGERPRINT_SAMPLES + 1), FINGERPRINT_SAMPLE_BYTES)
+                   for i in range(1, FINGERPRINT_SAMPLES + 1)]
+        for offset, length in blocks:
+            f.seek(offset)
+            digest.update(f.read(min(length, size - offset)))
+    return digest.hexdigest()
+
+def read_csv_tail(csv_path, offset, chunk_size):
+    """Chunks of the records after byte offset (the end of the previous load)"""
+    columns = list(pd.read_csv(csv_path, nrows=0).columns)
+    f = open(csv_path, 'rb')
+    f.seek(offset)
+    try:
+        yield from pd.read_csv(f, header=None, names=columns, chunksize=chunk_size)
+    finally:
+        f.close()
+
+def upsert_staged(conn, table_name):
+    """Merge temp.incremental_stage into table_name; returns (inserted, updated) keys
+
+    Rows identical to the stored version are left alone. The previous
+    versions of updated rows are kept in temp.replaced_<table_name> so
+    rollups can retract them.
+    """
+    info = list(conn.execute(f"PRAGMA main.table_info({table_name})"))
+    columns = [row[1] for row in info]
+    key = next(row[1] for row in info if row[5])
+    same = ' AND '.join(f"m.{column} IS s.{column}" for column in columns)
+
+    conn.execute("DROP TABLE IF EXISTS temp.incremental_changes")
+    conn.execute(f'''
+    CREATE TEMP TABLE incremental_changes AS
+    SELECT s.{key} AS key, m.{key} IS NOT NULL AS existed
+    FROM temp.incremental_stage s
+    LEFT JOIN main.{table_name} m ON m.{key} = s.{key}
+    WHERE m.{key} IS NULL OR NOT ({same})
+    ''')
+    conn.execute(f'''
+    INSERT INTO temp.replaced_{table_name}
+    SELECT m.* FROM main.{table_name} m
+    JOIN temp.incremental_changes c ON c.key = m.{key} AND c.existed
+    ''')
+    assignments = ', '.join(f"{column} = excluded.{column}" for column in columns if column != key)
+    conn.execute(f'''
+    INSERT INTO main.{table_name} ({', '.join(columns)})
+    SELECT {', '.join('s.' + column for column in columns)} FROM temp.incremental_stage s
+    WHERE s.{key} IN (SELECT key FROM temp.incremental_changes)
+    ON CONFLICT({key}) DO UPDATE SET {assignments}
+    ''')
+    inserted = [row[0] for row in conn.execute("SELECT DISTINCT key FROM temp.incremental_changes WHERE NOT existed")]
+    updated = [row[0] for row in conn.execute("SELECT DISTINCT key FROM temp.incremental_changes WHERE existed")]
+    conn.execute("DELETE FROM temp.incremental_stage")
+    return inserted, updated
+
+def incremental_load_table(csv_path, table_name, conn, chunk_size=50000, lookback_hours=24):
+    """Load only what changed in one CSV since the last load; returns its changed keys, or None when the CSV is missing
+
+    Raises ValueError when the table fails; its changes are rolled back.
+    """
+    if not os.path.exists(csv_path):
+        print(f"Warning: {csv_path} not found, skipping {table_name}")
+        return None
+    
+    started = time.perf_counter()
+    size = os.path.getsize(csv_path)
+    state = conn.execute(
+        "SELECT file_size, fingerprint, high_water FROM load_watermarks WHERE table_name = ?", (table_name,)
+    ).fetchone()
+    watermark_column = WATERMARK_COLUMNS.get(table_name)
+    high_water = None
+    
+    if state and state[0] == size and state[1] == file_fingerprint(csv_path, size):
+        print(f"⏭️  {table_name}: unchanged since last load")
+        return {"inserted": [], "updated": []}
+    if state and size > state[0] and state[1] == file_fingerprint(csv_path, state[0]):
+        # Append-only growth: parse just the new bytes
+        chunks = read_csv_tail(csv_path, state[0], chunk_size)
+        source = f"appended {size - state[0]:,} bytes"
+    else:
+        chunks = pd.read_csv(csv_path, chunksize=chunk_size)
+        source = "full file" if not state else "rewritten file"
+        if state and watermark_column:
+            high_water = state[2]
+    
+    conn.execute("DROP TABLE IF EXISTS temp.incremental_stage")
+    conn.execute(f"CREATE TEMP TABLE incremental_stage AS SELECT * FROM main.{table_name} WHERE 0")
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS replaced_{table_name} AS SELECT * FROM main.{table_name} WHERE 0")
+    inserted, updated = [], []
+    scanned = 0
+    loaded_at = datetime.now().isoformat()
+    try:
+        with conn:
+            for chunk in chunks:
+                scanned += insert_chunks(conn, 'incremental_stage', [chunk])
+                if high_water is not None:
+                    # Rows older than the high-water mark (less a window for late corrections) are settled
+                    conn.execute(f"DELETE FROM temp.incremental_stage WHERE {watermark_column} < datetime(?, ?)",
+                                 (high_water, f"-{lookback_hours} hours"))
+                chunk_inserted, chunk_updated = upsert_staged(conn, table_name)
+                conn.executemany(
+                    "INSERT INTO load_changes (table_name, key, change, loaded_at) VALUES (?, ?, ?, ?)",
+                    [(table_name, key, 'inserted', loaded_at) for key in chunk_inserted] +
+                    [(table_name, key, 'updated', loaded_at) for key in chunk_updated]
+                )
+                inserted.extend(chunk_inserted)
+                updated.extend(chunk_updated)
+            
+            new_high_water = None
+            if watermark_column:
+                new_high_water = conn.execute(f"SELECT MAX({watermark_column}) FROM main.{table_name}").fetchone()[0]
+            conn.execute('''
+            INSERT OR REPLACE INTO load_watermarks VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (table_name, str(csv_path), size, file_fingerprint(csv_path, size), watermark_column,
+                  new_high_water, loaded_at))
+    except Exception as e:
+        # The with block has rolled back this table's rows, changes and watermark
+        raise ValueError(f"{table_name}: {e}") from e
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.incremental_stage")
+    
+    elapsed = time.perf_counter() - started
+    print(f"✅ {table_name}: {source}, {scanned:,} rows scanned, {len(inserted):,} inserted, "
+          f"{len(updated):,} updated in {elapsed:.1f}s")
+    return {"inserted": inserted, "updated": updated}
+
+def incremental_load(csv_dir, tables_to_load, conn, chunk_size=50000, lookback_hours=24):
+    """Upsert new and changed rows of every CSV; returns the changed keys per table"""
+    create_watermark_table(conn)
+    changes = {}
+    for csv_file, table_name in tables_to_load:
+        table_changes = incremental_load_table(csv_dir / csv_file, table_name, conn, chunk_size, lookback_hours)
+        if table_changes is not None:
+            changes[table_name] = table_changes
+    return changes
+
+def write_changes(changes, path):
+    """Changed keys per table for a downstream MERGE into Azure SQL (migrate_to_azure_sql.py --changes)"""
+    with open(path, 'w') as f:
+        json.dump({"created_at": datetime.now().isoformat(), "tables": changes}, f)
+    total = sum(len(keys['inserted']) + len(keys['updated']) for keys in changes.values())
+    print(f"📝 Wrote {total:,} changed keys to {path}")
+
+def create_indexes(conn, analyze=True):
+    """Build secondary indexes and refresh planner statistics after the load"""
+    started = time.perf_counter()
+    for index_sql in LOAD_INDEXES:
+        try:
+            conn.execute(index_sql)
+        except sqlite3.Error as e:
+            print(f"  Warning: Could not create index: {e}")
+    # A small delta only needs statistics refreshed where they drifted
+    conn.execute("ANALYZE" if analyze else "PRAGMA optimize")
+    conn.commit()
+    print(f"✅ Built {len(LOAD_INDEXES)} indexes and ran {'ANALYZE' if analyze else 'PRAGMA optimize'} in {time.perf_counter() - started:.1f}s")
+
+def peak_memory_mb():
+    # ru_maxrss is KiB on Linux; children covers parallel-mode workers
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+def load_tables(args, csv_dir, tables_to_load, db_path, conn, cursor):
+    """Load every table the way args ask; returns (rows, changes, first_load)
+
+    Raises ValueError when a table fails; that table is left empty, or unchanged by an incremental load.
+    """
+    total_rows = 0
+    changes = None
+    first_load = False
+    if args.incremental:
+        first_load = not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'load_watermarks'").fetchone()
+        changes = incremental_load(csv_dir, tables_to_load, conn, args.chunk_size, args.lookback_hours)
+        total_rows = sum(len(keys['inserted']) + len(keys['updated']) for keys in changes.values())
+    elif args.mode == 'parallel':
+        staging_dir = tempfile.mkdtemp(prefix='.staging-', dir=db_path.parent)
+        try:
+            total_rows = parallel_load(csv_dir, tables_to_load, conn, staging_dir, args.workers,
+                                       args.chunk_size, args.split_mb << 20)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    else:
+        for csv_file, table_name in tables_to_load:
+            csv_path = csv_dir / csv_file
+            if args.format == 'parquet':
+                rows_loaded = stream_parquet_to_table(csv_dir, table_name, conn, args.chunk_size)
+            elif args.mode == 'streaming':
+                rows_loaded = stream_csv_to_table(csv_path, table_name, conn, args.chunk_size)
+            else:
+                rows_loaded = load_csv_to_table(csv_path, table_name, cursor, conn)
+            total_rows += rows_loaded
+    return total_rows, changes, first_load
+
+def served_path_in_versions(db_path):
+    """Whether db_path resolves into the blue/green versions directory"""
+    return versions_dir(db_path).resolve() in Path(db_path).resolve().parents
 
 def main():
     parser = argparse.ArgumentParser(description='Load Scout Analytics CSV data into SQLite')
-    parser.add_argument('--csv_dir', required=True, help='Directory containing CSV files')
+    parser.add_argument('--csv_dir', required=True, help='Directory containing CSV files or Parquet datasets')
     parser.add_argument('--db_path', required=True, help='Output SQLite database path')
+    parser.add_argument('--mode', choices=['pandas', 'streaming', 'parallel'], default='streaming',
+                        help='pandas reads each CSV whole; streaming loads bounded chunks with bulk-load PRAGMAs; '
+                             'parallel stages CSV chunks in a process pool and merges them')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=50000,
+                        help='Rows per chunk in streaming and parallel mode')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes in parallel mode')
+    parser.add_argument('--split-mb', dest='split_mb', type=int, default=32,
+                        help='CSV bytes per staged chunk in parallel mode')
+    parser.add_argument('--partition-by', dest='partition_by', choices=['none', 'month', 'month_region'], default='none',
+                        help='Also write transactions into one SQLite file per month (or month and region)')
+    parser.add_argument('--partition_dir', help='Partition directory (default: partitions/ next to the database)')
+    parser.add_argument('--drop-facts', dest='drop_facts', action='store_true',
+                        help='Keep fact rows only in the partitions, not in the main database')
+    parser.add_argument('--blue-green', dest='blue_green', action='store_true',
+                        help='Build into a new version directory, validate, then atomically repoint db_path at it')
+    parser.add_argument('--keep-versions', dest='keep_versions', type=int, default=3,
+                        help='Dataset versions to keep with --blue-green')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Upsert only rows that are new or changed since the last load and refresh rollups for them')
+    parser.add_argument('--storage', choices=['text', 'compact', 'star'], default='text',
+                        help='compact stores fact tables with integer keys, epoch timestamps and dictionary codes; '
+                             'star also builds the denormalized fact_sales_line and dim_date tables')
+    parser.add_argument('--lookback-hours', dest='lookback_hours', type=int, default=24,
+                        help='With --incremental, recheck timestamped rows this far behind the high-water mark')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv',
+                        help='parquet reads <csv_dir>/<table>/ datasets written by the generators (needs pyarrow)')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Also export the API snapshot tables as memory-mappable Arrow files (needs pyarrow)')
     
     args = parser.parse_args()
+    if args.incremental and not args.blue_green and served_path_in_versions(args.db_path):
+        parser.error('--db_path points into a published version; an in-place --incremental load would change it '
+                     'under the API and under older versions kept for rollback; add --blue-green')
+    if args.incremental and args.drop_facts:
+        parser.error('--incremental needs the fact rows in the main database; drop --drop-facts')
+    if args.incremental and args.storage == 'compact':
+        parser.error('--incremental upserts into text fact tables; it cannot be combined with --storage compact')
+    if args.drop_facts and args.storage == 'star':
+        parser.error('--storage star keeps a copy of every line in the main database; drop --drop-facts')
+    if args.format == 'parquet' and (args.mode != 'streaming' or args.incremental):
+        parser.error('--format parquet loads in --mode streaming without --incremental')
+    if args.format == 'parquet' or args.snapshot:
+        require_pyarrow()
     
     csv_dir = Path(args.csv_dir)
-    db_path = Path(args.db_path)
+    served_path = Path(args.db_path)
     
     # Create database directory if it doesn't exist
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+    served_path.parent.mkdir(parents=True, exist_ok=True)
     
-    # Remove existing database
-    if db_path.exists():
-        db_path.unlink()
-        print(f"🗑️  Removed existing database: {db_path}")
+    if args.blue_green:
+        # Build beside the live version; the API keeps serving it until the flip
+        db_path = new_version_path(served_path)
+        if args.incremental and served_path.exists():
+            # Apply the delta to a copy of the live version
+            source = sqlite3.connect(str(served_path.resolve()))
+            target = sqlite3.connect(str(db_path))
+            source.backup(target)
+            target.close()
+            source.close()
+            print(f"📋 Copied live version {served_path.resolve().parent.name} as the base for the delta")
+    elif args.incremental:
+        db_path = served_path
+    else:
+        db_path = served_path
+        # Remove existing database
+        if db_path.exists():
+            db_path.unlink()
+            print(f"🗑️  Removed existing database: {db_path}")
     
     # Connect to SQLite database
     conn = sqlite3.connect(str(db_path))
@@ -231,19 +763,42 @@ def main():
         ('substitutions.csv', 'substitutions')
     ]
     
-    total_rows = 0
-    for csv_file, table_name in tables_to_load:
-        csv_path = csv_dir / csv_file
-        rows_loaded = load_csv_to_table(csv_path, table_name, cursor, conn)
-        total_rows += rows_loaded
+    load_started = time.perf_counter()
+    bulk = args.mode != 'pandas' and not (args.incremental and not args.blue_green)
+    if bulk:
+        # Not for in-place incremental loads: the API may be reading this file
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(pragma)
+    
+    try:
+        total_rows, changes, first_load = load_tables(args, csv_dir, tables_to_load, db_path, conn, cursor)
+    except ValueError as e:
+        conn.close()
+        print(f"❌ Load aborted{', keeping the live version' if args.blue_green else '; rerun it'}: {e}")
+        raise SystemExit(1)
     
     # Commit changes
     conn.commit()
+    load_seconds = time.perf_counter() - load_started
+    
+    create_indexes(conn, analyze=not args.incremental)
+    if bulk:
+        for pragma in RESTORE_PRAGMAS:
+            conn.execute(pragma)
+    
+    # Build rollups served by the API
+    if changes is not None and not first_load:
+        refresh_aggregates(conn, changes)
+    else:
+        build_aggregates(conn, star=args.storage == 'star')
+    if changes is not None:
+        write_changes(changes, db_path.parent / f"{db_path.stem}.changes.json")
     
     # Print summary
     print(f"\n🎉 Database loading complete!")
     print(f"📁 Database: {db_path}")
-    print(f"📊 Total rows loaded: {total_rows:,}")
+    print(f"📊 Total rows {'changed' if args.incremental else 'loaded'}: {total_rows:,} in {load_seconds:.1f}s ({total_rows / load_seconds if load_seconds else 0:,.0f} rows/s)")
+    print(f"🧠 Peak memory: {peak_memory_mb():,.0f} MB")
     
     # Verify data
     print(f"\n📋 Table Summary:")
@@ -256,6 +811,38 @@ def main():
             print(f"   {table_name}: ❌ error")
     
     conn.close()
+    
+    # Partitioned storage: per-month fact files the API fans queries out over
+    if args.partition_by != 'none':
+        write_partitions(db_path, args.partition_dir or db_path.parent / 'partitions', args.partition_by)
+        if args.drop_facts:
+            drop_partitioned_facts(db_path)
+    
+    # Compact storage last: rollups and partitions are built from the text tables
+    if args.storage == 'compact':
+        compact_database(db_path)
+    
+    # Snapshot last, from the final file; a stale one from an earlier load must not survive
+    snapshot_dir = db_path.parent / 'snapshot'
+    if (snapshot_dir / 'manifest.json').exists():
+        shutil.rmtree(snapshot_dir)
+    if args.snapshot:
+        conn = sqlite3.connect(str(db_path))
+        try:
+            write_snapshot(conn, db_path, snapshot_dir, SNAPSHOT_TABLES)
+        finally:
+            conn.close()
+    
+    # Publish the new version only once it validates
+    if args.blue_green:
+        try:
+            validate_database(db_path, ['stores', 'products'] if args.drop_facts else REQUIRED_TABLES)
+        except ValueError as e:
+            print(f"❌ New dataset failed validation, keeping the live version: {e}")
+            raise SystemExit(1)
+        activate_version(served_path, db_path)
+        prune_versions(served_path, args.keep_versions)
+    
     print(f"\n✅ Ready for local development!")
     print(f"🚀 Next: cd scout-analytics-api && uvicorn main:app --reload --port 8000")
 
@@ -5,6 +5,7 @@ Migrates SQLite data to Azure SQL Database
 """
 
 import argparse
+import json
 import sqlite3
 import pyodbc
 import sys
@@ -12,6 +13,15 @@ import os
 from pathlib import Path
 from datetime import datetime
 
+from bulk_migrate import DEFAULT_WORKERS, RejectLog, add_bulk_arguments, bulk_migrator, target_name
+from compact_storage import migrated_columns, primary_key
+from table_swap import finalize_staging, prepare_staging, staging_exists, staging_schema, swap_tables
+from verify_migration import DEFAULT_BUCKETS, DEFAULT_MAX_DRILLDOWN, add_verify_arguments, verify_tables
+
+# Blue/green: data is loaded into the schema the API is not reading, then the pointer flips
+BLUE_GREEN_SCHEMAS = ('scout_blue', 'scout_green')
+POINTER_TABLE = 'dbo.scout_dataset_pointer'
+
 def create_azure_tables(cursor, schema='dbo'):
     """Create tables in Azure SQL Database if they don't exist"""
     
@@ -51,9 +61,9 @@ def create_azure_tables(cursor, schema='dbo'):
     """)
     
     # Brands table
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='brands' AND xtype='U')
-    CREATE TABLE brands (
+    cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'brands')
+    CREATE TABLE {schema}.brands (
         brand_id INT PRIMARY KEY,
         brand_name NVARCHAR(255),
         category NVARCHAR(255)
@@ -61,65 +71,65 @@ def create_azure_tables(cursor, schema='dbo'):
     """)
     
     # Products table
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='products' AND xtype='U')
-    CREATE TABLE products (
+    cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'products')
+    CREATE TABLE {schema}.products (
         product_id INT PRIMARY KEY,
         product_name NVARCHAR(255),
         brand_id INT,
         category NVARCHAR(255),
         unit_price DECIMAL(10,2),
-        FOREIGN KEY (brand_id) REFERENCES brands(brand_id)
+        FOREIGN KEY (brand_id) REFERENCES {schema}.brands(brand_id)
     )
     """)
     
     # Transactions table
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='transactions' AND xtype='U')
-    CREATE TABLE transactions (
+    cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'transactions')
+    CREATE TABLE {schema}.transactions (
         transaction_id INT PRIMARY KEY,
         store_id INT,
         customer_id INT,
         transaction_datetime DATETIME,
         total_amount DECIMAL(10,2),
-        FOREIGN KEY (store_id) REFERENCES stores(store_id),
-        FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
+        FOREIGN KEY (store_id) REFERENCES {schema}.stores(store_id),
+        FOREIGN KEY (customer_id) REFERENCES {schema}.customers(customer_id)
     )
     """)
     
     # Transaction items table
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='transaction_items' AND xtype='U')
-    CREATE TABLE transaction_items (
+    cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'transaction_items')
+    CREATE TABLE {schema}.transaction_items (
         item_id INT IDENTITY(1,1) PRIMARY KEY,
         transaction_id INT,
         product_id INT,
         quantity INT,
         unit_price DECIMAL(10,2),
         discount DECIMAL(10,2),
-        FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id),
-        FOREIGN KEY (product_id) REFERENCES products(product_id)
+        FOREIGN KEY (transaction_id) REFERENCES {schema}.transactions(transaction_id),
+        FOREIGN KEY (product_id) REFERENCES {schema}.products(product_id)
     )
     """)
     
     # Substitutions table
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='substitutions' AND xtype='U')
-    CREATE TABLE substitutions (
+    cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'substitutions')
+    CREATE TABLE {schema}.substitutions (
         substitution_id INT IDENTITY(1,1) PRIMARY KEY,
         transaction_id INT,
         original_product_id INT,
         substituted_product_id INT,
         reason NVARCHAR(255),
-        FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id),
-        FOREIGN KEY (original_product_id) REFERENCES products(product_id),
-        FOREIGN KEY (substituted_product_id) REFERENCES products(product_id)
+        FOREIGN KEY (transaction_id) REFERENCES {schema}.transactions(transaction_id),
+        FOREIGN KEY (original_product_id) REFERENCES {schema}.products(product_id),
+        FOREIGN KEY (substituted_product_id) REFERENCES {schema}.products(product_id)
     )
     """)
     
     print("✅ Tables created successfully")
 
-def clear_existing_data(azure_conn):
+def clear_existing_data(azure_conn, schema='dbo'):
     """Clear existing data from tables (preserve structure)"""
     cursor = azure_conn.cursor()
     
@@ -129,7 +139,7 @@ def clear_existing_data(azure_conn):
     
     for table in tables:
         try:
-            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"DELETE FROM {schema}.{table}")
             print(f"✅ Cleared data from table: {table}")
         except Exception as e:
             print(f"⚠️  Could not clear table {table}: {e}")
@@ -137,18 +147,16 @@ def clear_existing_data(azure_conn):
     azure_conn.commit()
     print("✅ Cleared all existing data")
 
-def migrate_table_data(sqlite_conn, azure_conn, table_name, batch_size=1000):
+def migrate_table_data(sqlite_conn, azure_conn, table_name, batch_size=1000, schema='dbo'):
     """Migrate data from SQLite to Azure SQL for a specific table"""
     print(f"📊 Migrating {table_name}...")
     
     # Get data from SQLite
     sqlite_cursor = sqlite_conn.cursor()
-    sqlite_cursor.execute(f"SELECT * FROM {table_name}")
-    
-    # Get column names
-    columns = [description[0] for description in sqlite_cursor.description]
+    columns = migrated_columns(sqlite_conn, table_name)
     column_names = ', '.join(columns)
     placeholders = ', '.join(['?' for _ in columns])
+    sqlite_cursor.execute(f"SELECT {column_names} FROM {table_name}")
     
     azure_cursor = azure_conn.cursor()
     
@@ -160,7 +168,7 @@ def migrate_table_data(sqlite_conn, azure_conn, table_name, batch_size=1000):
             break
             
         # Insert batch into Azure SQL
-        insert_sql = f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})"
+        insert_sql = f"INSERT INTO {schema}.{table_name} ({column_names}) VALUES ({placeholders})"
         try:
             azure_cursor.executemany(insert_sql, rows)
             azure_conn.commit()
@@ -181,8 +189,104 @@ def migrate_table_data(sqlite_conn, azure_conn, table_name, batch_size=1000):
     print(f"✅ Completed migration of {table_name}: {total_rows} total rows")
     return total_rows
 
-def migrate_data(sqlite_path, azure_conn_str):
-    """Migrate data from SQLite to Azure SQL"""
+def sync_changed_rows(sqlite_conn, azure_conn, table_name, keys, batch_size=1000, schema='dbo'):
+    """Upsert just the rows with the given keys (from load_to_sqlite.py --incremental) with MERGE"""
+    key = primary_key(sqlite_conn, table_name)
+    columns = migrated_columns(sqlite_conn, table_name)
+    azure_cursor = azure_conn.cursor()
+    total_rows = 0
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        rows = sqlite_conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table_name} WHERE {key} IN ({', '.join('?' for _ in batch)})",
+            batch).fetchall()
+        if not rows:
+            continue
+        
+        column_names = ', '.join(columns)
+        azure_cursor.fast_executemany = True
+        azure_cursor.execute("IF OBJECT_ID('tempdb..#sync_stage') IS NOT NULL DROP TABLE #sync_stage")
+        azure_cursor.execute(f"SELECT TOP 0 {column_names} INTO #sync_stage FROM {schema}.{table_name}")
+        azure_cursor.executemany(
+            f"INSERT INTO #sync_stage ({column_names}) VALUES ({', '.join('?' for _ in columns)})", rows)
+        assignments = ', '.join(f"target.{column} = source.{column}" for column in columns if column != key)
+        azure_cursor.execute(f"""
+        MERGE {schema}.{table_name} AS target
+        USING #sync_stage AS source ON target.{key} = source.{key}
+        WHEN MATCHED THEN UPDATE SET {assignments}
+        WHEN NOT MATCHED THEN INSERT ({column_names}) VALUES ({', '.join('source.' + column for column in columns)});
+        """)
+        azure_conn.commit()
+        total_rows += len(rows)
+    
+    print(f"✅ Synced {total_rows:,} changed rows into {table_name}")
+    return total_rows
+
+def ensure_pointer_table(cursor):
+    """Create the one-row-per-dataset pointer the API reads to find the live schema"""
+    cursor.execute(f"""
+    IF OBJECT_ID('{POINTER_TABLE}', 'U') IS NULL
+    CREATE TABLE {POINTER_TABLE} (
+        name NVARCHAR(50) PRIMARY KEY,
+        active_schema NVARCHAR(128) NOT NULL,
+        version NVARCHAR(50) NOT NULL,
+        switched_at DATETIME2 NOT NULL
+    )
+    """)
+
+def read_active_schema(cursor):
+    """Schema currently served to the API, or None before the first blue/green load"""
+    row = cursor.execute(f"SELECT active_schema FROM {POINTER_TABLE} WHERE name = 'scout'").fetchone()
+    return row[0] if row else None
+
+def validate_migration(sqlite_conn, azure_conn, tables, schema, rejected=None):
+    """Compare per-table row counts between SQLite and the freshly loaded schema
+
+    rejected maps a table to the rows the migration rejected (RejectLog.rows()); they are not expected.
+    """
+    azure_cursor = azure_conn.cursor()
+    problems = []
+    for table in tables:
+        skipped = len((rejected or {}).get(table, []))
+        expected = sqlite_conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] - skipped
+        actual = azure_cursor.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+        print(f"  {schema}.{table}: {actual:,} rows (source {expected + skipped:,}"
+              f"{f', {skipped:,} rejected' if skipped else ''})")
+        if actual != expected:
+            problems.append(f"{table}: {actual:,} rows, expected {expected:,}")
+    if problems:
+        raise ValueError("validation failed: " + "; ".join(problems))
+
+def activate_schema(azure_conn, schema):
+    """Point the API at schema; a single-row update, so readers flip atomically"""
+    cursor = azure_conn.cursor()
+    version = datetime.now().strftime('%Y%m%d%H%M%S')
+    cursor.execute(f"""
+    MERGE {POINTER_TABLE} AS target
+    USING (SELECT 'scout' AS name) AS source ON target.name = source.name
+    WHEN MATCHED THEN UPDATE SET active_schema = ?, version = ?, switched_at = SYSUTCDATETIME()
+    WHEN NOT MATCHED THEN INSERT (name, active_schema, version, switched_at) VALUES ('scout', ?, ?, SYSUTCDATETIME());
+    """, (schema, version, schema, version))
+    azure_conn.commit()
+    print(f"🔀 Switched live dataset to schema {schema} (version {version})")
+
+def checksum_staged(sqlite_path, azure_conn_str, tables, schema, bulk, buckets, columns_for=None,
+                    max_drilldown=DEFAULT_MAX_DRILLDOWN, rejected=None):
+    """Checksum-verify a loaded schema before it goes live; raises if any row other than a rejected one differs"""
+    differences = verify_tables(sqlite_path, azure_conn_str, tables, schema,
+                                bulk.workers if bulk is not None else DEFAULT_WORKERS, buckets,
+                                columns_for=columns_for, max_drilldown=max_drilldown, rejected=rejected)
+    if differences:
+        raise ValueError(f"checksum verification failed: {differences:,} rows differ in {schema}")
+
+def migrate_data(sqlite_path, azure_conn_str, blue_green=False, changes_path=None, bulk=None, refresh='swap',
+                 verify='checksum', buckets=DEFAULT_BUCKETS, max_drilldown=DEFAULT_MAX_DRILLDOWN):
+    """Migrate data from SQLite to Azure SQL; with changes_path only the changed keys are upserted
+
+    bulk is a BulkMigrator for full loads, or None for the one-connection batch inserts.
+    refresh 'swap' loads full reloads into staging tables and swaps them in; 'delete' empties the live tables first.
+    verify 'checksum' compares every row by bucketed hashes; 'count' compares row counts only.
+    """
     
     # Connect to SQLite
     print("📊 Connecting to SQLite database...")
@@ -194,14 +298,23 @@ def migrate_data(sqlite_path, azure_conn_str):
     azure_cursor = azure_conn.cursor()
     
     try:
-        # Create tables
-        print("📋 Creating tables in Azure SQL...")
-        create_azure_tables(azure_cursor)
-        azure_conn.commit()
-        
-        # Clear existing data
-        print("🧹 Clearing existing data...")
-        clear_existing_data(azure_conn)
+        schema = 'dbo'
+        changes = None
+        if changes_path:
+            with open(changes_path) as f:
+                changes = json.load(f)['tables']
+            # Deltas go into whatever schema the API is reading
+            ensure_pointer_table(azure_cursor)
+            azure_conn.commit()
+            schema = read_active_schema(azure_cursor) or 'dbo'
+            print(f"🔁 Applying {changes_path} to schema {schema}")
+        elif blue_green:
+            # Load into whichever schema is not live; the API keeps reading the other one
+            ensure_pointer_table(azure_cursor)
+            azure_conn.commit()
+            active = read_active_schema(azure_cursor)
+            schema = BLUE_GREEN_SCHEMAS[1] if active == BLUE_GREEN_SCHEMAS[0] else BLUE_GREEN_SCHEMAS[0]
+            print(f"🟦 Live schema: {active or 'none'}; loading into {schema}")
         
         # Migration order (respecting foreign key constraints)
         migration_order = [
@@ -214,10 +327,67 @@ def migrate_data(sqlite_path, azure_conn_str):
             'substitutions'
         ]
         
+        # Create tables
+        print("📋 Creating tables in Azure SQL...")
+        create_azure_tables(azure_cursor, schema)
+        azure_conn.commit()
+        
+        # Full loads go into staging tables swapped in at the end, or into the emptied live tables;
+        # an interrupted bulk load is resumed where it stopped
+        load_schema = staging_schema(schema) if changes is None and refresh == 'swap' else schema
+        rejects = bulk.rejects if bulk is not None else RejectLog(Path(sqlite_path).with_suffix('.rejects.jsonl'))
+        resuming = changes is None and bulk is not None and bulk.start(target_name(azure_conn, load_schema))
+        if resuming and load_schema != schema and not staging_exists(azure_conn, load_schema, migration_order):
+            # The interrupted run got as far as the swap; only the pointer flip is left
+            print(f"⏯️  The interrupted run already swapped its tables into {schema}")
+            if blue_green:
+                activate_schema(azure_conn, schema)
+            bulk.complete()
+            return
+        if changes is None and not resuming:
+            # The reject file then lists this run's rejects only, which verification leaves out
+            rejects.rotate()
+            if load_schema != schema:
+                prepare_staging(azure_conn, schema, migration_order, create_azure_tables)
+            else:
+                print("🧹 Clearing existing data...")
+                clear_existing_data(azure_conn, schema)
+        
         total_migrated = 0
-        for table in migration_order:
-            rows_migrated = migrate_table_data(sqlite_conn, azure_conn, table)
-            total_migrated += rows_migrated
+        if changes is None and bulk is not None:
+            columns = {table: migrated_columns(sqlite_conn, table) for table in migration_order}
+            total_migrated = bulk.migrate(migration_order, lambda table: f"{load_schema}.{table}", columns.get)
+        else:
+            for table in migration_order:
+                if changes is not None:
+                    keys = changes.get(table, {})
+                    rows_migrated = sync_changed_rows(sqlite_conn, azure_conn, table,
+                                                      keys.get('inserted', []) + keys.get('updated', []), schema=schema)
+                else:
+                    rows_migrated = migrate_table_data(sqlite_conn, azure_conn, table, schema=load_schema)
+                total_migrated += rows_migrated
+        
+        if blue_green or load_schema != schema:
+            print("\n🔎 Validating staged schema...")
+            if load_schema != schema:
+                finalize_staging(azure_conn, load_schema, migration_order, rejects)
+                rejects.close()
+            rejected = rejects.rows() if changes is None else None
+            if rejected:
+                print(f"  ⚠️  {sum(len(rows) for rows in rejected.values()):,} rejected rows are not expected in "
+                      f"{load_schema}; see {rejects.path}")
+            if verify == 'checksum':
+                checksum_staged(sqlite_path, azure_conn_str, migration_order, load_schema, bulk, buckets,
+                                max_drilldown=max_drilldown, rejected=rejected)
+            else:
+                validate_migration(sqlite_conn, azure_conn, migration_order, load_schema, rejected)
+        if load_schema != schema:
+            swap_tables(azure_conn, load_schema, schema, migration_order)
+        if blue_green:
+            activate_schema(azure_conn, schema)
+        # Only now is the run finished; an interruption before this point resumes it
+        if bulk is not None:
+            bulk.complete()
         
         print(f"\n🎉 Migration completed successfully!")
         print(f"📊 Total rows migrated: {total_migrated:,}")
@@ -227,8 +397,13 @@ def migrate_data(sqlite_path, azure_conn_str):
         print("\n📋 Verification:")
         azure_cursor = azure_conn.cursor()
         for table in migration_order:
-            count = azure_cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-            print(f"  {table}: {count:,} rows")
+            count = azure_cursor.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+            print(f"  {schema}.{table}: {count:,} rows")
+        if verify == 'checksum' and not (blue_green or load_schema != schema):
+            # Rows already went into the live tables, so differences are reported rather than raised
+            verify_tables(sqlite_path, azure_conn_str, migration_order, schema,
+                          bulk.workers if bulk is not None else DEFAULT_WORKERS, buckets, max_drilldown=max_drilldown,
+                          rejected=rejects.rows() if changes is None else None)
         
     except Exception as e:
         print(f"❌ Migration failed: {e}")
@@ -244,8 +419,17 @@ def main():
     parser.add_argument('--username', required=True, help='Username')
     parser.add_argument('--password', required=True, help='Password')
     parser.add_argument('--sqlite-path', default='scout_analytics.db', help='Path to SQLite database')
+    parser.add_argument('--blue-green', action='store_true',
+                        help='Load into the inactive scout_blue/scout_green schema, validate, then switch the API to it')
+    parser.add_argument('--changes', help='Changed-key file from load_to_sqlite.py --incremental; upserts only those rows')
+    add_bulk_arguments(parser)
+    parser.add_argument('--refresh', choices=['swap', 'delete'], default='swap',
+                        help='swap: load staging tables and swap them in; delete: empty the live tables first')
+    add_verify_arguments(parser)
     
     args = parser.parse_args()
+    if args.changes and args.blue_green:
+        parser.error('--changes applies a delta to the live schema; it cannot be combined with --blue-green')
     
     # Build connection string
     conn_str = (
@@ -268,7 +452,8 @@ def main():
     
     # Run migration
     try:
-        migrate_data(sqlite_path, conn_str)
+        migrate_data(sqlite_path, conn_str, args.blue_green, args.changes, bulk_migrator(args, sqlite_path, conn_str),
+                     args.refresh, args.verify, args.buckets, args.max_drilldown)
     except Exception as e:
         print(f"❌ Migration failed: {e}")
         sys.exit(1)
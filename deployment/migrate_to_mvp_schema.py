@@ -12,24 +12,33 @@ import os
 from pathlib import Path
 from datetime import datetime
 
-def create_mvp_schema_tables(cursor):
-    """Create tables in the mvp schema"""
+from bulk_migrate import DEFAULT_WORKERS, RejectLog, add_bulk_arguments, bulk_migrator, target_name
+from compact_storage import migrated_columns
+from migrate_to_azure_sql import checksum_staged, validate_migration
+from table_swap import finalize_staging, prepare_staging, staging_exists, staging_schema, swap_tables
+from verify_migration import DEFAULT_BUCKETS, DEFAULT_MAX_DRILLDOWN, add_verify_arguments, verify_tables
+
+# The first column of these tables is an IDENTITY key in mvp and is not copied
+IDENTITY_TABLES = ['transaction_items', 'substitutions']
+
+def create_mvp_schema_tables(cursor, schema='mvp'):
+    """Create tables in the mvp schema (or a staging copy of it)"""
     
     print("📋 Creating MVP schema and tables...")
     
     # Create schema
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sys.schemas WHERE name = 'mvp')
+    cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.schemas WHERE name = '{schema}')
     BEGIN
-        EXEC('CREATE SCHEMA mvp')
+        EXEC('CREATE SCHEMA {schema}')
     END
     """)
     
     # Create all tables with mvp schema prefix
-    tables_sql = """
+    tables_sql = f"""
     -- Stores table
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('mvp') AND name = 'stores')
-    CREATE TABLE mvp.stores (
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'stores')
+    CREATE TABLE {schema}.stores (
         store_id INT PRIMARY KEY,
         store_name NVARCHAR(255),
         barangay NVARCHAR(255),
@@ -42,8 +51,8 @@ def create_mvp_schema_tables(cursor):
     );
 
     -- Customers table
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('mvp') AND name = 'customers')
-    CREATE TABLE mvp.customers (
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'customers')
+    CREATE TABLE {schema}.customers (
         customer_id INT PRIMARY KEY,
         age INT,
         gender NVARCHAR(10),
@@ -51,60 +60,60 @@ def create_mvp_schema_tables(cursor):
     );
 
     -- Brands table
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('mvp') AND name = 'brands')
-    CREATE TABLE mvp.brands (
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'brands')
+    CREATE TABLE {schema}.brands (
         brand_id INT PRIMARY KEY,
         brand_name NVARCHAR(255),
         category NVARCHAR(255)
     );
 
     -- Products table
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('mvp') AND name = 'products')
-    CREATE TABLE mvp.products (
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'products')
+    CREATE TABLE {schema}.products (
         product_id INT PRIMARY KEY,
         product_name NVARCHAR(255),
         brand_id INT,
         category NVARCHAR(255),
         unit_price DECIMAL(10,2),
-        FOREIGN KEY (brand_id) REFERENCES mvp.brands(brand_id)
+        FOREIGN KEY (brand_id) REFERENCES {schema}.brands(brand_id)
     );
 
     -- Transactions table
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('mvp') AND name = 'transactions')
-    CREATE TABLE mvp.transactions (
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'transactions')
+    CREATE TABLE {schema}.transactions (
         transaction_id INT PRIMARY KEY,
         store_id INT,
         customer_id INT,
         transaction_datetime DATETIME,
         total_amount DECIMAL(10,2),
-        FOREIGN KEY (store_id) REFERENCES mvp.stores(store_id),
-        FOREIGN KEY (customer_id) REFERENCES mvp.customers(customer_id)
+        FOREIGN KEY (store_id) REFERENCES {schema}.stores(store_id),
+        FOREIGN KEY (customer_id) REFERENCES {schema}.customers(customer_id)
     );
 
     -- Transaction items table
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('mvp') AND name = 'transaction_items')
-    CREATE TABLE mvp.transaction_items (
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'transaction_items')
+    CREATE TABLE {schema}.transaction_items (
         item_id INT IDENTITY(1,1) PRIMARY KEY,
         transaction_id INT,
         product_id INT,
         quantity INT,
         unit_price DECIMAL(10,2),
         discount DECIMAL(10,2),
-        FOREIGN KEY (transaction_id) REFERENCES mvp.transactions(transaction_id),
-        FOREIGN KEY (product_id) REFERENCES mvp.products(product_id)
+        FOREIGN KEY (transaction_id) REFERENCES {schema}.transactions(transaction_id),
+        FOREIGN KEY (product_id) REFERENCES {schema}.products(product_id)
     );
 
     -- Substitutions table
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('mvp') AND name = 'substitutions')
-    CREATE TABLE mvp.substitutions (
+    IF NOT EXISTS (SELECT * FROM sys.tables WHERE schema_id = SCHEMA_ID('{schema}') AND name = 'substitutions')
+    CREATE TABLE {schema}.substitutions (
         substitution_id INT IDENTITY(1,1) PRIMARY KEY,
         transaction_id INT,
         original_product_id INT,
         substituted_product_id INT,
         reason NVARCHAR(255),
-        FOREIGN KEY (transaction_id) REFERENCES mvp.transactions(transaction_id),
-        FOREIGN KEY (original_product_id) REFERENCES mvp.products(product_id),
-        FOREIGN KEY (substituted_product_id) REFERENCES mvp.products(product_id)
+        FOREIGN KEY (transaction_id) REFERENCES {schema}.transactions(transaction_id),
+        FOREIGN KEY (original_product_id) REFERENCES {schema}.products(product_id),
+        FOREIGN KEY (substituted_product_id) REFERENCES {schema}.products(product_id)
     );
     """
     
@@ -133,22 +142,21 @@ def clear_mvp_data(azure_conn):
     azure_conn.commit()
     print("✅ Cleared all existing data from MVP schema")
 
-def migrate_table_to_mvp(sqlite_conn, azure_conn, table_name, batch_size=1000):
-    """Migrate data from SQLite to Azure SQL mvp schema"""
-    print(f"📊 Migrating {table_name} to mvp.{table_name}...")
+def migrate_table_to_mvp(sqlite_conn, azure_conn, table_name, batch_size=1000, schema='mvp'):
+    """Migrate data from SQLite to Azure SQL mvp schema (or its staging copy)"""
+    print(f"📊 Migrating {table_name} to {schema}.{table_name}...")
     
     sqlite_cursor = sqlite_conn.cursor()
-    sqlite_cursor.execute(f"SELECT * FROM {table_name}")
+    columns = migrated_columns(sqlite_conn, table_name)
+    sqlite_cursor.execute(f"SELECT {', '.join(columns)} FROM {table_name}")
     
-    # Get column names
-    columns = [description[0] for description in sqlite_cursor.description]
     column_names = ', '.join(columns)
     placeholders = ', '.join(['?' for _ in columns])
     
     azure_cursor = azure_conn.cursor()
     
     # Handle identity columns for transaction_items and substitutions
-    if table_name in ['transaction_items', 'substitutions']:
+    if table_name in IDENTITY_TABLES:
         # Remove item_id/substitution_id from insert
         if 'item_id' in columns:
             columns.remove('item_id')
@@ -164,16 +172,16 @@ def migrate_table_to_mvp(sqlite_conn, azure_conn, table_name, batch_size=1000):
             break
         
         # Remove identity column values if present
-        if table_name in ['transaction_items', 'substitutions']:
+        if table_name in IDENTITY_TABLES:
             rows = [row[1:] for row in rows]  # Skip first column (identity)
         
-        insert_sql = f"INSERT INTO mvp.{table_name} ({column_names}) VALUES ({placeholders})"
+        insert_sql = f"INSERT INTO {schema}.{table_name} ({column_names}) VALUES ({placeholders})"
         
         try:
             azure_cursor.executemany(insert_sql, rows)
             azure_conn.commit()
             total_rows += len(rows)
-            print(f"  ✅ Migrated {total_rows} rows to mvp.{table_name}")
+            print(f"  ✅ Migrated {total_rows} rows to {schema}.{table_name}")
         except Exception as e:
             print(f"  ❌ Error inserting batch: {e}")
             # Try individual inserts
@@ -185,11 +193,22 @@ def migrate_table_to_mvp(sqlite_conn, azure_conn, table_name, batch_size=1000):
                 except Exception as row_error:
                     print(f"  ⚠️  Skipped row due to error: {row_error}")
     
-    print(f"✅ Completed migration of mvp.{table_name}: {total_rows} total rows")
+    print(f"✅ Completed migration of {schema}.{table_name}: {total_rows} total rows")
     return total_rows
 
-def migrate_to_mvp_schema(sqlite_path, azure_conn_str):
-    """Main migration function for MVP schema"""
+def mvp_columns(sqlite_conn, table_name):
+    """Source columns copied into mvp.table_name"""
+    columns = migrated_columns(sqlite_conn, table_name)
+    return columns[1:] if table_name in IDENTITY_TABLES else columns
+
+def migrate_to_mvp_schema(sqlite_path, azure_conn_str, bulk=None, refresh='swap', verify='checksum',
+                          buckets=DEFAULT_BUCKETS, max_drilldown=DEFAULT_MAX_DRILLDOWN):
+    """Main migration function for MVP schema
+
+    bulk is a BulkMigrator, or None for batch inserts. refresh 'swap' loads staging tables
+    and swaps them in; 'delete' empties the live tables first. verify 'checksum' compares
+    every copied column by bucketed hashes; 'count' compares row counts only.
+    """
     
     print("🚀 Starting Scout Analytics data migration to MVP schema")
     print("=" * 60)
@@ -204,14 +223,6 @@ def migrate_to_mvp_schema(sqlite_path, azure_conn_str):
     azure_cursor = azure_conn.cursor()
     
     try:
-        # Create MVP schema and tables
-        create_mvp_schema_tables(azure_cursor)
-        azure_conn.commit()
-        
-        # Clear existing data
-        print("\n🧹 Clearing existing data...")
-        clear_mvp_data(azure_conn)
-        
         # Migration order (respecting foreign key constraints)
         migration_order = [
             'stores',
@@ -223,11 +234,57 @@ def migrate_to_mvp_schema(sqlite_path, azure_conn_str):
             'substitutions'
         ]
         
+        # Create MVP schema and tables
+        create_mvp_schema_tables(azure_cursor)
+        azure_conn.commit()
+        
+        # Load into staging tables swapped in at the end, or into the emptied live tables;
+        # an interrupted bulk load is resumed where it stopped
+        load_schema = staging_schema('mvp') if refresh == 'swap' else 'mvp'
+        rejects = bulk.rejects if bulk is not None else RejectLog(Path(sqlite_path).with_suffix('.rejects.jsonl'))
+        resuming = bulk is not None and bulk.start(target_name(azure_conn, load_schema))
+        if resuming and load_schema != 'mvp' and not staging_exists(azure_conn, load_schema, migration_order):
+            # The interrupted run got as far as the swap, which was its last step
+            print("⏯️  The interrupted run already swapped its tables into mvp")
+            bulk.complete()
+            return
+        if not resuming:
+            # The reject file then lists this run's rejects only, which verification leaves out
+            rejects.rotate()
+            if load_schema != 'mvp':
+                prepare_staging(azure_conn, 'mvp', migration_order, create_mvp_schema_tables)
+            else:
+                print("\n🧹 Clearing existing data...")
+                clear_mvp_data(azure_conn)
+        
         print("\n📤 Starting data migration...")
         total_migrated = 0
-        for table in migration_order:
-            rows_migrated = migrate_table_to_mvp(sqlite_conn, azure_conn, table)
-            total_migrated += rows_migrated
+        columns = {table: mvp_columns(sqlite_conn, table) for table in migration_order}
+        if bulk is not None:
+            total_migrated = bulk.migrate(migration_order, lambda table: f"{load_schema}.{table}", columns.get)
+        else:
+            for table in migration_order:
+                rows_migrated = migrate_table_to_mvp(sqlite_conn, azure_conn, table, schema=load_schema)
+                total_migrated += rows_migrated
+        
+        if load_schema != 'mvp':
+            print("\n🔎 Validating staged tables...")
+            finalize_staging(azure_conn, load_schema, migration_order, rejects)
+            rejects.close()
+            rejected = rejects.rows()
+            if rejected:
+                print(f"  ⚠️  {sum(len(rows) for rows in rejected.values()):,} rejected rows are not expected in "
+                      f"{load_schema}; see {rejects.path}")
+            if verify == 'checksum':
+                checksum_staged(sqlite_path, azure_conn_str, migration_order, load_schema, bulk, buckets, columns.get,
+                                max_drilldown, rejected)
+            else:
+                validate_migration(sqlite_conn, azure_conn, migration_order, load_schema, rejected)
+        if load_schema != 'mvp':
+            swap_tables(azure_conn, load_schema, 'mvp', migration_order)
+        # Only now is the run finished; an interruption before this point resumes it
+        if bulk is not None:
+            bulk.complete()
         
         print(f"\n🎉 Migration completed successfully!")
         print(f"📊 Total rows migrated: {total_migrated:,}")
@@ -238,6 +295,11 @@ def migrate_to_mvp_schema(sqlite_path, azure_conn_str):
         for table in migration_order:
             count = azure_cursor.execute(f"SELECT COUNT(*) FROM mvp.{table}").fetchone()[0]
             print(f"  mvp.{table}: {count:,} rows")
+        if verify == 'checksum' and load_schema == 'mvp':
+            # Rows already went into the live tables, so differences are reported rather than raised
+            verify_tables(sqlite_path, azure_conn_str, migration_order, 'mvp',
+                          bulk.workers if bulk is not None else DEFAULT_WORKERS, buckets, columns_for=columns.get,
+                          max_drilldown=max_drilldown, rejected=rejects.rows())
         
     except Exception as e:
         print(f"\n❌ Migration failed: {e}")
@@ -253,6 +315,10 @@ def main():
     parser.add_argument('--username', required=True, help='Username')
     parser.add_argument('--password', required=True, help='Password')
     parser.add_argument('--sqlite-path', default='scout_analytics.db', help='Path to SQLite database')
+    add_bulk_arguments(parser)
+    parser.add_argument('--refresh', choices=['swap', 'delete'], default='swap',
+                        help='swap: load staging tables and swap them in; delete: empty the live tables first')
+    add_verify_arguments(parser)
     
     args = parser.parse_args()
     
@@ -277,7 +343,8 @@ def main():
     
     # Run migration
     try:
-        migrate_to_mvp_schema(sqlite_path, conn_str)
+        migrate_to_mvp_schema(sqlite_path, conn_str, bulk_migrator(args, sqlite_path, conn_str), args.refresh,
+                              args.verify, args.buckets, args.max_drilldown)
     except Exception as e:
         print(f"❌ Migration failed: {e}")
         sys.exit(1)
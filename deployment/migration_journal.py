@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Migration Journal
+Local SQLite record of bulk migration progress, so an interrupted run resumes
+
+A run is identified by its target (server/database/schema) and remembers the
+version of the source database and the range size it was split with. Each
+rowid range is recorded once all of its rows are committed on the target.
+Running the same migration again against an unchanged source continues the
+unfinished run instead of clearing the target and starting over.
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS migration_runs (
+    target TEXT PRIMARY KEY,
+    source_version TEXT NOT NULL,
+    range_rows INTEGER NOT NULL,
+    started_at TEXT NOT NULL,
+    completed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS migration_ranges (
+    target TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    low INTEGER NOT NULL,
+    high INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    rejected INTEGER NOT NULL,
+    completed_at TEXT NOT NULL,
+    PRIMARY KEY (target, table_name, low)
+);
+"""
+
+def source_version(sqlite_path):
+    """Version of the source database; a reload (or blue/green flip) changes it"""
+    path = os.path.realpath(sqlite_path)
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+class MigrationJournal:
+    """Completed runs and ranges per target, in a local SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(JOURNAL_SCHEMA)
+
+    def begin(self, target, version, range_rows, restart=False):
+        """Start or continue the run for target: the range size of an unfinished run to resume, or None"""
+        row = self.conn.execute(
+            "SELECT source_version, range_rows, completed_at FROM migration_runs WHERE target = ?",
+            (target,)).fetchone()
+        if row and row[2] is None and not restart:
+            if row[0] == version:
+                return row[1]
+            print(f"⚠️  Source changed since the unfinished migration into {target}; starting over")
+        with self.conn:
+            self.conn.execute("DELETE FROM migration_ranges WHERE target = ?", (target,))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO migration_runs (target, source_version, range_rows, started_at) "
+                "VALUES (?, ?, ?, ?)", (target, version, range_rows, datetime.now().isoformat()))
+        return None
+
+    def completed_ranges(self, target, table):
+        """{low: (high, rows, rejected)} for the ranges of table already committed"""
+        return {low: (high, rows, rejected) for low, high, rows, rejected in self.conn.execute(
+            "SELECT low, high, rows, rejected FROM migration_ranges WHERE target = ? AND table_name = ?",
+            (target, table))}
+
+    def record_range(self, target, table, low, high, rows, rejected):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO migration_ranges VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (target, table, low, high, rows, rejected, datetime.now().isoformat()))
+
+    def reset_table(self, target, table):
+        """Forget the ranges of a table that is being reloaded from scratch"""
+        with self.conn:
+            self.conn.execute("DELETE FROM migration_ranges WHERE target = ? AND table_name = ?", (target, table))
+
+    def complete(self, target):
+        with self.conn:
+            self.conn.execute("UPDATE migration_runs SET completed_at = ? WHERE target = ?",
+                              (datetime.now().isoformat(), target))
+
+    def close(self):
+        self.conn.close()
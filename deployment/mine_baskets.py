@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Market Basket Miner
+Mines "frequently bought together" pairs from transaction_items into association rules
+
+Each transaction is staged once into basket_ledger as its region and distinct
+product list, then counted over basket_id ranges of --partition-rows baskets
+in a process pool, in two passes:
+
+    1. item and basket counts per region
+    2. pair counts per basket, restricted to basket_pair_items: the items
+       whose count reaches min_support of their region's baskets. A pair
+       below that can never reach min_support, so it is never counted.
+
+basket_pair_items only grows. Pair counts are exact for every pair of its
+items; when an item joins it, its pairs are backfilled from the ledger.
+
+Counts are additive, so each run stages only transactions past the rowid
+watermarks, plus transactions that gained items and keys in load_changes.
+A changed transaction's ledger entry is retracted from the counts before it
+is restaged. An item moved from one transaction to another leaves the old
+transaction's entry stale; run with --full after such a reload.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+from compact_storage import is_compact
+
+ALL_REGIONS = 'ALL'
+
+BASKET_TABLES = ['basket_mining_state', 'basket_ledger', 'basket_totals', 'basket_item_counts',
+                 'basket_pair_items', 'basket_pair_counts', 'basket_rules']
+
+# Ledger rows from the text tables, or from the compact tables without the decoding views
+SOURCES = {
+    'text': {
+        'transactions': 'transactions',
+        'items': 'transaction_items',
+        'id': 't.transaction_id',
+        'select': '''
+        SELECT t.transaction_id, COALESCE(t.region, 'Unknown'),
+               (SELECT group_concat(DISTINCT ti.product_id) FROM transaction_items ti
+                WHERE ti.transaction_id = t.transaction_id)
+        FROM transactions t
+        ''',
+        'appended': '''
+        SELECT DISTINCT l.transaction_id
+        FROM transaction_items ti
+        JOIN basket_ledger l ON l.transaction_id = ti.transaction_id
+        WHERE ti.rowid > ? AND ti.rowid <= ?
+        '''
+    },
+    'compact': {
+        'transactions': 'transactions_compact',
+        'items': 'transaction_items_compact',
+        'id': 'k.uuid',
+        'select': '''
+        SELECT k.uuid, COALESCE(d.value, 'Unknown'),
+               (SELECT group_concat(DISTINCT p.uuid) FROM transaction_items_compact ti
+                JOIN key_map_product p ON p.key = ti.product_key
+                WHERE ti.transaction_key = t.transaction_key)
+        FROM transactions_compact t
+        JOIN key_map_transaction k ON k.key = t.transaction_key
+        LEFT JOIN dictionary_values d ON d.column_name = 'region' AND d.code = t.region
+        ''',
+        'appended': '''
+        SELECT DISTINCT l.transaction_id
+        FROM transaction_items_compact ti
+        JOIN key_map_transaction k ON k.key = ti.transaction_key
+        JOIN basket_ledger l ON l.transaction_id = k.uuid
+        WHERE ti.rowid > ? AND ti.rowid <= ?
+        '''
+    }
+}
+
+def create_basket_tables(cursor):
+    """Create the ledger, count and rule tables used by the miner"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS basket_mining_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_rowid INTEGER NOT NULL,
+        last_item_rowid INTEGER NOT NULL,
+        last_change_seq INTEGER NOT NULL,
+        counted_basket_id INTEGER NOT NULL,
+        mined_at TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS basket_ledger (
+        basket_id INTEGER PRIMARY KEY,
+        transaction_id TEXT NOT NULL UNIQUE,
+        region TEXT NOT NULL,
+        products TEXT
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS basket_totals (
+        region TEXT PRIMARY KEY,
+        transaction_count INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS basket_item_counts (
+        region TEXT,
+        product_id TEXT,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (region, product_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS basket_pair_items (
+        region TEXT,
+        product_id TEXT,
+        PRIMARY KEY (region, product_id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS basket_pair_counts (
+        region TEXT,
+        product_a TEXT,
+        product_b TEXT,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (region, product_a, product_b)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS basket_rules (
+        region TEXT,
+        antecedent_id TEXT,
+        consequent_id TEXT,
+        antecedent_name TEXT,
+        consequent_name TEXT,
+        antecedent_category TEXT,
+        consequent_category TEXT,
+        pair_count INTEGER,
+        support REAL,
+        confidence REAL,
+        lift REAL,
+        PRIMARY KEY (region, antecedent_id, consequent_id)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_basket_rules_lift ON basket_rules(region, lift DESC)")
+
+def drop_outdated_state(cursor):
+    """Drop basket tables written by the rowid-only miner; they have no ledger to retract from"""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(basket_mining_state)")]
+    if not columns or 'counted_basket_id' in columns:
+        return False
+    print("⚠️  Basket counts predate the ledger; remining everything")
+    for table in BASKET_TABLES:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    return True
+
+def reset_basket_counts(cursor):
+    """Drop the ledger and accumulated counts so the next run remines everything"""
+    for table in BASKET_TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+
+def basket_keys(region, products):
+    """Region keys a basket counts under, and its distinct products in order"""
+    return (region, ALL_REGIONS), sorted(set(products.split(',')))
+
+def count_items(baskets):
+    """Basket and item counts per region"""
+    totals = Counter()
+    item_counts = Counter()
+    for region, products in baskets:
+        keys, products = basket_keys(region, products)
+        for key in keys:
+            totals[key] += 1
+            for product in products:
+                item_counts[(key, product)] += 1
+    return totals, item_counts
+
+def count_pairs(baskets, tracked, new=None):
+    """Pair counts per region among tracked items; with new, only pairs touching a new item"""
+    pair_counts = Counter()
+    for region, products in baskets:
+        keys, products = basket_keys(region, products)
+        for key in keys:
+            region_tracked = tracked.get(key)
+            if not region_tracked:
+                continue
+            kept = [product for product in products if product in region_tracked]
+            if new is None:
+                for product_a, product_b in combinations(kept, 2):
+                    pair_counts[(key, product_a, product_b)] += 1
+                continue
+            region_new = new.get(key)
+            if not region_new or region_new.isdisjoint(kept):
+                continue
+            for product_a, product_b in combinations(kept, 2):
+                if product_a in region_new or product_b in region_new:
+                    pair_counts[(key, product_a, product_b)] += 1
+    return pair_counts
+
+def mine_range(db_path, first_id, last_id, tracked=None, new=None):
+    """Item counts, or pair counts given tracked items, for one basket_id range (runs in a worker process)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        baskets = conn.execute('''
+        SELECT region, products FROM basket_ledger
+        WHERE basket_id BETWEEN ? AND ? AND products IS NOT NULL
+        ''', (first_id, last_id)).fetchall()
+    finally:
+        conn.close()
+    if tracked is None:
+        return count_items(baskets)
+    return count_pairs(baskets, tracked, new)
+
+def id_ranges(low, high, partition_rows):
+    """Contiguous basket_id ranges of at most partition_rows ids"""
+    if low is None or high is None or high < low:
+        return []
+    return [(start, min(start + partition_rows - 1, high)) for start in range(low, high + 1, partition_rows)]
+
+def mine_ranges(pool, db_path, ranges, tracked=None, new=None):
+    """Fan mine_range out over ranges and add up the results"""
+    futures = [pool.submit(mine_range, str(db_path), first, last, tracked, new) for first, last in ranges]
+    if tracked is not None:
+        pair_counts = Counter()
+        for future in futures:
+            pair_counts.update(future.result())
+        return pair_counts
+    totals, item_counts = Counter(), Counter()
+    for future in futures:
+        partial_totals, partial_items = future.result()
+        totals.update(partial_totals)
+        item_counts.update(partial_items)
+    return totals, item_counts
+
+def load_tracked(cursor):
+    """region -> set of items whose pairs are counted"""
+    tracked = {}
+    for region, product in cursor.execute("SELECT region, product_id FROM basket_pair_items"):
+        tracked.setdefault(region, set()).add(product)
+    return tracked
+
+def merge_counts(cursor, totals=None, item_counts=None, pair_counts=None, sign=1):
+    """Fold counts into the running count tables (sign=-1 retracts them)"""
+    cursor.executemany('''
+    INSERT INTO basket_totals (region, transaction_count) VALUES (?, ?)
+    ON CONFLICT(region) DO UPDATE SET transaction_count = transaction_count + excluded.transaction_count
+    ''', [(region, sign * count) for region, count in (totals or {}).items()])
+    cursor.executemany('''
+    INSERT INTO basket_item_counts (region, product_id, count) VALUES (?, ?, ?)
+    ON CONFLICT(region, product_id) DO UPDATE SET count = count + excluded.count
+    ''', [(region, product, sign * count) for (region, product), count in (item_counts or {}).items()])
+    cursor.executemany('''
+    INSERT INTO basket_pair_counts (region, product_a, product_b, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT(region, product_a, product_b) DO UPDATE SET count = count + excluded.count
+    ''', [(region, a, b, sign * count) for (region, a, b), count in (pair_counts or {}).items()])
+
+def changed_transactions(cursor, source, state, high_item_rowid, high_seq):
+    """Mined transactions that gained items or were upserted since the last run"""
+    last_rowid, last_item_rowid, last_change_seq, counted = state
+    changed = {row[0] for row in cursor.execute(source['appended'], (last_item_rowid, high_item_rowid))}
+    if high_seq <= last_change_seq:
+        return changed
+    item_ids = []
+    for table_name, key in cursor.execute('''
+    SELECT table_name, key FROM load_changes
+    WHERE seq > ? AND seq <= ? AND table_name IN ('transactions', 'transaction_items')
+    ''', (last_change_seq, high_seq)).fetchall():
+        if table_name == 'transactions':
+            changed.add(key)
+        else:
+            item_ids.append(key)
+    for start in range(0, len(item_ids), 500):
+        batch = item_ids[start:start + 500]
+        placeholders = ', '.join('?' for _ in batch)
+        changed.update(row[0] for row in cursor.execute(
+            f"SELECT transaction_id FROM transaction_items WHERE id IN ({placeholders})", batch))
+    return changed
+
+def retract_baskets(cursor, transaction_ids, counted, tracked):
+    """Take changed transactions' counted ledger entries back out of the counts and the ledger"""
+    transaction_ids = list(transaction_ids)
+    retracted = []
+    for start in range(0, len(transaction_ids), 500):
+        batch = transaction_ids[start:start + 500]
+        placeholders = ', '.join('?' for _ in batch)
+        retracted.extend(
+            (region, products) for region, products in cursor.execute(f'''
+            SELECT region, products FROM basket_ledger
+            WHERE transaction_id IN ({placeholders}) AND basket_id <= ? AND products IS NOT NULL
+            ''', batch + [counted]))
+        cursor.execute(f"DELETE FROM basket_ledger WHERE transaction_id IN ({placeholders})", batch)
+    totals, item_counts = count_items(retracted)
+    merge_counts(cursor, totals, item_counts, count_pairs(retracted, tracked), sign=-1)
+    return len(retracted)
+
+def stage_baskets(cursor, source, state, high_rowid, changed):
+    """Append new and changed transactions to the ledger"""
+    staged = cursor.execute(
+        f"INSERT OR IGNORE INTO basket_ledger (transaction_id, region, products) {source['select']} "
+        "WHERE t.rowid > ? AND t.rowid <= ?", (state[0], high_rowid)).rowcount
+    changed = list(changed)
+    for start in range(0, len(changed), 500):
+        batch = changed[start:start + 500]
+        placeholders = ', '.join('?' for _ in batch)
+        staged += cursor.execute(
+            f"INSERT OR IGNORE INTO basket_ledger (transaction_id, region, products) {source['select']} "
+            f"WHERE {source['id']} IN ({placeholders})", batch).rowcount
+    return staged
+
+def newly_tracked(cursor, totals, item_counts, tracked, min_support):
+    """Items whose count now reaches min_support of their region's baskets but whose pairs are not counted yet"""
+    region_totals = Counter(dict(cursor.execute("SELECT region, transaction_count FROM basket_totals")))
+    region_totals.update(totals)
+    counts = Counter({(region, product): count for region, product, count in
+                      cursor.execute("SELECT region, product_id, count FROM basket_item_counts")})
+    counts.update(item_counts)
+    new = {}
+    for (region, product), count in counts.items():
+        if count > 0 and count >= min_support * region_totals[region] and product not in tracked.get(region, ()):
+            new.setdefault(region, set()).add(product)
+    return new
+
+def generate_rules(cursor, min_support, min_confidence):
+    """Regenerate association rules (both directions of every pair) from the count tables"""
+    cursor.execute("DELETE FROM basket_rules")
+    cursor.execute('''
+    INSERT INTO basket_rules
+    SELECT region, antecedent_id, consequent_id,
+           pa.name, pc.name, pa.category, pc.category,
+           pair_count,
+           CAST(pair_count AS REAL) / total,
+           CAST(pair_count AS REAL) / antecedent_count,
+           (CAST(pair_count AS REAL) / antecedent_count) / (CAST(consequent_count AS REAL) / total)
+    FROM (
+        SELECT p.region, p.product_a AS antecedent_id, p.product_b AS consequent_id, p.count AS pair_count,
+               ia.count AS antecedent_count, ib.count AS consequent_count, bt.transaction_count AS total
+        FROM basket_pair_counts p
+        JOIN basket_totals bt ON bt.region = p.region
+        JOIN basket_item_counts ia ON ia.region = p.region AND ia.product_id = p.product_a
+        JOIN basket_item_counts ib ON ib.region = p.region AND ib.product_id = p.product_b
+        UNION ALL
+        SELECT p.region, p.product_b, p.product_a, p.count,
+               ib.count, ia.count, bt.transaction_count
+        FROM basket_pair_counts p
+        JOIN basket_totals bt ON bt.region = p.region
+        JOIN basket_item_counts ia ON ia.region = p.region AND ia.product_id = p.product_a
+        JOIN basket_item_counts ib ON ib.region = p.region AND ib.product_id = p.product_b
+    )
+    LEFT JOIN products pa ON pa.id = antecedent_id
+    LEFT JOIN products pc ON pc.id = consequent_id
+    WHERE CAST(pair_count AS REAL) / total >= ?
+      AND CAST(pair_count AS REAL) / antecedent_count >= ?
+    ''', (min_support, min_confidence))
+    return cursor.rowcount
+
+def mine_baskets(db_path, workers=None, partition_rows=50000, min_support=0.001, min_confidence=0.05, full=False):
+    """Mine new and changed transactions since the last run and refresh the basket_rules table"""
+    workers = workers or os.cpu_count() or 1
+    started = time.time()
+
+    conn = sqlite3.connect(str(db_path))
+    cursor = conn.cursor()
+    drop_outdated_state(cursor)
+    create_basket_tables(cursor)
+    if full:
+        reset_basket_counts(cursor)
+    conn.commit()
+
+    source = SOURCES['compact' if is_compact(conn) else 'text']
+    row = cursor.execute('''
+    SELECT last_rowid, last_item_rowid, last_change_seq, counted_basket_id FROM basket_mining_state WHERE id = 1
+    ''').fetchone()
+    state = tuple(row) if row else (0, 0, 0, 0)
+    counted = state[3]
+    high_rowid = cursor.execute(f"SELECT MAX(rowid) FROM {source['transactions']}").fetchone()[0] or 0
+    high_item_rowid = cursor.execute(f"SELECT MAX(rowid) FROM {source['items']}").fetchone()[0] or 0
+    has_changes = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'load_changes'").fetchone() is not None
+    high_seq = (cursor.execute("SELECT MAX(seq) FROM load_changes").fetchone()[0] or 0) if has_changes else 0
+
+    # Retract and restage changed baskets, stage new ones; counts still cover basket_id <= counted
+    tracked = load_tracked(cursor)
+    changed = set()
+    if cursor.execute("SELECT 1 FROM basket_ledger LIMIT 1").fetchone() is not None:
+        changed = changed_transactions(cursor, source, state, high_item_rowid, high_seq)
+    retracted = retract_baskets(cursor, changed, counted, tracked)
+    staged = stage_baskets(cursor, source, state, high_rowid, changed)
+    cursor.execute('''
+    INSERT INTO basket_mining_state (id, last_rowid, last_item_rowid, last_change_seq, counted_basket_id)
+    VALUES (1, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET last_rowid = excluded.last_rowid, last_item_rowid = excluded.last_item_rowid,
+                                  last_change_seq = excluded.last_change_seq
+    ''', (max(state[0], high_rowid), max(state[1], high_item_rowid), max(state[2], high_seq), counted))
+    conn.commit()
+    if retracted:
+        print(f"↩️  Retracted {retracted:,} changed baskets")
+
+    high_id = cursor.execute("SELECT MAX(basket_id) FROM basket_ledger").fetchone()[0]
+    ranges = id_ranges(counted + 1, high_id, partition_rows)
+    totals, item_counts, pair_counts = Counter(), Counter(), Counter()
+    if not ranges:
+        print("✅ No new transactions to mine")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if ranges:
+            print(f"🧺 Counting items in {len(ranges)} partitions of up to {partition_rows:,} baskets "
+                  f"({staged:,} staged) on {workers} workers...")
+            totals, item_counts = mine_ranges(pool, db_path, ranges)
+
+        new = newly_tracked(cursor, totals, item_counts, tracked, min_support)
+        for region, products in new.items():
+            tracked.setdefault(region, set()).update(products)
+        if new and counted:
+            print(f"🔁 Backfilling pairs for {sum(len(products) for products in new.values()):,} newly frequent items...")
+            pair_counts.update(mine_ranges(pool, db_path, id_ranges(1, counted, partition_rows), tracked, new))
+        if ranges:
+            print(f"🧺 Counting pairs of {sum(len(products) for products in tracked.values()):,} frequent items...")
+            pair_counts.update(mine_ranges(pool, db_path, ranges, tracked))
+
+    cursor.executemany("INSERT INTO basket_pair_items (region, product_id) VALUES (?, ?)",
+                       [(region, product) for region, products in new.items() for product in products])
+    merge_counts(cursor, totals, item_counts, pair_counts)
+    cursor.execute("DELETE FROM basket_item_counts WHERE count <= 0")
+    cursor.execute("DELETE FROM basket_pair_counts WHERE count <= 0")
+    cursor.execute('''
+    UPDATE basket_mining_state SET counted_basket_id = ?, mined_at = datetime('now') WHERE id = 1
+    ''', (max(counted, high_id or 0),))
+    if ranges:
+        print(f"✅ Mined {totals.get(ALL_REGIONS, 0):,} baskets")
+
+    rule_count = generate_rules(cursor, min_support, min_confidence)
+    conn.commit()
+    conn.close()
+
+    print(f"✅ Wrote {rule_count:,} association rules in {time.time() - started:.1f}s")
+    return rule_count
+
+def main():
+    parser = argparse.ArgumentParser(description='Mine Scout Analytics market-basket association rules')
+    parser.add_argument('--db_path', required=True, help='SQLite database path')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--partition-rows', dest='partition_rows', type=int, default=50000,
+                        help='Baskets per worker task')
+    parser.add_argument('--min-support', type=float, default=0.001, help='Minimum pair support')
+    parser.add_argument('--min-confidence', type=float, default=0.05, help='Minimum rule confidence')
+    parser.add_argument('--full', action='store_true', help='Discard the ledger and accumulated counts and remine everything')
+
+    args = parser.parse_args()
+    if args.partition_rows < 1:
+        parser.error('--partition-rows must be at least 1')
+
+    db_path = Path(args.db_path)
+    if not db_path.exists():
+        print(f"❌ SQLite database not found: {db_path}")
+        return
+
+    mine_baskets(db_path, args.workers, args.partition_rows, args.min_support, args.min_confidence, args.full)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Parquet Dataset Format
+Typed, month-partitioned Parquet datasets for the generators and the loader
+
+    <output_dir>/<table>/month=YYYY-MM/part-0.parquet   tables with a timestamp
+    <output_dir>/<table>/part-0.parquet                 dimension tables
+
+Columns carry real types (timestamps, dates, integers, booleans) and
+low-cardinality strings are dictionary-encoded, so the schema lives in the
+file footer and nothing is re-parsed from text. transaction_items are
+partitioned by their transaction's month.
+
+Also writes the API's aggregate snapshot as uncompressed Arrow IPC files
+(snapshot/<table>.arrow next to the database). Parquet pages have to be
+decoded, while Arrow IPC buffers can be memory-mapped as they are, so
+gunicorn workers share the file's pages instead of decoding at startup.
+
+pyarrow is optional: CSV output and loading keep working without it.
+"""
+
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+
+TEXT_FORMATS = {'s': '%Y-%m-%d %H:%M:%S', 'us': '%Y-%m-%dT%H:%M:%S'}
+
+# Column -> type name; 'dict' is a dictionary-encoded string
+TABLE_TYPES = {
+    'stores': {
+        'store_id': 'string', 'name': 'string', 'location': 'string', 'barangay': 'dict', 'city': 'dict',
+        'region': 'dict', 'latitude': 'float64', 'longitude': 'float64', 'store_type': 'dict',
+        'opening_hours': 'dict', 'contact_number': 'string'
+    },
+    'brands': {
+        'id': 'string', 'name': 'string', 'category': 'dict', 'country_origin': 'dict',
+        'established_year': 'int32', 'market_share': 'float64'
+    },
+    'products': {
+        'id': 'string', 'name': 'string', 'category': 'dict', 'brand_id': 'dict', 'brand_name': 'dict',
+        'price': 'float64', 'sku': 'string', 'barcode': 'string', 'weight_grams': 'int32', 'in_stock': 'bool',
+        'stock_quantity': 'int32', 'supplier': 'dict'
+    },
+    'customers': {
+        'id': 'string', 'age': 'int32', 'gender': 'dict', 'region': 'dict', 'city': 'dict', 'barangay': 'dict',
+        'registration_date': 'timestamp[s]', 'total_transactions': 'int32', 'total_spent': 'float64',
+        'avg_transaction_amount': 'float64', 'preferred_payment_method': 'dict', 'loyalty_tier': 'dict',
+        'email': 'string', 'phone': 'string'
+    },
+    'devices': {
+        'id': 'string', 'store_id': 'dict', 'device_type': 'dict', 'model': 'dict', 'serial_number': 'string',
+        'installation_date': 'date32', 'last_maintenance': 'date32', 'status': 'dict', 'software_version': 'dict',
+        'total_transactions': 'int32', 'avg_response_time_ms': 'float64', 'uptime_percentage': 'float64'
+    },
+    'transactions': {
+        'transaction_id': 'string', 'customer_id': 'string', 'created_at': 'timestamp[s]', 'total_amount': 'float64',
+        'customer_age': 'int32', 'customer_gender': 'dict', 'store_location': 'string', 'store_id': 'dict',
+        'checkout_seconds': 'float64', 'is_weekend': 'bool', 'nlp_processed': 'bool',
+        'nlp_processed_at': 'timestamp[s]', 'nlp_confidence_score': 'float64', 'device_id': 'dict',
+        'payment_method': 'dict', 'checkout_time': 'timestamp[s]', 'request_type': 'dict',
+        'transcription_text': 'string', 'suggestion_accepted': 'bool', 'region': 'dict', 'city': 'dict',
+        'barangay': 'dict'
+    },
+    'transaction_items': {
+        'id': 'string', 'transaction_id': 'string', 'product_id': 'dict', 'quantity': 'int32',
+        'unit_price': 'float64', 'total_price': 'float64', 'discount_amount': 'float64', 'tax_amount': 'float64',
+        'line_number': 'int32'
+    },
+    'request_behaviors': {
+        'request_id': 'string', 'transaction_id': 'string', 'device_id': 'dict', 'request_method': 'dict',
+        'timestamp': 'timestamp[us]', 'response_time_ms': 'float64', 'success': 'bool', 'confidence_score': 'float64'
+    },
+    'substitutions': {
+        'substitution_id': 'string', 'transaction_id': 'string', 'original_product_id': 'dict',
+        'substituted_product_id': 'dict', 'reason': 'dict', 'timestamp': 'timestamp[s]'
+    }
+}
+
+# Timestamp each table is partitioned on
+PARTITION_COLUMNS = {
+    'transactions': 'created_at',
+    'request_behaviors': 'timestamp',
+    'substitutions': 'timestamp'
+}
+
+ROWS_PER_GROUP = 65536
+
+# Tables the API preloads into its snapshot (src/snapshot.py DEFAULT_TABLES)
+SNAPSHOT_TABLES = ['stores', 'products', 'brands', 'store_rollups', 'time_rollups']
+
+def require_pyarrow():
+    if pa is None:
+        raise SystemExit("❌ Parquet support needs pyarrow: pip install pyarrow")
+
+def arrow_type(name):
+    if name == 'dict':
+        return pa.dictionary(pa.int32(), pa.string())
+    if name.startswith('timestamp['):
+        return pa.timestamp(name[len('timestamp['):-1])
+    return getattr(pa, 'bool_' if name == 'bool' else name)()
+
+def to_arrow(df, table_name):
+    """Typed Arrow table from a generator DataFrame; unknown columns stay as inferred"""
+    types = TABLE_TYPES.get(table_name, {})
+    arrays = []
+    fields = []
+    for column in df.columns:
+        values = df[column]
+        type_name = types.get(column)
+        if type_name is None:
+            array = pa.array(values, from_pandas=True)
+        elif type_name == 'dict':
+            array = pa.array(values.astype(object), type=pa.string(), from_pandas=True).dictionary_encode()
+        elif type_name.startswith('timestamp[') or type_name == 'date32':
+            parsed = pd.to_datetime(values, format='ISO8601')
+            array = pa.array(parsed.dt.date if type_name == 'date32' else parsed, type=arrow_type(type_name),
+                             from_pandas=True)
+        else:
+            array = pa.array(values, type=arrow_type(type_name), from_pandas=True)
+        arrays.append(array)
+        fields.append(pa.field(column, array.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+def write_parquet(df, output_dir, table_name, months=None):
+    """Write one table as a Parquet dataset, partitioned by month when it has a timestamp
+
+    months overrides the partition value per row (transaction_items use their
+    transaction's month). Returns the number of files written.
+    """
+    require_pyarrow()
+    table = to_arrow(df, table_name)
+    target = Path(output_dir) / table_name
+    partitioning = None
+    if months is None and table_name in PARTITION_COLUMNS:
+        months = pc.strftime(table[PARTITION_COLUMNS[table_name]], format='%Y-%m')
+    if months is not None:
+        if not isinstance(months, (pa.Array, pa.ChunkedArray)):
+            months = pa.array(months, type=pa.string())
+        table = table.append_column('month', months)
+        partitioning = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+    # Months from an earlier run must not linger next to the new ones
+    shutil.rmtree(target, ignore_errors=True)
+    written = []
+    ds.write_dataset(
+        table, target, format='parquet', partitioning=partitioning,
+        basename_template='part-{i}.parquet', existing_data_behavior='overwrite_or_ignore',
+        max_rows_per_group=ROWS_PER_GROUP, min_rows_per_group=min(ROWS_PER_GROUP, max(len(table), 1)),
+        file_options=ds.ParquetFileFormat().make_write_options(compression='zstd', use_dictionary=True),
+        file_visitor=lambda written_file: written.append(written_file.path)
+    )
+    print(f"   {table_name}: {len(table):,} rows -> {len(written)} Parquet file(s) in {target}")
+    return len(written)
+
+def parquet_path(data_dir, table_name):
+    """Dataset directory of a table, or None when it was not written as Parquet"""
+    path = Path(data_dir) / table_name
+    return path if path.is_dir() else None
+
+def read_parquet(data_dir, table_name):
+    """Whole table as a DataFrame with its original types (for the generators)"""
+    require_pyarrow()
+    dataset = ds.dataset(Path(data_dir) / table_name, format='parquet', partitioning='hive')
+    columns = [name for name in dataset.schema.names if name != 'month']
+    df = dataset.to_table(columns=columns).to_pandas()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+    return df
+
+def read_schema(data_dir, table_name):
+    """Schema from the Parquet footers; no row data is read"""
+    require_pyarrow()
+    dataset = ds.dataset(Path(data_dir) / table_name, format='parquet', partitioning='hive')
+    return dataset.schema, dataset.count_rows()
+
+def text_column(array, type_name=None):
+    """Arrow column -> values the SQLite text schema expects"""
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    if pa.types.is_timestamp(array.type):
+        if type_name and type_name.startswith('timestamp['):
+            # Parquet has no second unit; timestamp[s] columns come back as milliseconds
+            array = array.cast(arrow_type(type_name))
+        return pc.strftime(array, format=TEXT_FORMATS.get(array.type.unit, TEXT_FORMATS['s']))
+    if pa.types.is_date(array.type):
+        return array.cast(pa.string())
+    return array
+
+def iter_parquet_frames(data_dir, table_name, columns, batch_size=50000):
+    """Stream a Parquet dataset as DataFrames of just the given columns, a few row groups at a time"""
+    require_pyarrow()
+    dataset = ds.dataset(Path(data_dir) / table_name, format='parquet', partitioning='hive')
+    projected = [column for column in columns if column in dataset.schema.names]
+    skipped = [column for column in dataset.schema.names if column not in columns and column != 'month']
+    if skipped:
+        print(f"   ⚠️  {table_name}: not reading columns outside the schema: {', '.join(skipped)}")
+    types = TABLE_TYPES.get(table_name, {})
+    for batch in dataset.to_batches(columns=projected, batch_size=batch_size, batch_readahead=2, fragment_readahead=1):
+        if batch.num_rows:
+            columns = [text_column(column, types.get(name)) for name, column in zip(batch.schema.names, batch.columns)]
+            yield pa.RecordBatch.from_arrays(columns, names=batch.schema.names).to_pandas()
+
+def snapshot_column(values):
+    """Encode one column the way the API's ColumnTable does, so mapping it needs no conversion"""
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, int) for value in present) and len(present) == len(values):
+        return pa.array(values, type=pa.int64())
+    if present and all(isinstance(value, (int, float)) for value in present):
+        return pa.array([math.nan if value is None else value for value in values], type=pa.float64())
+    distinct = sorted({str(value) for value in present})
+    lookup = {value: code for code, value in enumerate(distinct)}
+    indices = pa.array([None if value is None else lookup[str(value)] for value in values], type=pa.int32())
+    return pa.DictionaryArray.from_arrays(indices, pa.array(distinct, type=pa.string()))
+
+def write_snapshot(conn, db_path, snapshot_dir, tables):
+    """Export the snapshot tables as Arrow IPC files the API memory-maps at startup"""
+    require_pyarrow()
+    snapshot_dir = Path(snapshot_dir)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    exported = {}
+    for table_name in tables:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table_name,)).fetchone():
+            continue
+        cursor = conn.execute(f"SELECT * FROM {table_name}")
+        names = [description[0] for description in cursor.description]
+        rows = cursor.fetchall()
+        if not rows:
+            continue
+        table = pa.Table.from_arrays([snapshot_column([row[i] for row in rows]) for i in range(len(names))], names=names)
+        path = snapshot_dir / f"{table_name}.arrow"
+        temporary = path.with_suffix('.arrow.tmp')
+        with pa.OSFile(str(temporary), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=len(table))
+        os.replace(temporary, path)
+        exported[table_name] = len(table)
+    with open(snapshot_dir / 'manifest.json', 'w') as f:
+        json.dump({"database_bytes": Path(db_path).stat().st_size, "tables": exported}, f)
+    print(f"✅ Wrote snapshot for {', '.join(exported) or 'no tables'} to {snapshot_dir}")
+    return exported
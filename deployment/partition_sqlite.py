@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Partitioned SQLite Writer
+Splits transactions and their items into one SQLite file per month (optionally per month and region)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+FACT_TABLES = ['transactions', 'transaction_items']
+
+# Copied whole into every partition: a transaction's region is its store's region
+DIMENSION_TABLES = ['stores']
+
+PARTITION_FILE_PATTERN = re.compile(r'^(\d{4}-\d{2}|undated)(__[a-z0-9_]+)?\.db$')
+
+PARTITION_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_store ON transactions(store_id)",
+    "CREATE INDEX IF NOT EXISTS idx_stores_region ON stores(region, store_id)",
+    "CREATE INDEX IF NOT EXISTS idx_transaction_items_transaction ON transaction_items(transaction_id)"
+]
+
+# Must match HyperLogLog in backend/scout-analytics-api-flask/src/partitions.py
+SKETCH_PRECISION = 12
+
+def add_to_sketch(registers, value):
+    """Add one value to HyperLogLog registers (same hashing as the API's HyperLogLog)"""
+    hashed = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+    index = hashed >> (64 - SKETCH_PRECISION)
+    rest = hashed & ((1 << (64 - SKETCH_PRECISION)) - 1)
+    rank = (64 - SKETCH_PRECISION) - rest.bit_length() + 1
+    if rank > registers[index]:
+        registers[index] = rank
+
+def write_customer_sketches(conn):
+    """Distinct-customer sketch per day and store region, so queries merge sketches instead of reading ids"""
+    conn.execute("CREATE TABLE customer_sketches (day TEXT, region TEXT, registers BLOB)")
+    sketches = {}
+    for day, region, customer_id in conn.execute('''
+    SELECT DISTINCT substr(t.created_at, 1, 10), s.region, t.customer_id
+    FROM transactions t
+    JOIN stores s ON t.store_id = s.store_id
+    WHERE t.customer_id IS NOT NULL
+    '''):
+        registers = sketches.get((day, region))
+        if registers is None:
+            registers = sketches[(day, region)] = bytearray(1 << SKETCH_PRECISION)
+        add_to_sketch(registers, customer_id)
+    conn.executemany(
+        "INSERT INTO customer_sketches VALUES (?, ?, ?)",
+        ((day, region, zlib.compress(bytes(registers))) for (day, region), registers in sketches.items())
+    )
+    conn.execute("CREATE INDEX idx_customer_sketches_day ON customer_sketches(day, region)")
+
+def partition_file(month, region):
+    """File name for a partition; regions are slugged so they are safe in paths"""
+    name = month or 'undated'
+    if region is not None:
+        name += '__' + (re.sub(r'[^a-z0-9]+', '_', region.lower()).strip('_') or 'unknown')
+    return f"{name}.db"
+
+def list_partitions(conn, partition_by):
+    """Distinct (month, store region) keys present in the transactions table"""
+    region_column = "s.region" if partition_by == 'month_region' else "NULL"
+    return conn.execute(f'''
+    SELECT substr(t.created_at, 1, 7) AS month, {region_column} AS region, COUNT(*) AS transactions
+    FROM transactions t
+    LEFT JOIN stores s ON t.store_id = s.store_id
+    GROUP BY month, {region_column}
+    ORDER BY month, region
+    ''').fetchall()
+
+def write_partition(db_path, out_dir, schema, month, region):
+    """Copy one month (and store region) of facts, plus the stores table, from the main database into its own file"""
+    path = out_dir / partition_file(month, region)
+    if path.exists():
+        path.unlink()
+    conn = sqlite3.connect(str(path))
+    try:
+        for sql in schema:
+            conn.execute(sql)
+        conn.execute("ATTACH DATABASE ? AS source", (str(db_path),))
+
+        conditions = ["substr(t.created_at, 1, 7) IS ?"]
+        params = [month]
+        if region is not None:
+            conditions.append("s.region IS ?")
+            params.append(region)
+        where = " AND ".join(conditions)
+
+        conn.execute(f'''
+        INSERT INTO transactions
+        SELECT t.* FROM source.transactions t
+        LEFT JOIN source.stores s ON t.store_id = s.store_id
+        WHERE {where}
+        ''', params)
+        conn.execute(f'''
+        INSERT INTO transaction_items
+        SELECT ti.* FROM source.transaction_items ti
+        WHERE ti.transaction_id IN (SELECT transaction_id FROM transactions)
+        ''')
+        for table in DIMENSION_TABLES:
+            conn.execute(f"INSERT INTO {table} SELECT * FROM source.{table}")
+        conn.commit()
+        conn.execute("DETACH DATABASE source")
+        for sql in PARTITION_INDEXES:
+            conn.execute(sql)
+        write_customer_sketches(conn)
+        conn.execute("ANALYZE")
+
+        transactions = conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        items = conn.execute("SELECT COUNT(*) FROM transaction_items").fetchone()[0]
+        first, last = conn.execute("SELECT MIN(created_at), MAX(created_at) FROM transactions").fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    return {
+        "file": path.name,
+        "month": month,
+        "region": region,
+        "transactions": transactions,
+        "items": items,
+        "customer_sketches": True,
+        "min_created_at": first,
+        "max_created_at": last
+    }
+
+def write_partitions(db_path, out_dir, partition_by='month'):
+    """Write every partition plus manifest.json; returns the manifest"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(str(db_path))
+    try:
+        schema = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name IN ({})".format(
+                ', '.join('?' for _ in FACT_TABLES + DIMENSION_TABLES)), FACT_TABLES + DIMENSION_TABLES)]
+        keys = list_partitions(conn, partition_by)
+    finally:
+        conn.close()
+
+    print(f"\n🧩 Writing {len(keys):,} partitions ({partition_by}) to {out_dir}")
+    partitions = []
+    for month, region, _ in keys:
+        partition = write_partition(db_path, out_dir, schema, month, region)
+        partitions.append(partition)
+        print(f"   {partition['file']}: {partition['transactions']:,} transactions, {partition['items']:,} items")
+
+    # Drop files from a previous layout that are no longer listed
+    current = {partition['file'] for partition in partitions}
+    for stale in out_dir.glob('*.db'):
+        if PARTITION_FILE_PATTERN.match(stale.name) and stale.name not in current:
+            stale.unlink()
+
+    manifest = {
+        "partition_by": partition_by,
+        "created_at": datetime.now().isoformat(),
+        "partitions": partitions
+    }
+    temp_path = out_dir / 'manifest.json.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, out_dir / 'manifest.json')
+    print(f"✅ Wrote partition manifest: {len(partitions):,} partitions")
+    return manifest
+
+def drop_partitioned_facts(db_path):
+    """Remove the fact rows now held in partitions from the main database"""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        for table in FACT_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    print("🗑️  Dropped partitioned fact rows from the main database")
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition Scout Analytics transactions into per-month SQLite files')
+    parser.add_argument('--db_path', required=True, help='SQLite database path')
+    parser.add_argument('--out_dir', help='Partition directory (default: partitions/ next to the database)')
+    parser.add_argument('--partition-by', dest='partition_by', choices=['month', 'month_region'], default='month')
+    parser.add_argument('--drop-facts', dest='drop_facts', action='store_true',
+                        help='Delete partitioned fact rows from the main database afterwards')
+
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path)
+    if not db_path.exists():
+        print(f"❌ SQLite database not found: {db_path}")
+        return
+
+    write_partitions(db_path, args.out_dir or db_path.parent / 'partitions', args.partition_by)
+    if args.drop_facts:
+        drop_partitioned_facts(db_path)
+
+if __name__ == "__main__":
+    main()
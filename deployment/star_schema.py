@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Star Schema Builder
+Builds the denormalized fact_sales_line table and the dim_date hour dimension
+
+    fact_sales_line   one row per transaction item, with the transaction's date,
+                      store, customer band and the item's product, category and
+                      brand already joined in
+    dim_date          one row per hour: date, hour, weekday, week, month, quarter
+                      and Philippine holiday flags
+
+date_key is YYYYMMDDHH as an integer, so fact rows join dim_date on it and
+date ranges filter on it without parsing timestamps. Transaction-level
+measures sit on the transaction's first line only (transaction_count = 1,
+transaction_amount = total_amount; 0 on the other lines), so KPIs sum over
+the table without COUNT(DISTINCT transaction_id). Transactions without items
+get a single line with no product.
+"""
+
+import argparse
+import sqlite3
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+FIXED_HOLIDAYS = {
+    (1, 1): "New Year's Day",
+    (2, 25): "EDSA People Power Revolution Anniversary",
+    (4, 9): "Araw ng Kagitingan",
+    (5, 1): "Labor Day",
+    (6, 12): "Independence Day",
+    (8, 21): "Ninoy Aquino Day",
+    (11, 1): "All Saints' Day",
+    (11, 2): "All Souls' Day",
+    (11, 30): "Bonifacio Day",
+    (12, 8): "Feast of the Immaculate Conception",
+    (12, 24): "Christmas Eve",
+    (12, 25): "Christmas Day",
+    (12, 30): "Rizal Day",
+    (12, 31): "Last Day of the Year"
+}
+
+AGE_GROUP_EXPR = '''CASE
+        WHEN age BETWEEN 18 AND 25 THEN '18-25'
+        WHEN age BETWEEN 26 AND 35 THEN '26-35'
+        WHEN age BETWEEN 36 AND 45 THEN '36-45'
+        WHEN age BETWEEN 46 AND 55 THEN '46-55'
+        ELSE '55+'
+    END'''
+
+FACT_SALES_LINE_COLUMNS = [
+    'transaction_id', 'line_id', 'line_number', 'date_key', 'created_at',
+    'store_id', 'store_region', 'store_city', 'region', 'city',
+    'customer_id', 'customer_age', 'age_group', 'customer_gender', 'loyalty_tier',
+    'product_id', 'product_name', 'category', 'brand_id', 'brand_name',
+    'quantity', 'unit_price', 'line_revenue', 'transaction_count', 'transaction_amount'
+]
+
+FACT_SALES_LINE_SELECT = '''
+SELECT transaction_id, line_id, line_number, date_key, created_at,
+       store_id, store_region, store_city, region, city,
+       customer_id, age, ''' + AGE_GROUP_EXPR + ''', customer_gender, loyalty_tier,
+       product_id, product_name, category, brand_id, brand_name,
+       quantity, unit_price, quantity * unit_price,
+       CASE WHEN line_rank = 1 THEN 1 ELSE 0 END,
+       CASE WHEN line_rank = 1 THEN total_amount ELSE 0 END
+FROM (
+    SELECT t.transaction_id, ti.id AS line_id, ti.line_number,
+           CAST(strftime('%Y%m%d%H', t.created_at) AS INTEGER) AS date_key, t.created_at,
+           t.store_id, s.region AS store_region, s.city AS store_city, t.region, t.city,
+           t.customer_id, COALESCE(c.age, t.customer_age) AS age,
+           COALESCE(c.gender, t.customer_gender) AS customer_gender, c.loyalty_tier,
+           ti.product_id, p.name AS product_name, p.category, p.brand_id, p.brand_name,
+           ti.quantity, ti.unit_price, t.total_amount,
+           ROW_NUMBER() OVER (PARTITION BY t.transaction_id ORDER BY ti.line_number, ti.id) AS line_rank
+    FROM transactions t
+    LEFT JOIN transaction_items ti ON ti.transaction_id = t.transaction_id
+    LEFT JOIN stores s ON s.store_id = t.store_id
+    LEFT JOIN customers c ON c.id = t.customer_id
+    LEFT JOIN products p ON p.id = ti.product_id
+    {where}
+)
+'''
+
+# Partial indexes: transaction measures live on first lines only. transaction_count is
+# repeated in the key so SQLite treats the index as covering
+FACT_SALES_LINE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_fact_sales_line_transaction ON fact_sales_line(transaction_id)",
+    '''CREATE INDEX IF NOT EXISTS idx_fact_sales_line_transactions
+       ON fact_sales_line(date_key, store_region, age_group, customer_id, transaction_amount, transaction_count)
+       WHERE transaction_count = 1''',
+    '''CREATE INDEX IF NOT EXISTS idx_fact_sales_line_recent
+       ON fact_sales_line(created_at) WHERE transaction_count = 1''',
+    '''CREATE INDEX IF NOT EXISTS idx_fact_sales_line_products
+       ON fact_sales_line(date_key, store_region, product_id, category, line_revenue)
+       WHERE product_id IS NOT NULL'''
+]
+
+def easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def holidays(year):
+    """Philippine national holidays of one year; moveable Islamic holidays are not included"""
+    days = {date(year, month, day): name for (month, day), name in FIXED_HOLIDAYS.items()}
+    sunday = easter(year)
+    days[sunday - timedelta(days=3)] = "Maundy Thursday"
+    days[sunday - timedelta(days=2)] = "Good Friday"
+    days[sunday - timedelta(days=1)] = "Black Saturday"
+    last_monday = date(year, 8, 31)
+    last_monday -= timedelta(days=last_monday.weekday())
+    days[last_monday] = "National Heroes Day"
+    return days
+
+def dim_date_rows(first_year, last_year):
+    """One row per hour from Jan 1 of first_year to Dec 31 of last_year"""
+    for year in range(first_year, last_year + 1):
+        year_holidays = holidays(year)
+        day = date(year, 1, 1)
+        while day.year == year:
+            holiday = year_holidays.get(day)
+            iso_year, iso_week, iso_weekday = day.isocalendar()
+            week_start = day - timedelta(days=iso_weekday - 1)
+            for hour in range(24):
+                yield (
+                    int(day.strftime('%Y%m%d')) * 100 + hour,
+                    day.isoformat(),
+                    hour,
+                    iso_weekday % 7,
+                    day.strftime('%A'),
+                    int(iso_weekday >= 6),
+                    week_start.isoformat(),
+                    iso_week,
+                    day.strftime('%Y-%m'),
+                    day.strftime('%b %Y'),
+                    (day.month - 1) // 3 + 1,
+                    year,
+                    int(holiday is not None),
+                    holiday
+                )
+            day += timedelta(days=1)
+
+def build_dim_date(conn):
+    """Create dim_date, or extend it to cover every transaction year"""
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dim_date (
+        date_key INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        weekday INTEGER NOT NULL,
+        weekday_name TEXT NOT NULL,
+        is_weekend INTEGER NOT NULL,
+        week_start TEXT NOT NULL,
+        iso_week INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        month_label TEXT NOT NULL,
+        quarter INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        is_holiday INTEGER NOT NULL,
+        holiday_name TEXT
+    )
+    ''')
+    first, last = cursor.execute(
+        "SELECT MIN(substr(created_at, 1, 4)), MAX(substr(created_at, 1, 4)) FROM transactions WHERE created_at IS NOT NULL"
+    ).fetchone()
+    if first is None:
+        return 0
+    covered = {row[0] for row in cursor.execute("SELECT DISTINCT year FROM dim_date")}
+    for year in range(int(first), int(last) + 1):
+        if year not in covered:
+            cursor.executemany("INSERT INTO dim_date VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               dim_date_rows(year, year))
+    count = cursor.execute("SELECT COUNT(*) FROM dim_date").fetchone()[0]
+    print(f"✅ Built dim_date: {count:,} hours ({first}-{last})")
+    return count
+
+def build_fact_sales_line(conn):
+    """Rebuild fact_sales_line from the normalized tables"""
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS fact_sales_line")
+    cursor.execute('''
+    CREATE TABLE fact_sales_line (
+        sales_line_key INTEGER PRIMARY KEY,
+        transaction_id TEXT NOT NULL,
+        line_id TEXT,
+        line_number INTEGER,
+        date_key INTEGER,
+        created_at TEXT,
+        store_id TEXT,
+        store_region TEXT,
+        store_city TEXT,
+        region TEXT,
+        city TEXT,
+        customer_id TEXT,
+        customer_age INTEGER,
+        age_group TEXT,
+        customer_gender TEXT,
+        loyalty_tier TEXT,
+        product_id TEXT,
+        product_name TEXT,
+        category TEXT,
+        brand_id TEXT,
+        brand_name TEXT,
+        quantity INTEGER,
+        unit_price REAL,
+        line_revenue REAL,
+        transaction_count INTEGER NOT NULL,
+        transaction_amount REAL
+    )
+    ''')
+    insert_fact_sales_lines(cursor)
+    for index_sql in FACT_SALES_LINE_INDEXES:
+        cursor.execute(index_sql)
+    count = cursor.execute("SELECT COUNT(*) FROM fact_sales_line").fetchone()[0]
+    print(f"✅ Built fact_sales_line: {count:,} lines")
+    return count
+
+def insert_fact_sales_lines(cursor, where='', params=()):
+    cursor.execute(
+        f"INSERT INTO fact_sales_line ({', '.join(FACT_SALES_LINE_COLUMNS)}) "
+        + FACT_SALES_LINE_SELECT.format(where=where), params)
+
+def refresh_fact_sales_line(conn, transaction_ids):
+    """Replace the lines of just the given transactions"""
+    cursor = conn.cursor()
+    transaction_ids = [transaction_id for transaction_id in transaction_ids if transaction_id is not None]
+    for start in range(0, len(transaction_ids), 500):
+        batch = transaction_ids[start:start + 500]
+        placeholders = ', '.join('?' for _ in batch)
+        cursor.execute(f"DELETE FROM fact_sales_line WHERE transaction_id IN ({placeholders})", batch)
+        insert_fact_sales_lines(cursor, f"WHERE t.transaction_id IN ({placeholders})", batch)
+    print(f"✅ Refreshed fact_sales_line: {len(transaction_ids):,} transactions")
+    return len(transaction_ids)
+
+def _changed(changes, table):
+    entry = changes.get(table, {})
+    return list(entry.get('inserted', [])) + list(entry.get('updated', []))
+
+def refresh_star_schema(conn, changes):
+    """Bring the star schema up to date with an incremental load's changed keys
+
+    Changed transactions and the transactions of changed items are re-joined;
+    a change to a store, customer or product can touch any line, so it
+    rebuilds the fact table instead. Databases loaded without the star
+    schema are left without it.
+    """
+    cursor = conn.cursor()
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fact_sales_line'").fetchone() is None:
+        return
+    if any(_changed(changes, table) for table in ('stores', 'customers', 'products')):
+        build_star_schema(conn)
+        return
+
+    transaction_ids = set(_changed(changes, 'transactions'))
+    item_ids = _changed(changes, 'transaction_items')
+    for start in range(0, len(item_ids), 500):
+        batch = item_ids[start:start + 500]
+        placeholders = ', '.join('?' for _ in batch)
+        transaction_ids.update(row[0] for row in cursor.execute(
+            f"SELECT transaction_id FROM transaction_items WHERE id IN ({placeholders})", batch))
+    if changes.get('transaction_items', {}).get('updated'):
+        # An item moved to another transaction leaves its old transaction short a line
+        transaction_ids.update(row[0] for row in cursor.execute(
+            "SELECT DISTINCT transaction_id FROM temp.replaced_transaction_items"))
+    if transaction_ids:
+        build_dim_date(conn)
+        refresh_fact_sales_line(conn, sorted(transaction_ids, key=str))
+
+def build_star_schema(conn):
+    """Build dim_date and fact_sales_line"""
+    build_dim_date(conn)
+    build_fact_sales_line(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the Scout Analytics star schema tables')
+    parser.add_argument('--db_path', required=True, help='SQLite database path')
+
+    args = parser.parse_args()
+
+    db_path = Path(args.db_path)
+    if not db_path.exists():
+        print(f"❌ SQLite database not found: {db_path}")
+        return
+
+    started = datetime.now()
+    conn = sqlite3.connect(str(db_path))
+    try:
+        print("\n⭐ Building star schema...")
+        build_star_schema(conn)
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Star schema built in {(datetime.now() - started).total_seconds():.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Staging Table Swap
+Refresh SQL Server tables by loading a staging schema and transferring it in
+
+A full reload goes into fresh tables in <schema>_staging. Foreign keys are
+not checked and nonclustered indexes are disabled while rows go in. The
+indexes are then rebuilt, rows whose foreign keys match no parent row are
+moved to the reject file, and the constraints re-checked against the rest.
+The finished tables replace the live ones with ALTER SCHEMA TRANSFER,
+which changes metadata only, in a single transaction. Readers keep seeing the
+old rows until that commit, and nothing is logged row by row as DELETE would.
+"""
+
+def staging_schema(schema):
+    return f"{schema}_staging"
+
+def retired_schema(schema):
+    return f"{schema}_retired"
+
+def ensure_schema(cursor, schema):
+    cursor.execute(f"""
+    IF NOT EXISTS (SELECT * FROM sys.schemas WHERE name = '{schema}')
+    BEGIN
+        EXEC('CREATE SCHEMA {schema}')
+    END
+    """)
+
+def drop_tables(cursor, schema, tables):
+    """Drop tables, children first (tables are listed parents first)"""
+    for table in reversed(tables):
+        cursor.execute(f"DROP TABLE IF EXISTS {schema}.{table}")
+
+def nonclustered_indexes(cursor, schema, table):
+    return [row[0] for row in cursor.execute(
+        "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(?) AND type = 2",
+        (f"{schema}.{table}",)).fetchall()]
+
+def prepare_staging(azure_conn, schema, tables, create_tables):
+    """Create empty staging copies of tables with create_tables(cursor, schema); returns the staging schema"""
+    stage = staging_schema(schema)
+    cursor = azure_conn.cursor()
+    drop_tables(cursor, stage, tables)
+    create_tables(cursor, stage)
+    for table in tables:
+        cursor.execute(f"ALTER TABLE {stage}.{table} NOCHECK CONSTRAINT ALL")
+        for index in nonclustered_indexes(cursor, stage, table):
+            cursor.execute(f"ALTER INDEX {index} ON {stage}.{table} DISABLE")
+    azure_conn.commit()
+    print(f"🧱 Loading into staging schema {stage} (constraints and secondary indexes off)")
+    return stage
+
+def staging_exists(azure_conn, stage, tables):
+    """Whether the staging tables are still there, i.e. have not been swapped in yet"""
+    cursor = azure_conn.cursor()
+    return all(cursor.execute("SELECT OBJECT_ID(?, 'U')", (f"{stage}.{table}",)).fetchone()[0] is not None
+               for table in tables)
+
+def foreign_keys(cursor, schema, table):
+    """{constraint: (referenced table, [(column, referenced column), ...])} of schema.table"""
+    keys = {}
+    for name, referenced, column, referenced_column in cursor.execute("""
+    SELECT fk.name, OBJECT_SCHEMA_NAME(fk.referenced_object_id) + '.' + OBJECT_NAME(fk.referenced_object_id),
+           pc.name, rc.name
+    FROM sys.foreign_keys fk
+    JOIN sys.foreign_key_columns fkc ON fkc.constraint_object_id = fk.object_id
+    JOIN sys.columns pc ON pc.object_id = fkc.parent_object_id AND pc.column_id = fkc.parent_column_id
+    JOIN sys.columns rc ON rc.object_id = fkc.referenced_object_id AND rc.column_id = fkc.referenced_column_id
+    WHERE fk.parent_object_id = OBJECT_ID(?)
+    ORDER BY fk.name, fkc.constraint_column_id
+    """, (f"{schema}.{table}",)).fetchall():
+        keys.setdefault(name, (referenced, []))[1].append((column, referenced_column))
+    return keys
+
+def reject_orphans(azure_conn, schema, table, rejects):
+    """Move rows whose foreign keys match no parent row into the reject file; returns how many
+
+    Loads with constraints off let such rows in, and WITH CHECK would refuse the
+    whole table for them. Tables are handled parents first, so children of a
+    rejected parent are rejected in turn.
+    """
+    cursor = azure_conn.cursor()
+    orphans = 0
+    for name, (referenced, pairs) in foreign_keys(cursor, schema, table).items():
+        predicate = " AND ".join(f"c.{column} IS NOT NULL" for column, _ in pairs) + \
+            f" AND NOT EXISTS (SELECT 1 FROM {referenced} p WHERE " + \
+            " AND ".join(f"p.{referenced_column} = c.{column}" for column, referenced_column in pairs) + ")"
+        cursor.execute(f"SELECT c.* FROM {schema}.{table} c WHERE {predicate}")
+        columns = [column[0] for column in cursor.description]
+        error = f"{name}: no {referenced} row for ({', '.join(column for column, _ in pairs)})"
+        found = 0
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for row in rows:
+                rejects.write(table, columns, row, error)
+            found += len(rows)
+        if found:
+            cursor.execute(f"DELETE c FROM {schema}.{table} c WHERE {predicate}")
+            azure_conn.commit()
+            orphans += found
+    return orphans
+
+def finalize_staging(azure_conn, stage, tables, rejects):
+    """Rebuild the disabled indexes, reject orphan rows and re-check every foreign key against the rest"""
+    cursor = azure_conn.cursor()
+    for table in tables:
+        cursor.execute(f"ALTER INDEX ALL ON {stage}.{table} REBUILD")
+        orphans = reject_orphans(azure_conn, stage, table, rejects)
+        if orphans:
+            print(f"  ⚠️  {stage}.{table}: {orphans:,} rows reference missing parents; written to {rejects.path}")
+        cursor.execute(f"ALTER TABLE {stage}.{table} WITH CHECK CHECK CONSTRAINT ALL")
+        azure_conn.commit()
+        print(f"  ✅ Rebuilt indexes and checked constraints of {stage}.{table}")
+
+def swap_tables(azure_conn, stage, schema, tables):
+    """Move the staging tables into schema in one transaction, then drop the tables they replaced"""
+    retired = retired_schema(schema)
+    cursor = azure_conn.cursor()
+    ensure_schema(cursor, retired)
+    drop_tables(cursor, retired, tables)
+    azure_conn.commit()
+
+    for table in tables:
+        cursor.execute(f"""
+        IF OBJECT_ID('{schema}.{table}', 'U') IS NOT NULL
+            ALTER SCHEMA {retired} TRANSFER {schema}.{table}
+        """)
+        cursor.execute(f"ALTER SCHEMA {schema} TRANSFER {stage}.{table}")
+    azure_conn.commit()
+    print(f"🔀 Swapped {len(tables)} staged tables into {schema}")
+
+    drop_tables(cursor, retired, tables)
+    azure_conn.commit()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Scout Analytics - Migration Verification
+Order-independent checksums of SQLite tables against their SQL Server copies
+
+Every row is reduced to a canonical text form that both sides produce
+identically (the target column types decide how numbers and timestamps are
+written), hashed with MD5, and assigned to a bucket by the hash of its primary
+key. Per bucket, the row count and two 32-bit slices of the row hashes are
+summed, so the result does not depend on row order. The target computes its
+sums server-side with HASHBYTES; the source is hashed in a process pool over
+rowid ranges while the target queries run. Only buckets whose sums disagree
+are fetched again, row by row, to name the missing, extra and changed rows,
+and only as many of them as hold --max-drilldown rows between both sides; the
+rest are counted as one differing row each. Rows the migration rejected
+(listed in its reject file) are left out of the source side and reported
+apart from the differences.
+
+Buckets stand in for primary-key ranges because SQLite and SQL Server sort
+text keys differently under default collations, while key hashes agree.
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import sqlite3
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+import pyodbc
+
+from bulk_migrate import DEFAULT_RANGE_ROWS, DEFAULT_WORKERS, RejectLog, rowid_ranges
+from compact_storage import migrated_columns, primary_key, range_column
+
+DEFAULT_BUCKETS = 1024
+DEFAULT_MAX_DRILLDOWN = 100000
+REPORT_ROWS = 10
+
+FIELD_SEPARATOR = '\x1f'
+NULL_MARKER = '\x00'
+
+INTEGER_TYPES = ('bigint', 'int', 'smallint', 'tinyint')
+EXACT_TYPES = INTEGER_TYPES + ('bit', 'decimal', 'numeric', 'uniqueidentifier')
+FLOAT_TYPES = ('float', 'real')
+DATETIME_TYPES = ('date', 'datetime', 'datetime2', 'smalldatetime')
+
+def sql_text(column, data_type):
+    """T-SQL for the canonical text of a column"""
+    if data_type in EXACT_TYPES:
+        text = f"CONVERT(NVARCHAR(50), {column})"
+    elif data_type in FLOAT_TYPES:
+        text = f"CONVERT(NVARCHAR(30), CAST({column} AS FLOAT), 3)"
+    elif data_type in DATETIME_TYPES:
+        text = f"CONVERT(NVARCHAR(30), CAST({column} AS DATETIME2(3)), 121)"
+    else:
+        text = f"CAST({column} AS NVARCHAR(MAX))"
+    return f"ISNULL({text}, NCHAR(0))"
+
+def float_text(value):
+    """Python twin of CONVERT(..., style 3): 17 significant digits, three-digit exponent"""
+    mantissa, exponent = f"{value:.16e}".split('e')
+    return f"{mantissa}e{exponent[0]}{int(exponent[1:]):03d}"
+
+def datetime_text(value, data_type):
+    """The value as SQL Server stores data_type, written like CONVERT(..., 121) of DATETIME2(3)"""
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    moment = moment.replace(tzinfo=None)
+    base = moment.replace(microsecond=0)
+    if data_type == 'date':
+        base, milliseconds = base.replace(hour=0, minute=0, second=0), 0
+    elif data_type == 'smalldatetime':
+        base = base.replace(second=0) + timedelta(minutes=1 if moment.second >= 30 else 0)
+        milliseconds = 0
+    elif data_type == 'datetime':
+        # DATETIME keeps 1/300 s ticks, which DATETIME2(3) shows as .000, .003, .007
+        ticks = int(Decimal(moment.microsecond * 3) / 10000 + Decimal('0.5'))
+        milliseconds = int(Decimal(ticks * 10) / 3 + Decimal('0.5'))
+    else:
+        milliseconds = int(Decimal(moment.microsecond) / 1000 + Decimal('0.5'))
+    if milliseconds == 1000:
+        base, milliseconds = base + timedelta(seconds=1), 0
+    return f"{base:%Y-%m-%d %H:%M:%S}.{milliseconds:03d}"
+
+def canonical_text(value, column_type):
+    """Python twin of sql_text for a source value bound for a column of column_type (data_type, scale)"""
+    data_type, scale = column_type
+    if value is None:
+        return NULL_MARKER
+    if data_type in INTEGER_TYPES:
+        return str(int(value))
+    if data_type == 'bit':
+        return '1' if value else '0'
+    if data_type in ('decimal', 'numeric'):
+        return f"{Decimal(str(value)).quantize(Decimal(1).scaleb(-scale), ROUND_HALF_UP):f}"
+    if data_type == 'uniqueidentifier':
+        return str(value).upper()
+    if data_type in FLOAT_TYPES:
+        value = float(value)
+        if data_type == 'real':
+            value = struct.unpack('f', struct.pack('f', value))[0]
+        return float_text(value)
+    if data_type in DATETIME_TYPES:
+        return datetime_text(value, data_type)
+    return str(value)
+
+def digest(text):
+    """MD5 of the UTF-16 text, as HASHBYTES('MD5', <NVARCHAR>) computes it"""
+    return hashlib.md5(text.encode('utf-16-le')).digest()
+
+def bucket_of(key_digest, buckets):
+    return int.from_bytes(key_digest[:4], 'big') % buckets
+
+def row_sums(row_digest):
+    """The two signed 32-bit slices summed per bucket"""
+    return (int.from_bytes(row_digest[8:12], 'big', signed=True),
+            int.from_bytes(row_digest[12:16], 'big', signed=True))
+
+def hash_source_range(sqlite_path, table, key, columns, types, buckets, low, high, wanted=None, skip=frozenset()):
+    """Hash one rowid range of a source table, leaving out rows whose key text is in skip
+
+    Returns {bucket: [rows, sum1, sum2]}, or with wanted (a set of buckets)
+    {bucket: [(key text, row digest, row)]} for the rows in those buckets.
+    """
+    conn = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    column = range_column(conn, table)
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {column} BETWEEN ? AND ?", (low, high))
+    key_index = columns.index(key) if key else None
+    totals = {}
+    rows = {}
+    for row in cursor:
+        texts = [canonical_text(value, types[column]) for column, value in zip(columns, row)]
+        row_digest = digest(FIELD_SEPARATOR.join(texts))
+        key_text = texts[key_index] if key else row_digest.hex()
+        if key_text in skip:
+            continue
+        bucket = bucket_of(digest(texts[key_index]) if key else row_digest, buckets)
+        if wanted is not None:
+            if bucket in wanted:
+                rows.setdefault(bucket, []).append((key_text, row_digest, row))
+            continue
+        first, second = row_sums(row_digest)
+        entry = totals.setdefault(bucket, [0, 0, 0])
+        entry[0] += 1
+        entry[1] += first
+        entry[2] += second
+    conn.close()
+    return rows if wanted is not None else totals
+
+def rejected_keys(rows, key, columns, types):
+    """Key texts of rejected rows as hash_source_range computes them (row digests for keyless tables)"""
+    keys = set()
+    for row in rows:
+        if key:
+            keys.add(canonical_text(row.get(key), types[key]))
+        else:
+            texts = [canonical_text(row.get(column), types[column]) for column in columns]
+            keys.add(digest(FIELD_SEPARATOR.join(texts)).hex())
+    return frozenset(keys)
+
+def hashed_target_sql(target, key, columns, types, buckets):
+    """Subquery giving every target row's bucket, row digest and key text"""
+    texts = [sql_text(column, types[column]) for column in columns]
+    row_text = f"CONCAT_WS(NCHAR(31), {', '.join(texts)})" if len(texts) > 1 else texts[0]
+    key_text = sql_text(key, types[key]) if key else row_text
+    return f"""
+    SELECT CAST(SUBSTRING(HASHBYTES('MD5', {key_text}), 1, 4) AS BIGINT) % {buckets} AS bucket,
+           HASHBYTES('MD5', {row_text}) AS row_hash, {key_text} AS key_text, {', '.join(columns)}
+    FROM {target}
+    """
+
+def hash_target(azure_conn_str, target, key, columns, types, buckets):
+    """{bucket: [rows, sum1, sum2]} computed by the target server"""
+    conn = pyodbc.connect(azure_conn_str)
+    try:
+        rows = conn.cursor().execute(f"""
+        SELECT bucket, COUNT_BIG(*),
+               SUM(CAST(CAST(SUBSTRING(row_hash, 9, 4) AS INT) AS BIGINT)),
+               SUM(CAST(CAST(SUBSTRING(row_hash, 13, 4) AS INT) AS BIGINT))
+        FROM ({hashed_target_sql(target, key, columns, types, buckets)}) AS hashed
+        GROUP BY bucket
+        """).fetchall()
+    finally:
+        conn.close()
+    return {row[0]: [row[1], row[2], row[3]] for row in rows}
+
+def target_rows(azure_conn_str, target, key, columns, types, buckets, wanted):
+    """{bucket: [(key text, row digest, row)]} for the target rows in the wanted buckets"""
+    conn = pyodbc.connect(azure_conn_str)
+    rows = {}
+    try:
+        for row in conn.cursor().execute(f"""
+        SELECT * FROM ({hashed_target_sql(target, key, columns, types, buckets)}) AS hashed
+        WHERE bucket IN ({', '.join(str(bucket) for bucket in sorted(wanted))})
+        """):
+            rows.setdefault(row[0], []).append(
+                (row[2] if key else bytes(row[1]).hex(), bytes(row[1]), tuple(row[3:])))
+    finally:
+        conn.close()
+    return rows
+
+def target_types(azure_conn, target):
+    """{column: (data_type, scale)} of a schema.table on the target"""
+    schema, table = target.split('.')
+    rows = azure_conn.cursor().execute(
+        "SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_SCALE FROM INFORMATION_SCHEMA.COLUMNS "
+        "WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?", (schema, table)).fetchall()
+    return {row[0]: (row[1].lower(), row[2] or 0) for row in rows}
+
+def merge_totals(into, totals):
+    for bucket, (count, first, second) in totals.items():
+        entry = into.setdefault(bucket, [0, 0, 0])
+        entry[0] += count
+        entry[1] += first
+        entry[2] += second
+
+def diff_rows(source, target):
+    """Missing, extra and changed rows between two [(key text, digest, row)] lists"""
+    source_by_key = {key_text: (row_digest, row) for key_text, row_digest, row in source}
+    target_by_key = {key_text: (row_digest, row) for key_text, row_digest, row in target}
+    missing = [(key_text, source_by_key[key_text][1], None) for key_text in source_by_key.keys() - target_by_key.keys()]
+    extra = [(key_text, None, target_by_key[key_text][1]) for key_text in target_by_key.keys() - source_by_key.keys()]
+    changed = [(key_text, source_by_key[key_text][1], target_by_key[key_text][1])
+               for key_text in source_by_key.keys() & target_by_key.keys()
+               if source_by_key[key_text][0] != target_by_key[key_text][0]]
+    return missing, extra, changed
+
+def multiset_diff(source, target):
+    """Missing and extra rows when rows are keyed by their own digest, so duplicates count"""
+    remaining = {}
+    for key_text, _, row in target:
+        remaining.setdefault(key_text, []).append(row)
+    missing = []
+    for key_text, _, row in source:
+        if remaining.get(key_text):
+            remaining[key_text].pop()
+        else:
+            missing.append((key_text, row, None))
+    extra = [(key_text, None, row) for key_text, rows in remaining.items() for row in rows]
+    return missing, extra
+
+def drilldown_buckets(source_totals, target_totals, wanted, max_rows):
+    """The differing buckets to fetch row by row, in bucket order, while their rows on both sides fit in max_rows"""
+    chosen = set()
+    rows = 0
+    for bucket in sorted(wanted):
+        rows += source_totals.get(bucket, [0])[0] + target_totals.get(bucket, [0])[0]
+        if rows > max_rows:
+            break
+        chosen.add(bucket)
+    return chosen
+
+def compare_buckets(source, target, key, limit=REPORT_ROWS):
+    """Diff two {bucket: rows} maps one bucket at a time
+
+    Returns the (missing, extra, changed) counts and up to limit example rows of each kind.
+    """
+    counts = [0, 0, 0]
+    examples = ([], [], [])
+    for bucket in sorted(source.keys() | target.keys()):
+        if key:
+            found = diff_rows(source.pop(bucket, []), target.pop(bucket, []))
+        else:
+            # Without a shared key rows are matched by content, so a changed row shows as missing plus extra
+            found = multiset_diff(source.pop(bucket, []), target.pop(bucket, [])) + ([],)
+        for index, rows in enumerate(found):
+            counts[index] += len(rows)
+            examples[index].extend(rows[:max(limit - len(examples[index]), 0)])
+    return counts, examples
+
+def report(target, columns, counts, missing, extra, changed, limit=REPORT_ROWS):
+    print(f"  ❌ {target}: {counts[0]:,} missing, {counts[1]:,} extra, {counts[2]:,} changed rows")
+    shown = 0
+    for label, rows in (('missing', missing), ('extra', extra), ('changed', changed)):
+        for key_text, source_row, target_row in sorted(rows, key=lambda row: row[0])[:max(limit - shown, 0)]:
+            print(f"     {label} {key_text}")
+            if source_row is not None:
+                print(f"       source: {dict(zip(columns, source_row))}")
+            if target_row is not None:
+                print(f"       target: {dict(zip(columns, target_row))}")
+            shown += 1
+
+def verify_tables(sqlite_path, azure_conn_str, tables, schema, workers=DEFAULT_WORKERS, buckets=DEFAULT_BUCKETS,
+                  range_rows=DEFAULT_RANGE_ROWS, columns_for=None, max_drilldown=DEFAULT_MAX_DRILLDOWN,
+                  rejected=None):
+    """Compare tables with schema.<table> by bucket checksums; returns the number of differing rows
+
+    columns_for(table) gives the source columns the migration copied, when not all of them.
+    rejected maps a table to the rows the migration rejected (RejectLog.rows()); they are not
+    expected on the target and are counted apart from the differences.
+    Differing buckets beyond max_drilldown rows count as one row each, so the result is then a lower bound.
+    """
+    print(f"🔐 Checksum verification of {schema}: {buckets:,} buckets, {workers} workers")
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    azure_conn = pyodbc.connect(azure_conn_str)
+    plans = {}
+    for table in tables:
+        target = f"{schema}.{table}"
+        types = target_types(azure_conn, target)
+        source_columns = migrated_columns(sqlite_conn, table)
+        if columns_for is not None:
+            source_columns = columns_for(table)
+        # Columns the migration copies; target-only columns such as IDENTITY keys are not compared
+        columns = [column for column in source_columns if column in types]
+        key = primary_key(sqlite_conn, table)
+        key = key if key in columns else None
+        skip = rejected_keys((rejected or {}).get(table, []), key, columns, types)
+        plans[table] = (target, key, columns, types, rowid_ranges(sqlite_conn, table, range_rows), skip)
+    sqlite_conn.close()
+    azure_conn.close()
+
+    # Workers are spawned, not forked: a fork would copy SQLite and ODBC locks held by the target threads
+    spawn = multiprocessing.get_context('spawn')
+    with ThreadPoolExecutor(max_workers=workers) as threads, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=spawn) as processes:
+        target_futures = {table: threads.submit(hash_target, azure_conn_str, target, key, columns, types, buckets)
+                          for table, (target, key, columns, types, _, _) in plans.items()}
+        source_futures = {table: [processes.submit(hash_source_range, str(sqlite_path), table, key, columns, types,
+                                                   buckets, low, high, None, skip) for low, high in ranges]
+                          for table, (target, key, columns, types, ranges, skip) in plans.items()}
+
+        mismatched = {}
+        for table, (target, key, columns, types, ranges, skip) in plans.items():
+            if skip:
+                print(f"  ⏭️  {target}: {len(skip):,} rejected rows left out of the comparison")
+            source_totals = {}
+            for future in source_futures[table]:
+                merge_totals(source_totals, future.result())
+            target_totals = target_futures[table].result()
+            wanted = {bucket for bucket in source_totals.keys() | target_totals.keys()
+                      if source_totals.get(bucket) != target_totals.get(bucket)}
+            rows = sum(entry[0] for entry in source_totals.values())
+            if wanted:
+                mismatched[table] = (wanted, source_totals, target_totals)
+                print(f"  ⚠️  {target}: {len(wanted):,} of {buckets:,} buckets differ; drilling down")
+            else:
+                print(f"  ✅ {target}: {rows:,} rows match")
+
+        # Only the rows of mismatching buckets are fetched from either side, up to max_drilldown rows
+        differences = 0
+        undrilled = 0
+        for table, (wanted, source_totals, target_totals) in mismatched.items():
+            target, key, columns, types, ranges, skip = plans[table]
+            drilled = drilldown_buckets(source_totals, target_totals, wanted, max_drilldown)
+            if drilled:
+                target_future = threads.submit(target_rows, azure_conn_str, target, key, columns, types, buckets,
+                                               drilled)
+                source = {}
+                for future in [processes.submit(hash_source_range, str(sqlite_path), table, key, columns, types,
+                                                buckets, low, high, drilled, skip) for low, high in ranges]:
+                    for bucket, rows in future.result().items():
+                        source.setdefault(bucket, []).extend(rows)
+                counts, examples = compare_buckets(source, target_future.result(), key)
+                report(target, columns, counts, *examples)
+                differences += sum(counts)
+            if len(wanted) > len(drilled):
+                skipped = len(wanted) - len(drilled)
+                print(f"  ⚠️  {target}: {skipped:,} more differing buckets not drilled down (over --max-drilldown "
+                      f"{max_drilldown:,} rows); when most buckets differ, suspect a type or rounding mismatch")
+                undrilled += skipped
+
+    differences += undrilled
+    left_out = sum(len(skip) for *_, skip in plans.values())
+    rejected_note = f" ({left_out:,} rejected rows not compared)" if left_out else ""
+    if undrilled:
+        print(f"❌ Checksum verification found at least {differences:,} differing rows{rejected_note}")
+    elif differences:
+        print(f"❌ Checksum verification found {differences:,} differing rows{rejected_note}")
+    else:
+        print(f"✅ Checksum verification passed{rejected_note}")
+    return differences
+
+def add_verify_arguments(parser):
+    """Command-line options shared by the migration scripts"""
+    parser.add_argument('--verify', choices=['checksum', 'count'], default='checksum',
+                        help='checksum: compare per-bucket row hashes and report differing rows; count: row counts only')
+    parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS, help='Checksum buckets per table')
+    parser.add_argument('--max-drilldown', dest='max_drilldown', type=int, default=DEFAULT_MAX_DRILLDOWN,
+                        help='Rows per table fetched to list differences; further differing buckets are only counted')
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify an Azure SQL copy of the SQLite database by checksums')
+    parser.add_argument('--server', required=True, help='Azure SQL server name')
+    parser.add_argument('--database', required=True, help='Database name')
+    parser.add_argument('--username', required=True, help='Username')
+    parser.add_argument('--password', required=True, help='Password')
+    parser.add_argument('--sqlite-path', default='scout_analytics.db', help='Path to SQLite database')
+    parser.add_argument('--schema', default='dbo', help='Target schema to verify (dbo, mvp, scout_blue, ...)')
+    parser.add_argument('--tables', nargs='+', default=['stores', 'brands', 'products', 'customers', 'transactions',
+                                                        'transaction_items', 'substitutions'])
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Hashing processes and target queries')
+    parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS, help='Checksum buckets per table')
+    parser.add_argument('--max-drilldown', dest='max_drilldown', type=int, default=DEFAULT_MAX_DRILLDOWN,
+                        help='Rows per table fetched to list differences; further differing buckets are only counted')
+    parser.add_argument('--reject-file', help='Reject file of the migration being checked; its rows are not expected '
+                                              'on the target')
+    args = parser.parse_args()
+
+    conn_str = (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={args.server};"
+        f"DATABASE={args.database};"
+        f"UID={args.username};"
+        f"PWD={args.password};"
+        f"Encrypt=yes;"
+        f"TrustServerCertificate=no;"
+        f"Connection Timeout=30;"
+    )
+    if not Path(args.sqlite_path).exists():
+        print(f"❌ SQLite database not found: {args.sqlite_path}")
+        sys.exit(1)
+    rejected = RejectLog(args.reject_file).rows() if args.reject_file else None
+    differences = verify_tables(args.sqlite_path, conn_str, args.tables, args.schema, args.workers, args.buckets,
+                                max_drilldown=args.max_drilldown, rejected=rejected)
+    sys.exit(1 if differences else 0)
+
+if __name__ == "__main__":
+    main()